@@ -0,0 +1,141 @@
+"""Geração de embeddings em lotes concorrentes dentro do limite de taxa
+
+Em vez de mandar um lote de cada vez (uma ida e volta de rede por lote),
+vários lotes são enviados em paralelo, cada um consumindo um token do
+limitador. Erros 429 são repetidos com backoff. Cada lote concluído é
+salvo em disco (no cache de embeddings ou, sem ele, em um checkpoint), de
+modo que um build interrompido continua de onde parou.
+"""
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from cache_embeddings import CacheEmbeddings
+from limites import LimitadorTaxa, executar_com_retentativa
+
+DIRETORIO_CHECKPOINTS = Path(
+    os.getenv("EMBEDDINGS_CHECKPOINT_DIR", str(Path(__file__).parent / ".cache" / "embeddings_parciais"))
+)
+
+
+class AgendadorEmbeddings:
+    """Gera embeddings de muitos textos respeitando a cota do backend
+
+    Args:
+        embeddings: Objeto com `embed_documents` (interface do LangChain)
+        modelo: Nome do modelo, usado para separar os checkpoints
+        tamanho_lote: Textos por requisição
+        concorrencia: Lotes em voo ao mesmo tempo
+        req_por_minuto: Limite de requisições por minuto (0 = sem limite)
+        max_tentativas: Tentativas por lote em erros transitórios
+        checkpoint: Salvar lotes concluídos para retomar builds interrompidos
+        cache: Cache de embeddings consultado antes de chamar o backend; só
+            textos nunca vistos viram requisições (dispensa o checkpoint)
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        modelo: str,
+        tamanho_lote: int = 100,
+        concorrencia: int = 1,
+        req_por_minuto: float = 0,
+        max_tentativas: int = 6,
+        checkpoint: bool = True,
+        cache: Optional[CacheEmbeddings] = None,
+    ):
+        self.embeddings = embeddings
+        self.modelo = modelo
+        self.tamanho_lote = tamanho_lote
+        self.concorrencia = max(1, concorrencia)
+        self.limitador = LimitadorTaxa(req_por_minuto, rajada=self.concorrencia)
+        self.max_tentativas = max_tentativas
+        self.cache = cache
+        chave_modelo = hashlib.sha256(modelo.encode()).hexdigest()[:16]
+        usar_checkpoint = checkpoint and cache is None
+        self.diretorio_checkpoint = DIRETORIO_CHECKPOINTS / chave_modelo if usar_checkpoint else None
+
+    def _caminho_checkpoint(self, lote: List[str]) -> Optional[Path]:
+        if self.diretorio_checkpoint is None:
+            return None
+        h = hashlib.sha256()
+        for texto in lote:
+            h.update(hashlib.sha256(texto.encode("utf-8")).digest())
+        return self.diretorio_checkpoint / f"{h.hexdigest()}.npy"
+
+    def _embutir_lote(self, lote: List[str]) -> np.ndarray:
+        caminho = self._caminho_checkpoint(lote)
+        if caminho is not None and caminho.exists():
+            try:
+                return np.load(caminho)
+            except (OSError, ValueError):
+                pass  # checkpoint corrompido: gerar de novo
+
+        vetores = executar_com_retentativa(
+            lambda: self.embeddings.embed_documents(lote),
+            max_tentativas=self.max_tentativas,
+            limitador=self.limitador,
+        )
+        vetores = np.asarray(vetores, dtype=np.float32)
+
+        if caminho is not None:
+            caminho.parent.mkdir(parents=True, exist_ok=True)
+            temporario = caminho.with_suffix(".tmp.npy")
+            np.save(temporario, vetores)
+            os.replace(temporario, caminho)
+        return vetores
+
+    def embutir(
+        self,
+        textos: List[str],
+        progresso: Optional[Callable[[float, str], None]] = None,
+    ) -> np.ndarray:
+        """Gera os embeddings de `textos`, na mesma ordem
+
+        Textos já presentes no cache não geram requisição, e textos
+        repetidos dentro da mesma chamada são enviados uma única vez. O
+        callback de progresso é chamado sempre na thread de quem chamou
+        (o Streamlit não aceita atualizações vindas de outras threads).
+        """
+        total = len(textos)
+        if total == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        vetores: List[Optional[np.ndarray]] = (
+            self.cache.buscar(textos) if self.cache is not None else [None] * total
+        )
+        posicoes_por_texto: Dict[str, List[int]] = {}
+        for i, (texto, vetor) in enumerate(zip(textos, vetores)):
+            if vetor is None:
+                posicoes_por_texto.setdefault(texto, []).append(i)
+        pendentes = list(posicoes_por_texto)
+
+        lotes = [pendentes[i:i + self.tamanho_lote] for i in range(0, len(pendentes), self.tamanho_lote)]
+        concluidos = total - sum(len(p) for p in posicoes_por_texto.values())
+        if progresso and concluidos:
+            progresso(concluidos / total, f"Embeddings: {concluidos} de {total} chunks (cache)...")
+
+        with ThreadPoolExecutor(max_workers=self.concorrencia) as executor:
+            futuros = {executor.submit(self._embutir_lote, lote): lote for lote in lotes}
+            for futuro in as_completed(futuros):
+                lote = futuros[futuro]
+                resultado = futuro.result()
+                if self.cache is not None:
+                    self.cache.adicionar(lote, resultado)
+                for texto, vetor in zip(lote, resultado):
+                    for posicao in posicoes_por_texto[texto]:
+                        vetores[posicao] = vetor
+                        concluidos += 1
+                if progresso:
+                    progresso(concluidos / total, f"Embeddings: {concluidos} de {total} chunks...")
+        return np.vstack(vetores)
+
+    def limpar_checkpoint(self) -> None:
+        """Remove os lotes salvos (chamar depois que o índice foi gravado)"""
+        if self.diretorio_checkpoint is not None and self.diretorio_checkpoint.exists():
+            shutil.rmtree(self.diretorio_checkpoint, ignore_errors=True)
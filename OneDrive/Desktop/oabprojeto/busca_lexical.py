@@ -0,0 +1,293 @@
+"""Índice lexical: dispositivos legais exatos e BM25
+
+Perguntas como "Art. 45" ou "artigo 12, §2º" costumam escapar da busca
+por similaridade. Na indexação, cada chunk é associado aos dispositivos
+que contém (artigo, parágrafo, inciso) em um dicionário, e os termos do
+texto vão para um índice invertido BM25. Na consulta:
+
+- referências explícitas a dispositivos são resolvidas direto no
+  dicionário, e só os chunks daquele dispositivo vão para o prompt;
+- o resto combina as pontuações BM25 e vetorial (normalizadas) em um
+  ranking híbrido.
+"""
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+ARQUIVO_LEXICAL = "lexical.json"
+
+# Peso da pontuação vetorial na fusão (o restante vai para o BM25)
+BUSCA_PESO_VETORIAL = float(os.getenv("BUSCA_PESO_VETORIAL", "0.6"))
+# Candidatos buscados em cada ranking antes da fusão, por resultado final
+BUSCA_FATOR_CANDIDATOS = int(os.getenv("BUSCA_FATOR_CANDIDATOS", "4"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "da", "das", "de", "do", "dos", "e", "em", "na", "nas",
+    "no", "nos", "o", "os", "ou", "para", "pela", "pelas", "pelo", "pelos", "por", "que",
+    "se", "sobre", "um", "uma", "qual", "quais", "diz", "como", "onde",
+}
+
+# Cabeçalhos no início da linha (referências no meio do texto não mudam o dispositivo atual)
+RE_ARTIGO = re.compile(r"^\s*Art\.?\s*(\d+)", re.MULTILINE)
+RE_PARAGRAFO = re.compile(r"^\s*(?:§\s*(\d+)|Par[áa]grafo\s+[úu]nico)", re.MULTILINE | re.IGNORECASE)
+RE_INCISO = re.compile(r"^\s*([IVXLC]+)\s*[.\-–]\s", re.MULTILINE)
+
+# Referências na pergunta do usuário
+RE_REF_ARTIGO = re.compile(r"\bart(?:igo)?s?\.?\s*(\d+)", re.IGNORECASE)
+RE_REF_PARAGRAFO = re.compile(r"(?:§\s*|par[áa]grafo\s+)(\d+|[úu]nico)", re.IGNORECASE)
+RE_REF_INCISO = re.compile(r"\binciso\s+([IVXLC]+)\b", re.IGNORECASE)
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos"""
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def tokenizar(texto: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", normalizar(texto)) if t not in STOPWORDS and len(t) > 1]
+
+
+def chave_dispositivo(artigo: str, paragrafo: Optional[str] = None, inciso: Optional[str] = None) -> str:
+    """Chave canônica: art:12, art:12:par:2, art:12:par:unico, art:12:inc:III"""
+    chave = f"art:{int(artigo)}"
+    if paragrafo:
+        chave += f":par:{normalizar(paragrafo) if not paragrafo.isdigit() else int(paragrafo)}"
+    if inciso:
+        chave += f":inc:{inciso.upper()}"
+    return chave
+
+
+def extrair_referencias(pergunta: str) -> List[str]:
+    """Dispositivos citados na pergunta, do mais específico ao mais geral"""
+    artigo = RE_REF_ARTIGO.search(pergunta)
+    if not artigo:
+        return []
+    numero = artigo.group(1)
+    paragrafo = RE_REF_PARAGRAFO.search(pergunta)
+    inciso = RE_REF_INCISO.search(pergunta)
+    chaves = []
+    if paragrafo:
+        chaves.append(chave_dispositivo(numero, paragrafo=paragrafo.group(1)))
+    if inciso:
+        chaves.append(chave_dispositivo(numero, inciso=inciso.group(1)))
+    chaves.append(chave_dispositivo(numero))
+    return chaves
+
+
+def _eventos_dispositivos(texto: str) -> List[Tuple[int, str, str]]:
+    """Cabeçalhos de artigo/parágrafo/inciso em ordem de posição"""
+    eventos = [(m.start(), "art", m.group(1)) for m in RE_ARTIGO.finditer(texto)]
+    eventos += [(m.start(), "par", m.group(1) or "unico") for m in RE_PARAGRAFO.finditer(texto)]
+    eventos += [(m.start(), "inc", m.group(1)) for m in RE_INCISO.finditer(texto)]
+    return sorted(eventos)
+
+
+class IndiceLexical:
+    """Dicionário de dispositivos + índice invertido BM25 sobre os chunks
+
+    As posições dos chunks são as mesmas do índice FAISS
+    (`index_to_docstore_id`).
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.dispositivos: Dict[str, List[int]] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.tamanhos: List[int] = []
+
+    @classmethod
+    def construir(cls, ids: Sequence[str], docs: Sequence[Document]) -> "IndiceLexical":
+        """Constrói o índice a partir dos chunks, na ordem do documento
+
+        O dispositivo em vigor passa de um chunk para o seguinte do mesmo
+        arquivo, já que um chunk pode começar no meio de um artigo.
+        """
+        indice = cls()
+        indice.ids = list(ids)
+        dispositivos = defaultdict(list)
+        postings = defaultdict(dict)
+
+        fonte_atual = None
+        artigo = paragrafo = inciso = None
+        for posicao, doc in enumerate(docs):
+            fonte = doc.metadata.get("source")
+            if fonte != fonte_atual:
+                fonte_atual = fonte
+                artigo = paragrafo = inciso = None
+            if doc.metadata.get("artigo"):
+                # Chunker legal: o dispositivo já vem nos metadados
+                artigo, paragrafo, inciso = doc.metadata["artigo"], doc.metadata.get("paragrafo"), None
+
+            chaves = set()
+            if artigo:
+                chaves.add(chave_dispositivo(artigo, paragrafo=paragrafo))
+                chaves.add(chave_dispositivo(artigo, inciso=inciso))
+            for _, tipo, valor in _eventos_dispositivos(doc.page_content):
+                if tipo == "art":
+                    artigo, paragrafo, inciso = valor, None, None
+                elif tipo == "par" and artigo:
+                    paragrafo, inciso = valor, None
+                elif tipo == "inc" and artigo:
+                    inciso = valor
+                if artigo:
+                    chaves.add(chave_dispositivo(artigo, paragrafo=paragrafo))
+                    chaves.add(chave_dispositivo(artigo, inciso=inciso))
+            for chave in chaves:
+                dispositivos[chave].append(posicao)
+                # O artigo inteiro também aponta para os chunks de seus parágrafos/incisos
+                dispositivos[":".join(chave.split(":")[:2])].append(posicao)
+
+            tokens = tokenizar(doc.page_content)
+            indice.tamanhos.append(len(tokens))
+            for termo, frequencia in Counter(tokens).items():
+                postings[termo][posicao] = frequencia
+
+        indice.dispositivos = {c: sorted(set(p)) for c, p in dispositivos.items()}
+        indice.postings = dict(postings)
+        return indice
+
+    # ------------------------------------------------------------ persistência
+
+    def salvar(self, caminho: Path, fingerprint: str) -> None:
+        temporario = caminho.with_suffix(".tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": fingerprint,
+                "ids": self.ids,
+                "dispositivos": self.dispositivos,
+                "postings": self.postings,
+                "tamanhos": self.tamanhos,
+            }, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: Path, fingerprint: str) -> Optional["IndiceLexical"]:
+        """Carrega o índice salvo se ele corresponder ao fingerprint"""
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if dados.get("fingerprint") != fingerprint:
+            return None
+        indice = cls()
+        indice.ids = dados["ids"]
+        indice.dispositivos = dados["dispositivos"]
+        # JSON converte as chaves int em str
+        indice.postings = {t: {int(p): f for p, f in ps.items()} for t, ps in dados["postings"].items()}
+        indice.tamanhos = dados["tamanhos"]
+        return indice
+
+    # ------------------------------------------------------------------ busca
+
+    def buscar_dispositivos(self, chaves: Sequence[str]) -> List[int]:
+        """Posições dos chunks do dispositivo mais específico encontrado"""
+        for chave in chaves:
+            if chave in self.dispositivos:
+                return self.dispositivos[chave]
+        return []
+
+    def bm25(self, consulta: str, limite: int) -> List[Tuple[int, float]]:
+        """As `limite` melhores posições por BM25, com a pontuação"""
+        n = len(self.tamanhos)
+        if n == 0:
+            return []
+        media = sum(self.tamanhos) / n or 1.0
+        pontuacoes: Dict[int, float] = defaultdict(float)
+        for termo in set(tokenizar(consulta)):
+            postings = self.postings.get(termo)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for posicao, frequencia in postings.items():
+                norma = BM25_K1 * (1 - BM25_B + BM25_B * self.tamanhos[posicao] / media)
+                pontuacoes[posicao] += idf * frequencia * (BM25_K1 + 1) / (frequencia + norma)
+        return sorted(pontuacoes.items(), key=lambda item: -item[1])[:limite]
+
+
+def carregar_ou_construir(diretorio: Path, vectorstore, fingerprint: str) -> IndiceLexical:
+    """Índice lexical do vectorstore, reconstruído só quando o fingerprint muda"""
+    caminho = diretorio / ARQUIVO_LEXICAL
+    indice = IndiceLexical.carregar(caminho, fingerprint)
+    if indice is not None:
+        return indice
+
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+    indice = IndiceLexical.construir(ids, [vectorstore.docstore.search(i) for i in ids])
+    try:
+        indice.salvar(caminho, fingerprint)
+    except OSError:
+        pass
+    return indice
+
+
+def _normalizar_pontuacoes(pontuacoes: Dict[int, float]) -> Dict[int, float]:
+    if not pontuacoes:
+        return {}
+    minimo, maximo = min(pontuacoes.values()), max(pontuacoes.values())
+    if maximo == minimo:
+        return {p: 1.0 for p in pontuacoes}
+    return {p: (v - minimo) / (maximo - minimo) for p, v in pontuacoes.items()}
+
+
+class RecuperadorHibrido:
+    """Recuperador com busca exata de dispositivos e ranking híbrido
+
+    Mantém a interface usada pelo app (`invoke`, `vectorstore`,
+    `search_kwargs`) e acrescenta `buscar`, que aceita o vetor da pergunta
+    já calculado.
+    """
+
+    def __init__(self, vectorstore, indice: IndiceLexical, k: int = 5, peso_vetorial: float = BUSCA_PESO_VETORIAL):
+        self.vectorstore = vectorstore
+        self.indice = indice
+        self.search_kwargs = {"k": k}
+        self.peso_vetorial = peso_vetorial
+
+    def _documento(self, posicao: int) -> Document:
+        return self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[posicao])
+
+    def buscar(self, pergunta: str, vetor: Optional[Sequence[float]] = None, k: Optional[int] = None) -> List[Document]:
+        """Chunks mais relevantes para a pergunta (`k` padrão: `search_kwargs`)"""
+        k = k or self.search_kwargs["k"]
+
+        # Referência explícita: consulta direta no dicionário de dispositivos
+        posicoes = self.indice.buscar_dispositivos(extrair_referencias(pergunta))
+        if posicoes:
+            return [self._documento(p) for p in posicoes[:k]]
+
+        candidatos = k * BUSCA_FATOR_CANDIDATOS
+        if vetor is None:
+            vetor = self.vectorstore.embeddings.embed_query(pergunta)
+        # Distância L2: quanto menor, melhor -> inverter o sinal antes de normalizar
+        vetoriais = {}
+        distancias, posicoes_vetoriais = self.vectorstore.index.search(
+            np.asarray([vetor], dtype=np.float32), min(candidatos, self.vectorstore.index.ntotal)
+        )
+        for distancia, posicao in zip(distancias[0], posicoes_vetoriais[0]):
+            if posicao >= 0:
+                vetoriais[int(posicao)] = -float(distancia)
+        lexicais = dict(self.indice.bm25(pergunta, candidatos))
+
+        vetoriais = _normalizar_pontuacoes(vetoriais)
+        lexicais = _normalizar_pontuacoes(lexicais)
+        fundidas = {
+            p: self.peso_vetorial * vetoriais.get(p, 0.0) + (1 - self.peso_vetorial) * lexicais.get(p, 0.0)
+            for p in set(vetoriais) | set(lexicais)
+        }
+        melhores = sorted(fundidas, key=lambda p: -fundidas[p])[:k]
+        return [self._documento(p) for p in melhores]
+
+    def invoke(self, pergunta: str) -> List[Document]:
+        return self.buscar(pergunta)
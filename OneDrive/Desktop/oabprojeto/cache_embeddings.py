@@ -0,0 +1,153 @@
+"""Cache de embeddings endereçado por conteúdo, compartilhado entre builds
+
+A chave é (modelo, hash do texto normalizado). Os vetores ficam em um
+arquivo float32 contíguo (`vetores.f32`), aberto com memory-map, e um
+índice de offsets (`offsets.tsv`, uma linha `hash<TAB>linha` por vetor)
+diz em que linha está cada texto. Os dois arquivos só crescem por append,
+então um build interrompido perde no máximo o lote em andamento.
+
+Mudar o chunking, a ordem dos PDFs ou alternar entre modelos não obriga
+a gerar de novo os embeddings de textos já vistos.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DIRETORIO_CACHE = Path(
+    os.getenv("EMBEDDINGS_CACHE_DIR", str(Path(__file__).parent / ".cache" / "embeddings"))
+)
+
+ARQUIVO_VETORES = "vetores.f32"
+ARQUIVO_OFFSETS = "offsets.tsv"
+ARQUIVO_INFO = "info.json"
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza Unicode e espaços, para que variações triviais compartilhem a chave"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", texto)).strip()
+
+
+def chave_texto(texto: str) -> str:
+    """Hash do texto normalizado"""
+    return hashlib.sha256(normalizar_texto(texto).encode("utf-8")).hexdigest()
+
+
+class CacheEmbeddings:
+    """Cache em disco dos embeddings de um modelo
+
+    Args:
+        modelo: Nome do modelo de embeddings (cada modelo tem seu diretório)
+        diretorio: Diretório raiz do cache
+    """
+
+    def __init__(self, modelo: str, diretorio: Path = DIRETORIO_CACHE):
+        self.modelo = modelo
+        self.diretorio = diretorio / hashlib.sha256(modelo.encode()).hexdigest()[:16]
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+        self._offsets: Dict[str, int] = {}
+        self._dimensao: Optional[int] = None
+        self._mapa: Optional[np.memmap] = None
+        self._carregar()
+
+    def _carregar(self) -> None:
+        try:
+            with open(self.diretorio / ARQUIVO_INFO, encoding="utf-8") as f:
+                self._dimensao = json.load(f)["dimensao"]
+        except (OSError, json.JSONDecodeError, KeyError):
+            return
+
+        linhas_no_arquivo = self._linhas_no_arquivo()
+        try:
+            with open(self.diretorio / ARQUIVO_OFFSETS, encoding="utf-8") as f:
+                for linha in f:
+                    partes = linha.rstrip("\n").split("\t")
+                    # Ignorar linhas truncadas ou que apontam além dos vetores gravados
+                    if len(partes) == 2 and partes[1].isdigit() and int(partes[1]) < linhas_no_arquivo:
+                        self._offsets[partes[0]] = int(partes[1])
+        except OSError:
+            self._offsets = {}
+
+    def _linhas_no_arquivo(self) -> int:
+        caminho = self.diretorio / ARQUIVO_VETORES
+        if not self._dimensao or not caminho.exists():
+            return 0
+        return caminho.stat().st_size // (4 * self._dimensao)
+
+    def _mapear(self) -> Optional[np.memmap]:
+        """Memory-map do arquivo de vetores (refeito quando o arquivo cresce)"""
+        linhas = self._linhas_no_arquivo()
+        if linhas == 0:
+            return None
+        if self._mapa is None or self._mapa.shape[0] < linhas:
+            self._mapa = np.memmap(
+                self.diretorio / ARQUIVO_VETORES, dtype=np.float32, mode="r", shape=(linhas, self._dimensao)
+            )
+        return self._mapa
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def buscar(self, textos: List[str]) -> List[Optional[np.ndarray]]:
+        """Vetores em cache para cada texto (None quando não estiver no cache)"""
+        with self._lock:
+            mapa = self._mapear()
+            resultado: List[Optional[np.ndarray]] = []
+            for texto in textos:
+                linha = self._offsets.get(chave_texto(texto))
+                if linha is None or mapa is None:
+                    resultado.append(None)
+                    self.faltas += 1
+                else:
+                    resultado.append(np.array(mapa[linha]))
+                    self.acertos += 1
+            return resultado
+
+    def adicionar(self, textos: List[str], vetores: np.ndarray) -> None:
+        """Grava novos vetores no fim do arquivo e registra seus offsets"""
+        vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+        with self._lock:
+            if self._dimensao is None:
+                self.diretorio.mkdir(parents=True, exist_ok=True)
+                self._dimensao = int(vetores.shape[1])
+                with open(self.diretorio / ARQUIVO_INFO, "w", encoding="utf-8") as f:
+                    json.dump({"modelo": self.modelo, "dimensao": self._dimensao}, f)
+            elif vetores.shape[1] != self._dimensao:
+                raise ValueError(
+                    f"Dimensão {vetores.shape[1]} diferente da do cache ({self._dimensao}) para {self.modelo}"
+                )
+
+            novos = []
+            vistas = set()
+            for texto, vetor in zip(textos, vetores):
+                chave = chave_texto(texto)
+                if chave not in self._offsets and chave not in vistas:
+                    vistas.add(chave)
+                    novos.append((chave, vetor))
+            if not novos:
+                return
+
+            primeira_linha = self._linhas_no_arquivo()
+            # Vetores primeiro: offsets que apontam além do arquivo são ignorados na leitura
+            with open(self.diretorio / ARQUIVO_VETORES, "ab") as f:
+                # Descartar uma linha parcial deixada por um build interrompido
+                f.truncate(primeira_linha * 4 * self._dimensao)
+                f.write(np.stack([v for _, v in novos]).tobytes())
+            with open(self.diretorio / ARQUIVO_OFFSETS, "a", encoding="utf-8") as f:
+                for i, (chave, _) in enumerate(novos):
+                    f.write(f"{chave}\t{primeira_linha + i}\n")
+                    self._offsets[chave] = primeira_linha + i
+
+    def resumo(self) -> str:
+        """Acertos e faltas desde a criação do cache"""
+        total = self.acertos + self.faltas
+        taxa = (100 * self.acertos / total) if total else 0.0
+        return f"Cache de embeddings: {self.acertos} acertos, {self.faltas} faltas ({taxa:.0f}% reaproveitado)"
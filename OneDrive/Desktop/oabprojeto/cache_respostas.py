@@ -0,0 +1,109 @@
+"""Cache semântico de respostas
+
+Perguntas quase iguais ("artigo sobre zoneamento urbano" /
+"qual o artigo sobre o zoneamento urbano?") devolvem a resposta já gerada
+sem nova busca nem chamada ao LLM. A chave é o embedding da pergunta: uma
+pergunta nova com similaridade de cosseno acima do limiar reaproveita a
+resposta da mais parecida, desde que as duas citem os mesmos dispositivos:
+"O que diz o artigo 45?" e "O que diz o artigo 46?" têm embeddings quase
+iguais e respostas diferentes.
+
+As entradas expiram por TTL, o tamanho é limitado com despejo LRU e o
+cache inteiro é descartado quando o fingerprint do índice muda.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+CACHE_RESPOSTAS_LIMIAR = float(os.getenv("CACHE_RESPOSTAS_LIMIAR", "0.95"))
+CACHE_RESPOSTAS_TTL = float(os.getenv("CACHE_RESPOSTAS_TTL", str(24 * 3600)))
+CACHE_RESPOSTAS_MAX = int(os.getenv("CACHE_RESPOSTAS_MAX", "500"))
+
+
+def _normalizar(vetor: Sequence[float]) -> np.ndarray:
+    vetor = np.asarray(vetor, dtype=np.float32)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+
+class CacheSemantico:
+    """Cache de respostas indexado pelo embedding da pergunta
+
+    Args:
+        limiar: Similaridade de cosseno mínima para considerar a pergunta repetida
+        ttl: Segundos até uma resposta expirar
+        max_itens: Número máximo de respostas guardadas (LRU)
+    """
+
+    def __init__(
+        self,
+        limiar: float = CACHE_RESPOSTAS_LIMIAR,
+        ttl: float = CACHE_RESPOSTAS_TTL,
+        max_itens: int = CACHE_RESPOSTAS_MAX,
+    ):
+        self.limiar = limiar
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.fingerprint: Optional[str] = None
+        self.acertos = 0
+        self.faltas = 0
+        self._itens: "OrderedDict[int, tuple]" = OrderedDict()
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    def _validar_fingerprint(self, fingerprint: str) -> None:
+        if fingerprint != self.fingerprint:
+            self._itens.clear()
+            self.fingerprint = fingerprint
+
+    def _remover_expirados(self, agora: float) -> None:
+        expirados = [chave for chave, (_, _, criado, _) in self._itens.items() if agora - criado > self.ttl]
+        for chave in expirados:
+            del self._itens[chave]
+
+    def buscar(self, vetor: Sequence[float], fingerprint: str, referencias: Sequence[str] = ()) -> Optional[Dict]:
+        """Resposta de uma pergunta parecida que cita os mesmos dispositivos, ou None
+
+        Args:
+            referencias: Dispositivos citados na pergunta
+                (`busca_lexical.extrair_referencias`)
+        """
+        consulta = _normalizar(vetor)
+        referencias = tuple(referencias)
+        with self._lock:
+            self._validar_fingerprint(fingerprint)
+            self._remover_expirados(time.time())
+            chaves = [c for c, item in self._itens.items() if item[3] == referencias]
+            if not chaves:
+                self.faltas += 1
+                return None
+
+            matriz = np.stack([self._itens[c][0] for c in chaves])
+            similaridades = matriz @ consulta
+            melhor = int(np.argmax(similaridades))
+            if similaridades[melhor] < self.limiar:
+                self.faltas += 1
+                return None
+
+            chave = chaves[melhor]
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return self._itens[chave][1]
+
+    def guardar(
+        self, vetor: Sequence[float], resposta: Dict, fingerprint: str, referencias: Sequence[str] = ()
+    ) -> None:
+        """Guarda a resposta de uma pergunta, despejando a menos usada se cheio"""
+        with self._lock:
+            self._validar_fingerprint(fingerprint)
+            self._itens[next(self._ids)] = (_normalizar(vetor), resposta, time.time(), tuple(referencias))
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._itens)
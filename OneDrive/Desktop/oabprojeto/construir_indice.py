@@ -0,0 +1,83 @@
+"""Construção do índice fora do app
+
+Lê os PDFs, divide em chunks, gera os embeddings e grava o índice no
+mesmo diretório que o app usa (`INDICE_DIR`, por configuração de chunks e
+modelo de embeddings), junto com o índice lexical e o índice aproximado
+(`INDICE_TIPO`), se configurado. É o mesmo fluxo do app, então só PDFs
+novos ou alterados são processados.
+
+Com o índice pronto, o app pode rodar com `INDICE_SOMENTE_LEITURA=1` e
+apenas carregar o artefato, sem nunca indexar dentro de uma requisição.
+
+Uso:
+    python construir_indice.py
+    python construir_indice.py docs/*.pdf --backend local
+    INDEXACAO_LOTE=500 INGESTAO_WORKERS=4 python construir_indice.py
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from consulta import backend_do_ambiente, carregar_recuperador, criar_embeddings, encontrar_pdfs
+from indice import diretorio_indice
+
+
+def _pico_memoria_mb() -> Optional[float]:
+    """Pico de memória residente do processo (None fora do Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB, macOS em bytes
+    return pico / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", type=Path, help="PDFs a indexar (padrão: os mesmos que o app encontra)")
+    parser.add_argument(
+        "--backend", choices=("auto", "gemini", "local"), default="auto",
+        help="Embeddings do Gemini ou locais (padrão: o mesmo critério do app)",
+    )
+    args = parser.parse_args(argv)
+
+    def avisar(mensagem: str) -> None:
+        print(mensagem, file=sys.stderr)
+
+    ultimo = {"texto": None}
+
+    def progresso(fracao: float, texto: str) -> None:
+        if texto != ultimo["texto"]:
+            ultimo["texto"] = texto
+            print(f"\r[{fracao:6.1%}] {texto}", end="", file=sys.stderr, flush=True)
+
+    usar_gemini, google_api_key, gemini_base_url = backend_do_ambiente()
+    if args.backend == "gemini" and not usar_gemini:
+        raise SystemExit("--backend gemini exige GOOGLE_API_KEY válida e langchain-google-genai instalado")
+    if args.backend == "local":
+        usar_gemini = False
+
+    pdfs = args.pdfs or encontrar_pdfs()
+    embeddings, modelo_embeddings = criar_embeddings(usar_gemini, google_api_key, gemini_base_url)
+
+    inicio = time.perf_counter()
+    recuperador = carregar_recuperador(
+        pdfs, embeddings, modelo_embeddings, usar_gemini, avisar=avisar, progresso=progresso, somente_leitura=False
+    )
+    if ultimo["texto"] is not None:
+        print(file=sys.stderr)
+
+    pasta = diretorio_indice(recuperador["configuracao"])
+    pico = _pico_memoria_mb()
+    avisar(
+        f"Índice {recuperador['fingerprint'][:12]} em {pasta}: {recuperador['num_docs']} páginas, "
+        f"{recuperador['num_chunks']} chunks, {time.perf_counter() - inicio:.1f}s"
+        + (f", pico de memória {pico:.0f} MB" if pico is not None else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
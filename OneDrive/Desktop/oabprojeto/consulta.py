@@ -0,0 +1,1556 @@
+"""Motor de consulta: triagem, RAG e chamados, sem dependência do Streamlit
+
+Tudo o que o grafo precisa (modelos, índice, caches, classificador) é
+montado aqui e injetado no `MotorConsulta`. O `app.py` só cuida da
+interface e recebe as peças de `montar_sistema`, montadas em segundo plano
+enquanto a página já aparece; o processamento em lote (`lote.py`) usa o
+mesmo motor sem interface.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Annotated, Any, Awaitable, Callable, Dict, List, Literal, NamedTuple, Optional, Tuple, TypedDict
+
+import requests
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from pydantic import BaseModel, Field, ValidationError
+
+import busca_lexical
+import empacotamento
+import fabrica_indice
+import ingestao
+import metricas
+import partida
+from agendador_embeddings import AgendadorEmbeddings
+from cache_embeddings import CacheEmbeddings
+from cache_respostas import CacheSemantico
+from embeddings_onnx import EMBEDDINGS_LOCAL_MOTOR, carregar_embeddings_onnx
+from escalonador import ESCALONADOR_MAX_CONCORRENTES, EscalonadorRequisicoes, definir_sessao, restaurar_sessao
+from indice import INDICE_SOMENTE_LEITURA, diretorio_indice, fingerprint_configuracao, sincronizar_indice
+from limites import LimitadorTaxa
+from registro_modelos import GEMINI_DISPONIVEL, OLLAMA_URL, ConfiguracaoLLM, RegistroModelos, escolher_modelo_ollama
+from reranqueamento import Reranqueador, criar_reranqueador
+from roteador_llm import LLM_ROTEAMENTO, EstadoRoteamento, RoteadorLLM, backends_roteamento, rotear
+from triagem_rapida import ClassificadorTriagem
+
+# O SDK do Gemini só é importado quando o Gemini é usado (ver registro_modelos)
+GEMINI_AVAILABLE = GEMINI_DISPONIVEL
+
+# Configuração da divisão em chunks (faz parte do fingerprint do índice)
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+EMBEDDING_MODEL_GEMINI = "models/text-embedding-004"
+EMBEDDING_MODEL_LOCAL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Cache de embeddings por conteúdo, compartilhado entre builds (0 desliga)
+EMBEDDINGS_CACHE = os.getenv("EMBEDDINGS_CACHE", "1") != "0"
+
+# Busca exata por artigo/parágrafo/inciso + fusão BM25 e vetorial (0 = só vetorial)
+BUSCA_HIBRIDA = os.getenv("BUSCA_HIBRIDA", "1") != "0"
+
+# Busca especulativa: quando a triagem precisa do LLM, a busca no índice
+# começa ao mesmo tempo e é entregue ao auto_resolver se ele for escolhido
+MODO_ESPECULATIVO = os.getenv("MODO_ESPECULATIVO", "1") != "0"
+
+# Perguntas que o classificador local não decide: busca primeiro e uma chamada
+# só ao LLM para triagem e resposta (volta às duas chamadas se a saída não servir)
+MODO_FUNDIDO = os.getenv("MODO_FUNDIDO", "0") == "1"
+
+# Limite de chamadas ao LLM por minuto, compartilhado por todas as consultas (0 = sem limite)
+LLM_REQ_POR_MINUTO = float(os.getenv("LLM_REQ_POR_MINUTO", "0"))
+
+KEYWORDS_ABRIR_TICKET = ["aprovação", "exceção", "liberação", "abrir ticket", "acesso especial"]
+
+
+def embeddings_concorrencia(usar_gemini: bool) -> int:
+    """Lotes de embeddings em paralelo
+
+    No Gemini os lotes são idas e voltas de rede; no modelo local (CPU)
+    concorrência não ajuda.
+    """
+    return int(os.getenv("EMBEDDINGS_CONCORRENCIA", "4" if usar_gemini else "1"))
+
+
+def embeddings_req_por_minuto(usar_gemini: bool) -> float:
+    """Limite de requisições de embeddings por minuto (cota do Gemini)"""
+    return float(os.getenv("EMBEDDINGS_REQ_POR_MINUTO", "100" if usar_gemini else "0"))
+
+
+def criar_escalonador(usar_gemini: bool, llm_req_por_minuto: Optional[float] = None) -> EscalonadorRequisicoes:
+    """Escalonador do processo, com os limites do backend em uso
+
+    Args:
+        llm_req_por_minuto: Limite de chamadas ao LLM (padrão LLM_REQ_POR_MINUTO;
+            no Gemini, 15/min do plano gratuito se nenhum for configurado)
+    """
+    if llm_req_por_minuto is None:
+        llm_req_por_minuto = LLM_REQ_POR_MINUTO or (15 if usar_gemini else 0)
+    # O Ollama local atende uma geração por vez; chamadas paralelas só disputam a CPU
+    max_llm = int(os.getenv("ESCALONADOR_MAX_CONCORRENTES", str(ESCALONADOR_MAX_CONCORRENTES) if usar_gemini else "1"))
+    # Embeddings locais rodam no próprio processo: sem backend a proteger, sem limite
+    max_embeddings = int(os.getenv(
+        "ESCALONADOR_MAX_CONCORRENTES_EMBEDDINGS", str(ESCALONADOR_MAX_CONCORRENTES) if usar_gemini else "0"
+    ))
+    return EscalonadorRequisicoes(
+        req_por_minuto={"llm": llm_req_por_minuto, "embeddings": embeddings_req_por_minuto(usar_gemini)},
+        max_concorrentes={"llm": max_llm, "embeddings": max_embeddings},
+    )
+
+
+# Prompt de triagem
+TRIAGEM_PROMPT = (
+    "Você é um assistente especializado em consultar o Vade Mecum do Senado Federal. "
+    "Dada a mensagem do usuário, retorne SOMENTE um JSON com:\n"
+    "{\n"
+    '  "decisao": "AUTO_RESOLVER" | "PEDIR_INFO" | "ABRIR_CHAMADO",\n'
+    '  "urgencia": "BAIXA" | "MEDIA" | "ALTA",\n'
+    '  "campos_faltantes": ["..."]\n'
+    "}\n"
+    "Regras:\n"
+    '- **AUTO_RESOLVER**: Perguntas claras sobre leis, artigos, normas ou procedimentos descritos no Vade Mecum (Ex: "Qual o artigo sobre impeachment?", "Como funciona a política de alimentação?").\n'
+    '- **PEDIR_INFO**: Mensagens vagas ou que faltam informações para identificar o tema ou contexto (Ex: "Preciso de ajuda", "Tenho uma dúvida geral").\n'
+    '- **ABRIR_CHAMADO**: Pedidos de exceção, liberação, aprovação ou quando o usuário explicitamente pede para abrir um chamado.\n'
+    "Analise a mensagem e decida a ação mais apropriada."
+)
+
+# Modelo Pydantic para triagem
+class TriagemOut(BaseModel):
+    decisao: Literal["AUTO_RESOLVER", "PEDIR_INFO", "ABRIR_CHAMADO"]
+    urgencia: Literal["BAIXA", "MEDIA", "ALTA"]
+    campos_faltantes: List[str] = Field(default_factory=list)
+
+# Configurar chain de triagem - Ollama não suporta with_structured_output
+# Vamos usar prompt estruturado e parsing manual
+def get_triagem_prompt(mensagem: str) -> str:
+    """Gera o prompt de triagem com a mensagem do usuário"""
+    return (
+        "Você é um assistente especializado em consultar as Leis Orgânicas de Curitiba, Paraná. "
+        "Dada a mensagem do usuário, retorne SOMENTE um JSON válido com:\n"
+        "{{\n"
+        '  "decisao": "AUTO_RESOLVER" | "PEDIR_INFO" | "ABRIR_CHAMADO",\n'
+        '  "urgencia": "BAIXA" | "MEDIA" | "ALTA",\n'
+        '  "campos_faltantes": ["..."]\n'
+        "}}\n"
+        "Regras:\n"
+        '- **AUTO_RESOLVER**: Perguntas ESPECÍFICAS e CLARAS sobre leis orgânicas, artigos, normas ou procedimentos de Curitiba. Exemplos: "Qual o artigo sobre zoneamento urbano?", "O que diz a lei orgânica sobre transporte público?", "Qual a norma sobre licenciamento ambiental?".\n'
+        '- **PEDIR_INFO**: Mensagens VAGAS, genéricas ou que faltam informações específicas. Exemplos: "me retorne apenas uma lei", "preciso de ajuda", "tenho uma dúvida", "quero saber sobre leis", "me mostre algo".\n'
+        '- **ABRIR_CHAMADO**: Pedidos de exceção, liberação, aprovação ou quando o usuário explicitamente pede para abrir um chamado.\n'
+        "IMPORTANTE: Se a pergunta for genérica ou vaga (como 'me retorne uma lei', 'me mostre algo', 'quero saber sobre'), classifique como PEDIR_INFO.\n"
+        "Analise a mensagem e retorne APENAS o JSON, sem texto adicional.\n"
+        f"Mensagem do usuário: {mensagem}"
+    )
+
+def interpretar_triagem(content: str) -> Optional[Dict]:
+    """Extrai o JSON de triagem da resposta do LLM (None se não houver um válido)"""
+    # Tentar extrair JSON da resposta
+    # Procurar por JSON no texto
+    json_match = re.search(r'\{[^{}]*"decisao"[^{}]*\}', content, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(0)
+    else:
+        # Tentar encontrar qualquer JSON válido
+        json_match = re.search(r'\{.*\}', content, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(0)
+        else:
+            return None
+
+    try:
+        # Limpar e parsear JSON
+        json_str = json_str.strip()
+        # Remover markdown code blocks se houver
+        json_str = re.sub(r'```json\s*', '', json_str)
+        json_str = re.sub(r'```\s*', '', json_str)
+
+        data = json.loads(json_str)
+
+        # Validar e garantir estrutura correta
+        decisao = data.get("decisao", "PEDIR_INFO")
+        if decisao not in ["AUTO_RESOLVER", "PEDIR_INFO", "ABRIR_CHAMADO"]:
+            decisao = "PEDIR_INFO"
+
+        urgencia = data.get("urgencia", "MEDIA")
+        if urgencia not in ["BAIXA", "MEDIA", "ALTA"]:
+            urgencia = "MEDIA"
+
+        campos_faltantes = data.get("campos_faltantes", [])
+        if not isinstance(campos_faltantes, list):
+            campos_faltantes = []
+
+        return {
+            "decisao": decisao,
+            "urgencia": urgencia,
+            "campos_faltantes": campos_faltantes
+        }
+    except json.JSONDecodeError:
+        return None
+
+# Triagem e resposta na mesma chamada (MODO_FUNDIDO)
+class TriagemRespostaOut(TriagemOut):
+    resposta: str = Field(
+        default="",
+        description="Resposta à pergunta usando só o contexto; vazia se a decisão não for AUTO_RESOLVER",
+    )
+
+prompt_fundido = ChatPromptTemplate.from_messages([
+    ("system",
+     "Você é um assistente especializado em consultar as Leis Orgânicas de Curitiba, Paraná. "
+     "Primeiro classifique a mensagem do usuário; depois, se ela for uma pergunta clara, responda usando APENAS o contexto.\n"
+     "Classificação (campo decisao):\n"
+     '- AUTO_RESOLVER: perguntas ESPECÍFICAS e CLARAS sobre leis orgânicas, artigos, normas ou procedimentos de Curitiba.\n'
+     '- PEDIR_INFO: mensagens VAGAS ou genéricas ("me retorne uma lei", "preciso de ajuda", "quero saber sobre leis"); '
+     "liste em campos_faltantes o que falta.\n"
+     "- ABRIR_CHAMADO: pedidos de exceção, liberação, aprovação ou quando o usuário pede para abrir um chamado.\n"
+     "Resposta (campo resposta, só em AUTO_RESOLVER; senão, vazio):\n"
+     "1. Use APENAS as informações do contexto fornecido e cite artigos, leis ou normas mencionados\n"
+     "2. Se o contexto contém informações sobre o tema, mesmo que parciais, forneça essas informações\n"
+     "3. Apenas diga 'Não encontrei informações' se o contexto realmente não tiver NADA relacionado à pergunta"),
+    ("human",
+     "Contexto das Leis Orgânicas de Curitiba:\n{context}\n\n"
+     "Com base no contexto, retorne SOMENTE um JSON com os campos nesta ordem:\n"
+     '{{"decisao": "AUTO_RESOLVER" | "PEDIR_INFO" | "ABRIR_CHAMADO", "urgencia": "BAIXA" | "MEDIA" | "ALTA", '
+     '"campos_faltantes": ["..."], "resposta": "..."}}\n'
+     "Mensagem do usuário: {input}"),
+])
+
+def interpretar_triagem_fundida(content: str) -> Optional[Dict]:
+    """Valida a saída da chamada fundida contra `TriagemRespostaOut`
+
+    Returns:
+        Dicionário da triagem com `resposta`, ou None se a saída não for um
+        JSON válido (ou se vier AUTO_RESOLVER sem resposta)
+    """
+    texto = re.sub(r"```(?:json)?", "", content).strip()
+    try:
+        saida = TriagemRespostaOut.model_validate_json(texto)
+    except ValidationError:
+        # Texto antes ou depois do JSON
+        encontrado = re.search(r"\{.*\}", texto, re.DOTALL)
+        if encontrado is None:
+            return None
+        try:
+            saida = TriagemRespostaOut.model_validate_json(encontrado.group(0))
+        except ValidationError:
+            return None
+    if saida.decisao == "AUTO_RESOLVER" and not saida.resposta.strip():
+        return None
+    return saida.model_dump()
+
+class LeitorRespostaFundida:
+    """Extrai o campo `resposta` do JSON da chamada fundida enquanto ele chega
+
+    O texto da resposta só é liberado depois que a decisão AUTO_RESOLVER
+    aparece no JSON (o esquema pede a decisão antes da resposta).
+    """
+
+    def __init__(self):
+        self.texto = ""
+        self.decisao: Optional[str] = None
+        self.resposta = ""
+        self._inicio: Optional[int] = None
+
+    def alimentar(self, pedaco: str) -> str:
+        """Acrescenta um pedaço do JSON; devolve o texto novo da resposta"""
+        self.texto += pedaco
+        if self.decisao is None:
+            encontrada = re.search(r'"decisao"\s*:\s*"(\w+)"', self.texto)
+            self.decisao = encontrada.group(1) if encontrada else None
+        if self._inicio is None:
+            encontrado = re.search(r'"resposta"\s*:\s*"', self.texto)
+            if encontrado is None:
+                return ""
+            self._inicio = encontrado.end()
+        if self.decisao != "AUTO_RESOLVER":
+            return ""
+
+        # Até a aspa de fechamento ou o último escape completo
+        i = self._inicio
+        while i < len(self.texto) and self.texto[i] != '"':
+            if self.texto[i] == "\\":
+                passo = 6 if self.texto[i + 1:i + 2] == "u" else 2
+                if i + passo > len(self.texto):
+                    break
+                i += passo
+            else:
+                i += 1
+        try:
+            decodificada = json.loads('"' + self.texto[self._inicio:i] + '"')
+        except json.JSONDecodeError:
+            return ""
+        novo = decodificada[len(self.resposta):]
+        self.resposta = decodificada
+        return novo
+
+def modelo_json(llm, schema: type = TriagemRespostaOut):
+    """O mesmo modelo, respondendo só JSON
+
+    Gemini: saída restrita ao esquema (`response_json_schema`); Ollama:
+    modo JSON (`format="json"`); roteador: cada backend do seu jeito. Outros
+    modelos ficam como estão (o prompt já pede o JSON).
+    """
+    if isinstance(llm, RoteadorLLM):
+        return llm.model_copy(update={"modelos": {nome: modelo_json(m, schema) for nome, m in llm.modelos.items()}})
+    # Sem o SDK carregado, o modelo não pode ser do Gemini
+    genai = sys.modules.get("langchain_google_genai")
+    if genai is not None and isinstance(llm, genai.ChatGoogleGenerativeAI):
+        return llm.bind(response_mime_type="application/json", response_json_schema=schema.model_json_schema())
+    if "format" in getattr(type(llm), "model_fields", {}):
+        return llm.bind(format="json")
+    return llm
+
+# Prompt RAG
+prompt_rag = ChatPromptTemplate.from_messages([
+    ("system",
+     "Você é um assistente especializado em consultar as Leis Orgânicas de Curitiba, Paraná. "
+     "Sua função é responder perguntas sobre leis, artigos e normas brasileiras usando APENAS as informações fornecidas no contexto abaixo. "
+     "INSTRUÇÕES IMPORTANTES:\n"
+     "1. Use APENAS as informações do contexto fornecido\n"
+     "2. Se encontrar informações relevantes, responda de forma clara e completa\n"
+     "3. Cite artigos, leis ou normas quando mencionados no contexto\n"
+     "4. Se o contexto contém informações sobre o tema perguntado, mesmo que parciais, forneça essas informações\n"
+     "5. Apenas diga 'Não encontrei informações' se o contexto realmente não tiver NADA relacionado à pergunta\n"
+     "6. Seja útil e forneça o máximo de informações possível do contexto"),
+    ("human", "Pergunta: {input}\n\nContexto das Leis Orgânicas de Curitiba:\n{context}\n\nCom base no contexto acima, responda a pergunta de forma completa e precisa.")
+])
+
+def referencia_chunk(doc) -> str:
+    """Dispositivo de um chunk ("Art. 45, § 2º") ou, sem ele, a página"""
+    artigo = doc.metadata.get("artigo")
+    if not artigo:
+        return f"Página {doc.metadata.get('page', 'N/A')}"
+    referencia = f"Art. {artigo}"
+    paragrafo = doc.metadata.get("paragrafo")
+    if paragrafo == "unico":
+        referencia += ", parágrafo único"
+    elif paragrafo:
+        referencia += f", § {paragrafo}º"
+    return referencia
+
+def hierarquia_chunk(doc) -> str:
+    """Título/Capítulo/Seção de um chunk do chunker legal"""
+    return " › ".join(doc.metadata[n] for n in ("titulo", "capitulo", "secao", "subsecao") if doc.metadata.get(n))
+
+# Criar chain manualmente para evitar problemas de compatibilidade
+def format_docs(docs):
+    """Formata os documentos para o contexto
+
+    Chunks do chunker legal levam o dispositivo na frente, para que o LLM
+    cite o artigo certo.
+    """
+    return "\n\n".join(
+        f"[{referencia_chunk(doc)}]\n{doc.page_content}" if doc.metadata.get("artigo") else doc.page_content
+        for doc in docs
+    )
+
+def texto_da_mensagem(mensagem) -> str:
+    """Texto de uma resposta ou chunk do LLM (conteúdo pode vir em blocos)"""
+    conteudo = getattr(mensagem, "content", mensagem)
+    if isinstance(conteudo, str):
+        return conteudo
+    if isinstance(conteudo, list):
+        return "".join(b if isinstance(b, str) else b.get("text", "") for b in conteudo)
+    return str(conteudo)
+
+class CadeiaRAG:
+    """Chain RAG montada manualmente, com versão síncrona e assíncrona
+
+    Se `inputs` trouxer `ao_receber_token`, a resposta é gerada em streaming
+    e o callback recebe cada pedaço de texto assim que chega. A chamada
+    espera a vez no escalonador (prioridade de geração); sem streaming,
+    erros transitórios (429, timeout) são repetidos com backoff. Tempo,
+    tokens e tamanhos da chamada vão para as métricas.
+    """
+
+    def __init__(self, llm, prompt, escalonador: EscalonadorRequisicoes):
+        self.llm = llm
+        self.prompt = prompt
+        self.escalonador = escalonador
+
+    def _mensagens(self, inputs):
+        context = format_docs(inputs.get("context", []))
+        formatted_prompt = self.prompt.format_messages(
+            input=inputs.get("input", ""),
+            context=context
+        )
+        return formatted_prompt, "\n".join(texto_da_mensagem(m) for m in formatted_prompt)
+
+    def __call__(self, inputs):
+        formatted_prompt, texto_prompt = self._mensagens(inputs)
+        ao_receber_token = inputs.get("ao_receber_token")
+        if ao_receber_token is None:
+            with metricas.etapa("geracao"):
+                response = self.escalonador.executar(lambda: self.llm.invoke(formatted_prompt), "llm", "geracao")
+            texto = texto_da_mensagem(response)
+            metricas.registrar_chamada_llm("geracao", texto_prompt, response, texto)
+            return texto
+
+        # Em streaming não há retentativa: tokens já entregues não voltam
+        partes = []
+        mensagem = None
+        with metricas.etapa("geracao"), self.escalonador.vez("llm", "geracao"):
+            for chunk in self.llm.stream(formatted_prompt):
+                # Somar os pedaços preserva o usage_metadata que vem no último
+                mensagem = chunk if mensagem is None else mensagem + chunk
+                texto = texto_da_mensagem(chunk)
+                if texto:
+                    partes.append(texto)
+                    ao_receber_token(texto)
+        texto = "".join(partes)
+        metricas.registrar_chamada_llm("geracao", texto_prompt, mensagem, texto)
+        return texto
+
+    async def ainvoke(self, inputs):
+        formatted_prompt, texto_prompt = self._mensagens(inputs)
+        ao_receber_token = inputs.get("ao_receber_token")
+        if ao_receber_token is None:
+            with metricas.etapa("geracao"):
+                response = await self.escalonador.aexecutar(
+                    lambda: self.llm.ainvoke(formatted_prompt), "llm", "geracao"
+                )
+            texto = texto_da_mensagem(response)
+            metricas.registrar_chamada_llm("geracao", texto_prompt, response, texto)
+            return texto
+
+        partes = []
+        mensagem = None
+        with metricas.etapa("geracao"):
+            async with self.escalonador.avez("llm", "geracao"):
+                async for chunk in self.llm.astream(formatted_prompt):
+                    mensagem = chunk if mensagem is None else mensagem + chunk
+                    texto = texto_da_mensagem(chunk)
+                    if texto:
+                        partes.append(texto)
+                        ao_receber_token(texto)
+        texto = "".join(partes)
+        metricas.registrar_chamada_llm("geracao", texto_prompt, mensagem, texto)
+        return texto
+
+def create_rag_chain(
+    llm,
+    prompt,
+    limitador: Optional[LimitadorTaxa] = None,
+    escalonador: Optional[EscalonadorRequisicoes] = None,
+):
+    """Cria a chain RAG; sem escalonador, usa um próprio com o `limitador` e sem fila"""
+    if escalonador is None:
+        escalonador = EscalonadorRequisicoes(max_concorrentes={}, limitadores={"llm": limitador})
+    return CadeiaRAG(llm, prompt, escalonador)
+
+def encontrar_pdfs() -> List[Path]:
+    """Procura os PDFs do workspace nos caminhos possíveis"""
+    # Tentar múltiplos caminhos possíveis
+    possible_paths = [
+        Path("."),  # Diretório atual
+        Path(__file__).parent,  # Diretório do script
+        Path.cwd(),  # Diretório de trabalho atual
+    ]
+
+    # Adicionar caminho específico do Streamlit Cloud se existir
+    if os.path.exists("/mount/src"):
+        possible_paths.append(Path("/mount/src"))
+
+    pdf_files_found = []
+    for workspace_path in possible_paths:
+        try:
+            pdf_files = list(workspace_path.glob("*.pdf"))
+            if pdf_files:
+                pdf_files_found.extend(pdf_files)
+        except Exception:
+            continue
+
+    # Remover duplicatas mantendo a ordem
+    seen = set()
+    unique_pdfs = []
+    for pdf in pdf_files_found:
+        if str(pdf.resolve()) not in seen:
+            seen.add(str(pdf.resolve()))
+            unique_pdfs.append(pdf)
+
+    if not unique_pdfs:
+        # Listar arquivos no diretório atual para debug
+        current_dir = Path(".")
+        all_files = list(current_dir.iterdir())
+        error_msg = f"Nenhum PDF foi encontrado no workspace.\n\n"
+        error_msg += f"Diretório atual: {current_dir.resolve()}\n"
+        error_msg += f"Arquivos encontrados: {[f.name for f in all_files[:10]]}\n"
+        if len(all_files) > 10:
+            error_msg += f"... e mais {len(all_files) - 10} arquivos\n"
+        raise ValueError(error_msg)
+
+    return unique_pdfs
+
+def criar_embeddings(usar_gemini: bool, google_api_key: Optional[str] = None, gemini_base_url: Optional[str] = None):
+    """Configura o modelo de embeddings do backend ativo
+
+    Returns:
+        Tupla (embeddings, nome do modelo)
+    """
+    if usar_gemini:
+        # Usar Google Gemini embeddings
+        if not GEMINI_AVAILABLE:
+            raise ImportError("langchain-google-genai não está instalado")
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        extras = {"base_url": gemini_base_url} if gemini_base_url else {}
+        embeddings = GoogleGenerativeAIEmbeddings(
+            model=EMBEDDING_MODEL_GEMINI,
+            google_api_key=google_api_key,
+            **extras
+        )
+        return embeddings, EMBEDDING_MODEL_GEMINI
+
+    # Local - ONNX int8 (sem torch) ou HuggingFace
+    if EMBEDDINGS_LOCAL_MOTOR == "onnx":
+        return carregar_embeddings_onnx(EMBEDDING_MODEL_LOCAL)
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_LOCAL,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    return embeddings, EMBEDDING_MODEL_LOCAL
+
+def criar_retriever(vectorstore):
+    """Configura o retriever - ajustado para ser mais permissivo"""
+    return vectorstore.as_retriever(
+        search_type="similarity",
+        search_kwargs={"k": 5}  # Aumentado para 5 resultados e removido threshold muito restritivo
+    )
+
+def carregar_recuperador(
+    pdfs: List[Path],
+    embeddings,
+    modelo_embeddings: str,
+    usar_gemini: bool,
+    avisar: Callable[[str], None] = print,
+    progresso: Optional[Callable[[float, str], None]] = None,
+    somente_leitura: bool = INDICE_SOMENTE_LEITURA,
+) -> Dict:
+    """Carrega o índice salvo em disco, o atualiza com os PDFs alterados e monta o retriever
+
+    Só PDFs novos ou modificados são processados e embutidos; os chunks de
+    PDFs removidos saem do índice. Com `somente_leitura`, só carrega o
+    índice construído por `construir_indice.py`.
+
+    Returns:
+        Dicionário com `retriever`, `num_docs`, `num_chunks`, `fingerprint`,
+        `configuracao` e `estatisticas_indice`
+    """
+    def processar_pdfs(lista: List[Path]):
+        avisar("Dividindo documentos em chunks...")
+        return ingestao.iterar_pdfs(lista, CHUNK_SIZE, CHUNK_OVERLAP, avisar=avisar)
+
+    configuracao = fingerprint_configuracao(
+        CHUNK_SIZE, CHUNK_OVERLAP, modelo_embeddings, estrategia=ingestao.assinatura_estrategia()
+    )
+    agendador = AgendadorEmbeddings(
+        embeddings,
+        configuracao,
+        concorrencia=embeddings_concorrencia(usar_gemini),
+        req_por_minuto=embeddings_req_por_minuto(usar_gemini),
+        cache=CacheEmbeddings(modelo_embeddings) if EMBEDDINGS_CACHE else None,
+    )
+    vectorstore, metadados = sincronizar_indice(
+        pdfs,
+        embeddings,
+        configuracao,
+        processar_pdfs,
+        avisar=avisar,
+        progresso=progresso,
+        agendador=agendador,
+        somente_leitura=somente_leitura,
+    )
+
+    # Índice aproximado (HNSW/IVF-PQ) derivado do plano, se configurado; as
+    # estatísticas vêm da construção, sem ler os vetores do plano de novo
+    vectorstore, estatisticas_indice = fabrica_indice.aplicar_tipo(
+        vectorstore, diretorio_indice(configuracao), metadados["fingerprint"], avisar=avisar
+    )
+
+    if BUSCA_HIBRIDA:
+        indice_lexical = busca_lexical.carregar_ou_construir(
+            diretorio_indice(configuracao), vectorstore, metadados["fingerprint"]
+        )
+        retriever = busca_lexical.RecuperadorHibrido(vectorstore, indice_lexical, k=5)
+    else:
+        retriever = criar_retriever(vectorstore)
+
+    return {
+        "retriever": retriever,
+        "num_docs": metadados["num_docs"],
+        "num_chunks": metadados["num_chunks"],
+        "fingerprint": metadados["fingerprint"],
+        "configuracao": configuracao,
+        "estatisticas_indice": estatisticas_indice,
+    }
+
+def configuracao_llm(
+    usar_gemini: bool,
+    google_api_key: Optional[str] = None,
+    gemini_base_url: Optional[str] = None,
+    modelos_ollama: Optional[Dict] = None,
+) -> ConfiguracaoLLM:
+    """Configuração dos modelos a partir do backend escolhido"""
+    if usar_gemini:
+        # Usar gemini-2.5-flash conforme solicitado pelo usuário
+        return ConfiguracaoLLM("gemini", "gemini-2.5-flash", base_url=gemini_base_url, api_key=google_api_key)
+    return ConfiguracaoLLM("ollama", escolher_modelo_ollama(modelos_ollama), base_url=OLLAMA_URL)
+
+def req_por_minuto_backend(provedor: str) -> float:
+    """Limite de chamadas por minuto de um backend (15/min no Gemini gratuito)"""
+    if provedor == "gemini":
+        return LLM_REQ_POR_MINUTO or 15
+    return 0
+
+def configuracoes_llm(
+    usar_gemini: bool,
+    google_api_key: Optional[str] = None,
+    gemini_base_url: Optional[str] = None,
+    modelos_ollama: Optional[Dict] = None,
+    roteamento: str = LLM_ROTEAMENTO,
+) -> List[ConfiguracaoLLM]:
+    """Configurações dos backends de LLM em uso, na ordem de preferência
+
+    Sem roteamento, só a do backend escolhido. Com `LLM_ROTEAMENTO`, as dos
+    backends listados que estiverem disponíveis (Gemini com chave válida,
+    Ollama com algum modelo instalado); o cliente do Gemini perde as
+    retentativas próprias, porque o 429 agora vira failover.
+    """
+    configuracoes = []
+    for backend in backends_roteamento(roteamento):
+        if backend == "gemini" and usar_gemini:
+            configuracao = configuracao_llm(True, google_api_key, gemini_base_url)
+            configuracoes.append(replace(configuracao, max_tentativas=1))
+        elif backend == "ollama" and (modelos_ollama or {}).get("models"):
+            configuracoes.append(configuracao_llm(False, modelos_ollama=modelos_ollama))
+    if len(configuracoes) > 1:
+        return configuracoes
+    return [configuracao_llm(usar_gemini, google_api_key, gemini_base_url, modelos_ollama)]
+
+def criar_estado_roteamento(configuracoes: List[ConfiguracaoLLM]) -> EstadoRoteamento:
+    """Estado do roteamento, com o limite de cada backend"""
+    return EstadoRoteamento(
+        [c.provedor for c in configuracoes],
+        {c.provedor: req_por_minuto_backend(c.provedor) for c in configuracoes},
+    )
+
+def modelos_llm(
+    configuracoes: List[ConfiguracaoLLM],
+    registro: Callable[[str], RegistroModelos],
+    estado: Optional[EstadoRoteamento] = None,
+) -> Tuple[Any, Any, str]:
+    """(llm, llm_triagem, nome do modelo) das configurações
+
+    Com uma configuração, os próprios clientes; com várias, roteadores
+    sobre os clientes de cada backend.
+
+    Args:
+        registro: Registro de clientes de cada provedor
+        estado: Estado do roteamento já existente (senão, um novo)
+    """
+    if len(configuracoes) == 1:
+        configuracao = configuracoes[0]
+        llm, llm_triagem = registro(configuracao.provedor).obter(configuracao)
+        return llm, llm_triagem, configuracao.modelo
+    modelos = {c.provedor: registro(c.provedor).obter(c) for c in configuracoes}
+    llm, llm_triagem = rotear(modelos, estado or criar_estado_roteamento(configuracoes))
+    return llm, llm_triagem, "+".join(c.modelo for c in configuracoes)
+
+def verificar_ollama():
+    """(disponível, resposta de /api/tags) do servidor Ollama"""
+    try:
+        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=2)
+        if response.status_code == 200:
+            return True, response.json()
+        return False, None
+    except Exception:
+        return False, None
+
+def juntar_tempos(atuais: Dict[str, float], novos: Dict[str, float]) -> Dict[str, float]:
+    """Reducer do estado: cada nó acrescenta o próprio tempo (ou métricas)"""
+    return {**(atuais or {}), **(novos or {})}
+
+# Definir estado do agente
+class AgentState(TypedDict, total=False):
+  mensagem: str
+  triagem: Dict
+  resposta: Optional[str]
+  citacoes: List[dict]
+  rag_sucesso: bool
+  resposta_do_cache: bool
+  contexto: Dict
+  recuperacao_especulativa: Future  # ou asyncio.Task no ainvoke
+  resposta_fundida: Dict  # resposta que veio junto da triagem (MODO_FUNDIDO)
+  ao_receber_token: Callable[[str], None]
+  acao_final: str
+  tempos: Annotated[Dict[str, float], juntar_tempos]
+  metricas: Annotated[Dict[str, Dict], juntar_tempos]
+
+class MotorConsulta:
+    """Grafo triagem → RAG / pedir informação / abrir chamado com suas dependências
+
+    O grafo roda tanto com `invoke` (`consultar`) quanto com `ainvoke`
+    (`aconsultar`); nos dois casos as chamadas ao LLM e aos embeddings
+    passam pelo escalonador, que ordena e limita as chamadas de todas as
+    consultas do processo.
+
+    Args:
+        llm_triagem: Modelo de temperatura 0, usado na triagem e no RAG
+        model_name: Nome do modelo (entra na chave do cache de respostas)
+        retriever: Retriever montado por `carregar_recuperador`
+        fingerprint_indice: Fingerprint do índice (invalida o cache de respostas)
+        classificador: Classificador local da triagem
+        cache_respostas: Cache semântico de respostas
+        executor: Pool das buscas especulativas
+        reranqueador: Reranqueamento dos candidatos da busca (opcional)
+        modo_fundido: Triagem e resposta em uma chamada só ao LLM, depois da
+            busca, para as mensagens que o classificador local não decide
+        limitador_llm: Limite de chamadas ao LLM, compartilhado entre threads
+            (ignorado se houver escalonador)
+        limitador_embeddings: Limite de embeddings das perguntas (idem)
+        escalonador: Escalonador compartilhado do processo; sem ele, é criado
+            um sem fila, só com os limitadores acima
+    """
+
+    def __init__(
+        self,
+        llm_triagem,
+        model_name: str,
+        retriever,
+        fingerprint_indice: str,
+        classificador: ClassificadorTriagem,
+        cache_respostas: CacheSemantico,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limitador_llm: Optional[LimitadorTaxa] = None,
+        limitador_embeddings: Optional[LimitadorTaxa] = None,
+        escalonador: Optional[EscalonadorRequisicoes] = None,
+        reranqueador: Optional[Reranqueador] = None,
+        modo_fundido: bool = MODO_FUNDIDO,
+    ):
+        self.llm_triagem = llm_triagem
+        self.llm_fundido = modelo_json(llm_triagem) if modo_fundido else None
+        self.model_name = model_name
+        self.retriever = retriever
+        self.classificador = classificador
+        self.cache_respostas = cache_respostas
+        self.reranqueador = reranqueador
+        self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="busca-especulativa")
+        self.escalonador = escalonador or EscalonadorRequisicoes(
+            max_concorrentes={},
+            limitadores={"llm": limitador_llm, "embeddings": limitador_embeddings},
+        )
+        # A resposta depende do índice e do modelo que a gerou
+        self.chave_cache_respostas = f"{fingerprint_indice}:{model_name}"
+        self.document_chain = create_rag_chain(llm_triagem, prompt_rag, escalonador=self.escalonador)
+        self.grafo = self._construir_grafo()
+
+    # ----------------------------------------------------------------- triagem
+
+    def _triagem_local(self, mensagem: str) -> Optional[Dict]:
+        resultado_rapido, _ = self.classificador.classificar(mensagem)
+        if resultado_rapido is not None:
+            self.classificador.decisoes_rapidas += 1
+            metricas.contar("triagem_local")
+        return resultado_rapido
+
+    def _concluir_triagem(self, mensagem: str, resultado: Optional[Dict]) -> Dict:
+        if resultado is None:
+            # Fallback: retornar valores padrão
+            return {
+                "decisao": "PEDIR_INFO",
+                "urgencia": "MEDIA",
+                "campos_faltantes": ["contexto específico"]
+            }
+        self.classificador.registrar(mensagem, resultado)
+        return resultado
+
+    def triagem(self, mensagem: str, antes_do_llm: Optional[Callable[[], None]] = None) -> Dict:
+        """Função para realizar triagem da mensagem do usuário
+
+        Casos óbvios são decididos pelo classificador local; só mensagens
+        ambíguas vão para o LLM, e a decisão dele alimenta o classificador.
+
+        Args:
+            mensagem: Mensagem do usuário
+            antes_do_llm: Chamado logo antes da chamada ao LLM (ex.: para
+                iniciar a busca especulativa)
+        """
+        resultado_rapido = self._triagem_local(mensagem)
+        if resultado_rapido is not None:
+            return resultado_rapido
+
+        if antes_do_llm is not None:
+            antes_do_llm()
+        self.classificador.decisoes_llm += 1
+        metricas.contar("triagem_llm")
+        return self._concluir_triagem(mensagem, self.triagem_llm(mensagem))
+
+    async def atriagem(self, mensagem: str, antes_do_llm: Optional[Callable[[], None]] = None) -> Dict:
+        """Versão assíncrona de `triagem`"""
+        resultado_rapido = self._triagem_local(mensagem)
+        if resultado_rapido is not None:
+            return resultado_rapido
+
+        if antes_do_llm is not None:
+            antes_do_llm()
+        self.classificador.decisoes_llm += 1
+        metricas.contar("triagem_llm")
+        return self._concluir_triagem(mensagem, await self.atriagem_llm(mensagem))
+
+    def triagem_llm(self, mensagem: str) -> Optional[Dict]:
+        """Triagem feita pelo LLM (None se a resposta não for um JSON válido)"""
+        prompt = get_triagem_prompt(mensagem)
+
+        # Invocar o modelo
+        with metricas.etapa("llm_triagem"):
+            response = self.escalonador.executar(lambda: self.llm_triagem.invoke(prompt), "llm", "triagem")
+        texto = texto_da_mensagem(response)
+        metricas.registrar_chamada_llm("triagem", prompt, response, texto)
+        return interpretar_triagem(texto)
+
+    async def atriagem_llm(self, mensagem: str) -> Optional[Dict]:
+        """Versão assíncrona de `triagem_llm`"""
+        prompt = get_triagem_prompt(mensagem)
+        with metricas.etapa("llm_triagem"):
+            response = await self.escalonador.aexecutar(lambda: self.llm_triagem.ainvoke(prompt), "llm", "triagem")
+        texto = texto_da_mensagem(response)
+        metricas.registrar_chamada_llm("triagem", prompt, response, texto)
+        return interpretar_triagem(texto)
+
+    # ---------------------------------------------------------------- fundido
+
+    def _mensagens_fundidas(self, mensagem: str, docs: List):
+        mensagens = prompt_fundido.format_messages(input=mensagem, context=format_docs(docs))
+        return mensagens, "\n".join(texto_da_mensagem(m) for m in mensagens)
+
+    @staticmethod
+    def _interpretar_fundida(leitor: LeitorRespostaFundida) -> Optional[Dict]:
+        saida = interpretar_triagem_fundida(leitor.texto)
+        if saida is None and leitor.resposta:
+            # Parte da resposta já foi mostrada: melhor ficar com ela do que repetir em duas etapas
+            saida = {"decisao": "AUTO_RESOLVER", "urgencia": "MEDIA", "campos_faltantes": [], "resposta": leitor.resposta}
+        return saida
+
+    def chamada_fundida(
+        self, mensagem: str, docs: List, ao_receber_token: Optional[Callable[[str], None]] = None
+    ) -> Optional[Dict]:
+        """Triagem e resposta em uma chamada (None se a saída não servir)
+
+        Em streaming, o texto do campo `resposta` vai para o callback à
+        medida que chega.
+        """
+        mensagens, texto_prompt = self._mensagens_fundidas(mensagem, docs)
+        if ao_receber_token is None:
+            with metricas.etapa("llm_fundido"):
+                response = self.escalonador.executar(lambda: self.llm_fundido.invoke(mensagens), "llm", "triagem")
+            texto = texto_da_mensagem(response)
+            metricas.registrar_chamada_llm("fundida", texto_prompt, response, texto)
+            return interpretar_triagem_fundida(texto)
+
+        leitor = LeitorRespostaFundida()
+        resposta = None
+        with metricas.etapa("llm_fundido"), self.escalonador.vez("llm", "triagem"):
+            for chunk in self.llm_fundido.stream(mensagens):
+                resposta = chunk if resposta is None else resposta + chunk
+                novo = leitor.alimentar(texto_da_mensagem(chunk))
+                if novo:
+                    ao_receber_token(novo)
+        metricas.registrar_chamada_llm("fundida", texto_prompt, resposta, leitor.texto)
+        return self._interpretar_fundida(leitor)
+
+    async def achamada_fundida(
+        self, mensagem: str, docs: List, ao_receber_token: Optional[Callable[[str], None]] = None
+    ) -> Optional[Dict]:
+        """Versão assíncrona de `chamada_fundida`"""
+        mensagens, texto_prompt = self._mensagens_fundidas(mensagem, docs)
+        if ao_receber_token is None:
+            with metricas.etapa("llm_fundido"):
+                response = await self.escalonador.aexecutar(
+                    lambda: self.llm_fundido.ainvoke(mensagens), "llm", "triagem"
+                )
+            texto = texto_da_mensagem(response)
+            metricas.registrar_chamada_llm("fundida", texto_prompt, response, texto)
+            return interpretar_triagem_fundida(texto)
+
+        leitor = LeitorRespostaFundida()
+        resposta = None
+        with metricas.etapa("llm_fundido"):
+            async with self.escalonador.avez("llm", "triagem"):
+                async for chunk in self.llm_fundido.astream(mensagens):
+                    resposta = chunk if resposta is None else resposta + chunk
+                    novo = leitor.alimentar(texto_da_mensagem(chunk))
+                    if novo:
+                        ao_receber_token(novo)
+        metricas.registrar_chamada_llm("fundida", texto_prompt, resposta, leitor.texto)
+        return self._interpretar_fundida(leitor)
+
+    def _concluir_fundida(self, mensagem: str, saida: Dict, recuperacao: Dict, docs, estatisticas: Dict) -> AgentState:
+        resposta = saida.pop("resposta")
+        triagem = self._concluir_triagem(mensagem, saida)
+        update: AgentState = {"triagem": triagem}
+        if triagem["decisao"] == "AUTO_RESOLVER":
+            update["resposta_fundida"] = self._avaliar_resposta(resposta, docs, estatisticas, recuperacao)
+        return update
+
+    @staticmethod
+    def _recuperacao_pronta(recuperacao: Dict) -> Future:
+        """Recuperação já feita, no formato da especulativa (o rastro já foi contado)"""
+        futuro: Future = Future()
+        futuro.set_result({**recuperacao, "rastro": metricas.RastroConsulta()})
+        return futuro
+
+    def triagem_fundida(self, mensagem: str, ao_receber_token: Optional[Callable[[str], None]] = None) -> AgentState:
+        """Busca primeiro e uma chamada só para triagem e resposta
+
+        Se a busca não trouxer contexto (ou a resposta vier do cache), ou se
+        a saída do LLM não for um JSON válido, volta às duas etapas: triagem
+        pelo LLM e RAG com a recuperação já feita.
+        """
+        recuperacao = self.recuperar_documentos(mensagem)
+        imediata, docs, estatisticas = self._preparar_resposta(recuperacao)
+        self.classificador.decisoes_llm += 1
+        if imediata is None:
+            metricas.contar("triagem_fundida")
+            try:
+                saida = self.chamada_fundida(mensagem, docs, ao_receber_token)
+            except Exception:
+                saida = None  # as duas etapas tentam de novo e reportam o erro
+            if saida is not None:
+                return self._concluir_fundida(mensagem, saida, recuperacao, docs, estatisticas)
+            metricas.contar("triagem_fundida_falha")
+
+        metricas.contar("triagem_llm")
+        resultado = self._concluir_triagem(mensagem, self.triagem_llm(mensagem))
+        return self._update_triagem(resultado, self._recuperacao_pronta(recuperacao))
+
+    async def atriagem_fundida(
+        self, mensagem: str, ao_receber_token: Optional[Callable[[str], None]] = None
+    ) -> AgentState:
+        """Versão assíncrona de `triagem_fundida`"""
+        recuperacao = await self.arecuperar_documentos(mensagem)
+        imediata, docs, estatisticas = self._preparar_resposta(recuperacao)
+        self.classificador.decisoes_llm += 1
+        if imediata is None:
+            metricas.contar("triagem_fundida")
+            try:
+                saida = await self.achamada_fundida(mensagem, docs, ao_receber_token)
+            except Exception:
+                saida = None
+            if saida is not None:
+                return self._concluir_fundida(mensagem, saida, recuperacao, docs, estatisticas)
+            metricas.contar("triagem_fundida_falha")
+
+        metricas.contar("triagem_llm")
+        resultado = self._concluir_triagem(mensagem, await self.atriagem_llm(mensagem))
+        return self._update_triagem(resultado, self._recuperacao_pronta(recuperacao))
+
+    # --------------------------------------------------------------------- RAG
+
+    def recuperar_documentos(self, pergunta: str) -> Dict:
+        """Embedding da pergunta, consulta ao cache semântico e busca no índice
+
+        O embedding da pergunta é calculado uma vez e serve tanto para o cache
+        quanto para a busca. Não chama o LLM, então pode rodar em paralelo com
+        a triagem.
+
+        Returns:
+            Dicionário com `vetor`, `referencias` (dispositivos citados, que
+            também separam as entradas do cache), `resposta_cache` (ou None),
+            `docs` e `erro`
+        """
+        embeddings = self.retriever.vectorstore.embeddings
+        recuperacao = self._nova_recuperacao(pergunta)
+        try:
+            with metricas.etapa("embedding_pergunta"):
+                recuperacao["vetor"] = self.escalonador.executar(
+                    lambda: embeddings.embed_query(pergunta), "embeddings", "recuperacao", max_tentativas=3
+                )
+        except Exception:
+            pass  # sem cache; a busca abaixo tenta de novo e reporta o erro
+
+        if not self._consultar_cache(recuperacao):
+            self._buscar_documentos(pergunta, recuperacao)
+        return recuperacao
+
+    async def arecuperar_documentos(self, pergunta: str) -> Dict:
+        """Versão assíncrona de `recuperar_documentos` (a busca roda em uma thread)"""
+        embeddings = self.retriever.vectorstore.embeddings
+        recuperacao = self._nova_recuperacao(pergunta)
+        try:
+            with metricas.etapa("embedding_pergunta"):
+                recuperacao["vetor"] = await self.escalonador.aexecutar(
+                    lambda: embeddings.aembed_query(pergunta), "embeddings", "recuperacao", max_tentativas=3
+                )
+        except Exception:
+            pass
+
+        if not self._consultar_cache(recuperacao):
+            await asyncio.to_thread(self._buscar_documentos, pergunta, recuperacao)
+        return recuperacao
+
+    @staticmethod
+    def _nova_recuperacao(pergunta: str) -> Dict:
+        return {
+            "vetor": None,
+            "referencias": busca_lexical.extrair_referencias(pergunta),
+            "resposta_cache": None,
+            "docs": [],
+            "erro": None,
+        }
+
+    def _consultar_cache(self, recuperacao: Dict) -> bool:
+        """Preenche `resposta_cache`; True se a pergunta já foi respondida"""
+        vetor_pergunta = recuperacao["vetor"]
+        if vetor_pergunta is None:
+            return False
+        with metricas.etapa("cache_respostas"):
+            recuperacao["resposta_cache"] = self.cache_respostas.buscar(
+                vetor_pergunta, self.chave_cache_respostas, recuperacao["referencias"]
+            )
+        if recuperacao["resposta_cache"] is not None:
+            metricas.contar("cache_respostas_acerto")
+            return True
+        metricas.contar("cache_respostas_falta")
+        return False
+
+    def _buscar_documentos(self, pergunta: str, recuperacao: Dict) -> None:
+        k = self.retriever.search_kwargs["k"]
+        candidatos = self.reranqueador.candidatos if self.reranqueador is not None else k
+        try:
+            with metricas.etapa("busca"):
+                recuperacao["docs"] = self._buscar(pergunta, recuperacao["vetor"], candidatos)
+        except Exception as e:
+            recuperacao["erro"] = str(e)
+            return
+
+        if self.reranqueador is not None:
+            try:
+                recuperacao["docs"], recuperacao["rerank"] = self.reranqueador.reranquear(
+                    pergunta, recuperacao["docs"], k
+                )
+            except Exception:
+                # Sem reranqueamento, segue a ordem da busca
+                recuperacao["docs"] = recuperacao["docs"][:k]
+
+    def _buscar(self, pergunta: str, vetor_pergunta, k: int) -> List:
+        retriever = self.retriever
+        if BUSCA_HIBRIDA:
+            return retriever.buscar(pergunta, vetor_pergunta, k=k)
+        if vetor_pergunta is not None:
+            return retriever.vectorstore.similarity_search_by_vector(vetor_pergunta, k=k)
+        return retriever.vectorstore.similarity_search(pergunta, k=k)
+
+    def _recuperar_especulativo(self, pergunta: str) -> Dict:
+        """`recuperar_documentos` com rastro próprio, entregue junto do resultado"""
+        with metricas.rastrear() as rastro:
+            recuperacao = self.recuperar_documentos(pergunta)
+        recuperacao["rastro"] = rastro
+        return recuperacao
+
+    async def _arecuperar_especulativo(self, pergunta: str) -> Dict:
+        with metricas.rastrear() as rastro:
+            recuperacao = await self.arecuperar_documentos(pergunta)
+        recuperacao["rastro"] = rastro
+        return recuperacao
+
+    def perguntar_vade_mecum(
+        self,
+        pergunta: str,
+        recuperacao: Optional[Dict] = None,
+        ao_receber_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict:
+        """Função principal para consultar o Vade Mecum
+
+        Args:
+            pergunta: Pergunta do usuário
+            recuperacao: Resultado de `recuperar_documentos` já calculado (ex.:
+                pela busca especulativa durante a triagem)
+            ao_receber_token: Callback para receber a resposta em streaming
+        """
+        if recuperacao is None:
+            recuperacao = self.recuperar_documentos(pergunta)
+
+        imediata, docs_filtrados, estatisticas_contexto = self._preparar_resposta(recuperacao)
+        if imediata is not None:
+            return imediata
+
+        try:
+            answer = self.document_chain({
+                "input": pergunta,
+                "context": docs_filtrados,
+                "ao_receber_token": ao_receber_token
+            })
+            return self._avaliar_resposta(answer, docs_filtrados, estatisticas_contexto, recuperacao)
+        except Exception as e:
+            return self._resposta_erro(e, docs_filtrados)
+
+    async def aperguntar_vade_mecum(
+        self,
+        pergunta: str,
+        recuperacao: Optional[Dict] = None,
+        ao_receber_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict:
+        """Versão assíncrona de `perguntar_vade_mecum`"""
+        if recuperacao is None:
+            recuperacao = await self.arecuperar_documentos(pergunta)
+
+        imediata, docs_filtrados, estatisticas_contexto = self._preparar_resposta(recuperacao)
+        if imediata is not None:
+            return imediata
+
+        try:
+            answer = await self.document_chain.ainvoke({
+                "input": pergunta,
+                "context": docs_filtrados,
+                "ao_receber_token": ao_receber_token
+            })
+            return self._avaliar_resposta(answer, docs_filtrados, estatisticas_contexto, recuperacao)
+        except Exception as e:
+            return self._resposta_erro(e, docs_filtrados)
+
+    def _preparar_resposta(self, recuperacao: Dict):
+        """(resposta pronta ou None, docs do contexto, estatísticas do empacotamento)"""
+        if recuperacao["resposta_cache"] is not None:
+            return {**recuperacao["resposta_cache"], "do_cache": True}, [], {}
+
+        if recuperacao["erro"] is not None:
+            return {
+                "answer": f"Erro ao buscar informações: {recuperacao['erro']}",
+                "citacoes": [],
+                "contexto_encontrado": False
+            }, [], {}
+
+        docs_relacionados = recuperacao["docs"]
+
+        if not docs_relacionados or len(docs_relacionados) == 0:
+            return {
+                "answer": "Não encontrei informações específicas nas Leis Orgânicas de Curitiba para sua pergunta. Por favor, tente reformular ou ser mais específico. Exemplos: 'Qual o artigo sobre zoneamento urbano?' ou 'O que diz a lei orgânica sobre transporte público?'",
+                "citacoes": [],
+                "contexto_encontrado": False
+                }, [], {}
+        # Filtrar documentos muito curtos ou irrelevantes
+        docs_filtrados = [doc for doc in docs_relacionados if doc.page_content and len(doc.page_content.strip()) > 50]
+
+        if not docs_filtrados:
+            return {
+                "answer": "Não encontrei informações relevantes nas Leis Orgânicas de Curitiba para sua pergunta. Por favor, tente reformular ou ser mais específico.",
+                "citacoes": [],
+                "contexto_encontrado": False
+            }, [], {}
+
+        # Unir chunks sobrepostos, tirar duplicatas e caber no orçamento de tokens
+        with metricas.etapa("empacotamento"):
+            contexto = empacotamento.empacotar(docs_filtrados)
+        metricas.contar("tokens_contexto", contexto["tokens_finais"])
+        metricas.contar("tokens_contexto_economizados", contexto["tokens_economizados"])
+        estatisticas = {k: v for k, v in contexto.items() if k != "docs"}
+        if "rerank" in recuperacao:
+            estatisticas["rerank"] = recuperacao["rerank"]
+        return None, contexto["docs"], estatisticas
+
+    def _avaliar_resposta(self, answer, docs_filtrados, estatisticas_contexto: Dict, recuperacao: Dict) -> Dict:
+        """Valida o texto gerado e guarda no cache as respostas boas"""
+        txt = (answer or "").strip()
+
+        # Verificar se a resposta é válida
+        if not txt or len(txt) < 30:
+            return {
+                "answer": "Não consegui gerar uma resposta adequada. Por favor, tente reformular sua pergunta de forma mais específica.",
+                "citacoes": docs_filtrados,
+                "contexto_encontrado": False
+            }
+
+        if "não encontrei" in txt.lower() or "não sei" in txt.lower() or "não tenho" in txt.lower():
+            return {
+                "answer": "Não encontrei informações específicas nas Leis Orgânicas de Curitiba para sua pergunta. Por favor, tente reformular ou ser mais específico.",
+                "citacoes": docs_filtrados,
+                "contexto_encontrado": False
+            }
+
+        resultado = {
+            "answer": txt,
+            "citacoes": docs_filtrados,
+            "contexto_encontrado": True,
+            "contexto": estatisticas_contexto
+        }
+        if recuperacao["vetor"] is not None:
+            self.cache_respostas.guardar(
+                recuperacao["vetor"], resultado, self.chave_cache_respostas, recuperacao["referencias"]
+            )
+        return resultado
+
+    @staticmethod
+    def _resposta_erro(erro: Exception, docs_filtrados) -> Dict:
+        return {
+            "answer": f"Erro ao processar a resposta: {str(erro)}. Por favor, tente novamente.",
+            "citacoes": docs_filtrados,
+            "contexto_encontrado": False
+        }
+
+    # ------------------------------------------------------------ nós do grafo
+
+    def node_triagem(self, state: AgentState) -> AgentState:
+        mensagem = state["mensagem"]
+        if self.llm_fundido is not None:
+            resultado_rapido = self._triagem_local(mensagem)
+            if resultado_rapido is not None:
+                return {"triagem": resultado_rapido}
+            return self.triagem_fundida(mensagem, state.get("ao_receber_token"))
+
+        especulacao = {}
+
+        def especular():
+            # Como o `ensure_future` do caminho assíncrono, a busca leva o contexto
+            # (sessão do escalonador, rastro das métricas) para a thread do executor
+            contexto = contextvars.copy_context()
+            especulacao["futuro"] = self.executor.submit(contexto.run, self._recuperar_especulativo, mensagem)
+
+        resultado = self.triagem(mensagem, antes_do_llm=especular if MODO_ESPECULATIVO else None)
+        return self._update_triagem(resultado, especulacao.get("futuro"))
+
+    async def anode_triagem(self, state: AgentState) -> AgentState:
+        mensagem = state["mensagem"]
+        if self.llm_fundido is not None:
+            resultado_rapido = self._triagem_local(mensagem)
+            if resultado_rapido is not None:
+                return {"triagem": resultado_rapido}
+            return await self.atriagem_fundida(mensagem, state.get("ao_receber_token"))
+
+        especulacao = {}
+
+        def especular():
+            especulacao["futuro"] = asyncio.ensure_future(self._arecuperar_especulativo(mensagem))
+
+        resultado = await self.atriagem(mensagem, antes_do_llm=especular if MODO_ESPECULATIVO else None)
+        return self._update_triagem(resultado, especulacao.get("futuro"))
+
+    @staticmethod
+    def _update_triagem(resultado: Dict, futuro) -> AgentState:
+        update: AgentState = {"triagem": resultado}
+        if futuro is not None:
+            if resultado["decisao"] == "AUTO_RESOLVER":
+                update["recuperacao_especulativa"] = futuro
+            else:
+                futuro.cancel()  # descartada; se já estiver rodando, o resultado é ignorado
+        return update
+
+    def node_auto_resolver(self, state: AgentState) -> AgentState:
+        if "resposta_fundida" in state:
+            return self._update_auto_resolver(state["resposta_fundida"])
+        futuro = state.get("recuperacao_especulativa")
+        recuperacao = None
+        if futuro is not None:
+            with metricas.etapa("espera_especulativa"):
+                recuperacao = futuro.result()
+            self._incorporar_rastro(recuperacao)
+        resposta_RAG = self.perguntar_vade_mecum(state["mensagem"], recuperacao, state.get("ao_receber_token"))
+        return self._update_auto_resolver(resposta_RAG)
+
+    async def anode_auto_resolver(self, state: AgentState) -> AgentState:
+        if "resposta_fundida" in state:
+            return self._update_auto_resolver(state["resposta_fundida"])
+        futuro = state.get("recuperacao_especulativa")
+        recuperacao = None
+        if futuro is not None:
+            with metricas.etapa("espera_especulativa"):
+                recuperacao = await (futuro if isinstance(futuro, asyncio.Future) else asyncio.wrap_future(futuro))
+            self._incorporar_rastro(recuperacao)
+        resposta_RAG = await self.aperguntar_vade_mecum(state["mensagem"], recuperacao, state.get("ao_receber_token"))
+        return self._update_auto_resolver(resposta_RAG)
+
+    @staticmethod
+    def _incorporar_rastro(recuperacao: Dict) -> None:
+        """Etapas da busca especulativa entram no rastro do nó que a consumiu"""
+        rastro = metricas.rastro_atual()
+        if rastro is not None:
+            rastro.incorporar(recuperacao["rastro"])
+
+    @staticmethod
+    def _update_auto_resolver(resposta_RAG: Dict) -> AgentState:
+        update: AgentState = {
+          "resposta": resposta_RAG["answer"],
+            "citacoes": resposta_RAG.get("citacoes", []),
+          "rag_sucesso": resposta_RAG["contexto_encontrado"],
+          "resposta_do_cache": resposta_RAG.get("do_cache", False),
+          "contexto": resposta_RAG.get("contexto", {})
+      }
+        if resposta_RAG["contexto_encontrado"]:
+            update["acao_final"] = "AUTO_RESOLVER"
+        return update
+
+    def node_pedir_info(self, state: AgentState) -> AgentState:
+        faltantes = state["triagem"].get("campos_faltantes", [])
+        detalhe = ", ".join(faltantes) if faltantes else "tema e contexto específico"
+        return {
+            "resposta": f"Para avançar, preciso que você detalhe: {detalhe}",
+          "citacoes": [],
+          "acao_final": "PEDIR_INFO"
+      }
+
+    def node_abrir_chamado(self, state: AgentState) -> AgentState:
+        triagem_data = state["triagem"]
+        return {
+            "resposta": f"Abrindo chamado com urgência {triagem_data['urgencia']}. Descrição: {state['mensagem'][:140]}",
+          "citacoes": [],
+          "acao_final": "ABRIR_CHAMADO"
+      }
+
+    # Funções de decisão
+    @staticmethod
+    def decidir_pos_triagem(state: AgentState) -> str:
+        decisao = state["triagem"]["decisao"]
+
+        if decisao == "AUTO_RESOLVER": return "auto_resolver"
+        if decisao == "PEDIR_INFO": return "pedir_info"
+        if decisao == "ABRIR_CHAMADO": return "abrir_chamado"
+        return "pedir_info"
+
+    @staticmethod
+    def decidir_pos_auto_resolver(state: AgentState) -> str:
+        if state["rag_sucesso"]:
+            return "end"
+
+        state_da_pergunta = (state["mensagem"] or "").lower()
+        if any(k in state_da_pergunta for k in KEYWORDS_ABRIR_TICKET):
+            return "abrir_chamado"
+        return "pedir_info"
+
+    @staticmethod
+    def _cronometrar(nome: str, node: Callable[[AgentState], AgentState]) -> Callable[[AgentState], AgentState]:
+        """Envolve um nó para registrar seu tempo (s) em `tempos` e suas etapas em `metricas`"""
+        def node_cronometrado(state: AgentState) -> AgentState:
+            inicio = time.perf_counter()
+            with metricas.rastrear() as rastro:
+                update = node(state)
+            segundos = time.perf_counter() - inicio
+            metricas.observar_no(nome, segundos)
+            update["tempos"] = {nome: segundos}
+            update["metricas"] = {nome: rastro.resumo()}
+            return update
+        return node_cronometrado
+
+    @staticmethod
+    def _acronometrar(nome: str, node: Callable[[AgentState], Awaitable[AgentState]]):
+        """Versão assíncrona de `_cronometrar`"""
+        async def node_cronometrado(state: AgentState) -> AgentState:
+            inicio = time.perf_counter()
+            with metricas.rastrear() as rastro:
+                update = await node(state)
+            segundos = time.perf_counter() - inicio
+            metricas.observar_no(nome, segundos)
+            update["tempos"] = {nome: segundos}
+            update["metricas"] = {nome: rastro.resumo()}
+            return update
+        return node_cronometrado
+
+    def _no(self, nome: str, node, anode=None) -> RunnableLambda:
+        """Nó com versão síncrona (invoke) e assíncrona (ainvoke)
+
+        Nós sem versão assíncrona não chamam modelos e rodam direto no loop.
+        """
+        if anode is None:
+            async def anode(state: AgentState) -> AgentState:
+                return node(state)
+        return RunnableLambda(self._cronometrar(nome, node), afunc=self._acronometrar(nome, anode), name=nome)
+
+    def _construir_grafo(self):
+        """Cria o workflow"""
+        workflow = StateGraph(AgentState)
+
+        workflow.add_node("triagem", self._no("triagem", self.node_triagem, self.anode_triagem))
+        workflow.add_node("auto_resolver", self._no("auto_resolver", self.node_auto_resolver, self.anode_auto_resolver))
+        workflow.add_node("pedir_info", self._no("pedir_info", self.node_pedir_info))
+        workflow.add_node("abrir_chamado", self._no("abrir_chamado", self.node_abrir_chamado))
+
+        workflow.add_edge(START, "triagem")
+        workflow.add_conditional_edges("triagem", self.decidir_pos_triagem, {
+            "auto_resolver": "auto_resolver",
+            "pedir_info": "pedir_info",
+            "abrir_chamado": "abrir_chamado"
+        })
+
+        workflow.add_conditional_edges("auto_resolver", self.decidir_pos_auto_resolver, {
+            "pedir_info": "pedir_info",
+            "abrir_chamado": "abrir_chamado",
+            "end": END
+        })
+
+        workflow.add_edge("pedir_info", END)
+        workflow.add_edge("abrir_chamado", END)
+
+        return workflow.compile()
+
+    def consultar(
+        self,
+        mensagem: str,
+        ao_receber_token: Optional[Callable[[str], None]] = None,
+        sessao: Optional[str] = None,
+    ) -> AgentState:
+        """Executa o grafo para uma mensagem
+
+        Args:
+            sessao: Identificador de quem pergunta; o escalonador alterna a
+                vez entre sessões diferentes
+        """
+        estado: AgentState = {"mensagem": mensagem}
+        if ao_receber_token is not None:
+            estado["ao_receber_token"] = ao_receber_token
+        token = definir_sessao(sessao) if sessao is not None else None
+        try:
+            return self.grafo.invoke(estado)
+        finally:
+            if token is not None:
+                restaurar_sessao(token)
+
+    async def aconsultar(
+        self,
+        mensagem: str,
+        ao_receber_token: Optional[Callable[[str], None]] = None,
+        sessao: Optional[str] = None,
+    ) -> AgentState:
+        """Versão assíncrona de `consultar` (`ainvoke` do grafo)"""
+        estado: AgentState = {"mensagem": mensagem}
+        if ao_receber_token is not None:
+            estado["ao_receber_token"] = ao_receber_token
+        token = definir_sessao(sessao) if sessao is not None else None
+        try:
+            return await self.grafo.ainvoke(estado)
+        finally:
+            if token is not None:
+                restaurar_sessao(token)
+
+def backend_do_ambiente() -> Tuple[bool, Optional[str], Optional[str]]:
+    """(usar Gemini?, GOOGLE_API_KEY, GEMINI_BASE_URL) conforme o ambiente
+
+    O Gemini é usado quando há uma chave válida e o pacote está instalado;
+    senão, o Ollama e os embeddings locais.
+    """
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    gemini_base_url = os.getenv("GEMINI_BASE_URL")
+    chave_valida = bool(google_api_key) and google_api_key != "sua_chave_api_aqui" and len(google_api_key.strip()) > 10
+    return chave_valida and GEMINI_AVAILABLE, google_api_key, gemini_base_url
+
+class OllamaIndisponivel(RuntimeError):
+    """Sem Gemini e sem servidor Ollama respondendo"""
+
+class OllamaSemModelos(RuntimeError):
+    """O Ollama responde, mas não tem nenhum modelo instalado"""
+
+class SistemaConsulta(NamedTuple):
+    """O motor e o que a interface mostra sobre ele"""
+    motor: "MotorConsulta"
+    recuperador: Dict
+    configuracoes: List[ConfiguracaoLLM]
+
+def montar_sistema(
+    usar_gemini: bool,
+    google_api_key: Optional[str] = None,
+    gemini_base_url: Optional[str] = None,
+    avisar: Callable[[str], None] = print,
+    progresso: Optional[Callable[[float, str], None]] = None,
+    etapa: Callable[[str], None] = lambda _: None,
+    usar_ollama_local: bool = True,
+    llm_req_por_minuto: Optional[float] = None,
+    workers_especulativos: int = 4,
+    escalonador: Optional[EscalonadorRequisicoes] = None,
+) -> SistemaConsulta:
+    """Monta modelos, embeddings, índice e motor, medindo cada componente
+
+    Cada peça entra no perfil da partida (`partida.medir`) e é anunciada
+    em `etapa` antes de começar.
+
+    Args:
+        usar_gemini: Gemini (senão, Ollama e embeddings locais)
+        avisar: Destino das mensagens da indexação
+        progresso: Andamento da indexação (fração, texto)
+        etapa: Recebe o nome de cada passo da montagem
+        usar_ollama_local: Consultar o Ollama local (sem Gemini ou com ele
+            no roteamento); desligado onde não há Ollama (Streamlit Cloud)
+        llm_req_por_minuto: Limite de chamadas ao LLM (padrão LLM_REQ_POR_MINUTO;
+            no Gemini, 15/min do plano gratuito se nenhum for configurado)
+        workers_especulativos: Threads para as buscas especulativas
+        escalonador: Escalonador já existente (senão, `criar_escalonador`)
+
+    Raises:
+        OllamaIndisponivel, OllamaSemModelos: sem Gemini e sem Ollama utilizável
+    """
+    modelos_ollama = None
+    if usar_ollama_local and (not usar_gemini or "ollama" in backends_roteamento()):
+        etapa("Verificando o Ollama...")
+        with partida.medir("ollama"):
+            disponivel, modelos_ollama = verificar_ollama()
+        if not usar_gemini and not disponivel:
+            raise OllamaIndisponivel(f"Sem GOOGLE_API_KEY válida e Ollama indisponível em {OLLAMA_URL}")
+        if not usar_gemini and not (modelos_ollama or {}).get("models"):
+            raise OllamaSemModelos(f"Nenhum modelo instalado no Ollama em {OLLAMA_URL}")
+
+    etapa("Criando os clientes do LLM...")
+    with partida.medir("llm"):
+        configuracoes = configuracoes_llm(usar_gemini, google_api_key, gemini_base_url, modelos_ollama)
+        registros: Dict[str, RegistroModelos] = {}
+        _, llm_triagem, model_name = modelos_llm(configuracoes, lambda p: registros.setdefault(p, RegistroModelos()))
+    roteado = len(configuracoes) > 1
+
+    etapa("Configurando os embeddings...")
+    with partida.medir("embeddings"):
+        embeddings, modelo_embeddings = criar_embeddings(usar_gemini, google_api_key, gemini_base_url)
+
+    etapa("Carregando o índice...")
+    with partida.medir("indice"):
+        recuperador = carregar_recuperador(
+            encontrar_pdfs(), embeddings, modelo_embeddings, usar_gemini, avisar=avisar, progresso=progresso
+        )
+
+    etapa("Carregando o reranqueador...")
+    with partida.medir("reranqueador"):
+        reranqueador = criar_reranqueador()
+
+    etapa("Montando o grafo...")
+    with partida.medir("motor"):
+        motor = MotorConsulta(
+            llm_triagem,
+            model_name,
+            recuperador["retriever"],
+            recuperador["fingerprint"],
+            ClassificadorTriagem(palavras_chamado=KEYWORDS_ABRIR_TICKET),
+            CacheSemantico(),
+            executor=ThreadPoolExecutor(max_workers=workers_especulativos, thread_name_prefix="busca-especulativa"),
+            # Com roteamento, o limite de cada backend fica no roteador (sem cota, vai para o próximo)
+            escalonador=escalonador or criar_escalonador(usar_gemini, 0 if roteado else llm_req_por_minuto),
+            reranqueador=reranqueador,
+        )
+    return SistemaConsulta(motor, recuperador, configuracoes)
+
+def montar_motor(
+    avisar: Callable[[str], None] = print,
+    llm_req_por_minuto: Optional[float] = None,
+    workers_especulativos: int = 4,
+    escalonador: Optional[EscalonadorRequisicoes] = None,
+) -> MotorConsulta:
+    """Monta o motor a partir do ambiente, sem Streamlit (uso em lote/scripts)
+
+    Usa o Gemini quando há `GOOGLE_API_KEY` válida; senão, o Ollama local.
+    Com `LLM_ROTEAMENTO`, usa todos os backends listados que responderem.
+    Os argumentos são os de `montar_sistema`.
+    """
+    usar_gemini, google_api_key, gemini_base_url = backend_do_ambiente()
+    return montar_sistema(
+        usar_gemini,
+        google_api_key,
+        gemini_base_url,
+        avisar=avisar,
+        llm_req_por_minuto=llm_req_por_minuto,
+        workers_especulativos=workers_especulativos,
+        escalonador=escalonador,
+    ).motor
@@ -0,0 +1,210 @@
+"""Embeddings locais em ONNX Runtime, com o modelo quantizado em int8
+
+O caminho local padrão (`HuggingFaceEmbeddings`) roda o all-MiniLM-L6-v2
+em PyTorch com pesos float32, e só o import do torch já pesa na partida.
+Aqui o mesmo modelo roda no ONNX Runtime, na versão int8 com o grafo
+otimizado publicada no próprio repositório do modelo
+(`onnx/model_quint8_avx2.onnx`), com o tokenizador rápido do `tokenizers`
+e pooling/normalização em numpy. Sem torch.
+
+- `EMBEDDINGS_THREADS` fixa as threads de CPU do ONNX Runtime (0 = todas);
+- `embed_documents` agrupa os textos por tamanho, para gastar menos com
+  padding;
+- perguntas que chegam ao mesmo tempo (várias sessões ou o lote) são
+  embutidas juntas em um lote só (`AgrupadorConsultas`): as que chegam
+  enquanto um lote roda formam o próximo, e `EMBEDDINGS_ESPERA_LOTE_MS`
+  pode segurar a primeira por alguns milissegundos à espera de outras.
+
+Os vetores diferem um pouco dos do PyTorch, então o índice deste motor é
+separado (o nome do modelo inclui o arquivo ONNX).
+`ferramentas/paridade_embeddings.py` compara os dois (cosseno, ranking e
+velocidade).
+
+Uso: `EMBEDDINGS_LOCAL_MOTOR=onnx` (requer `pip install -r requirements-onnx.txt`).
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Motor dos embeddings locais: "torch" (HuggingFaceEmbeddings) ou "onnx"
+EMBEDDINGS_LOCAL_MOTOR = os.getenv("EMBEDDINGS_LOCAL_MOTOR", "torch")
+# Arquivo do modelo no repositório do Hugging Face
+EMBEDDINGS_ONNX_ARQUIVO = os.getenv("EMBEDDINGS_ONNX_ARQUIVO", "onnx/model_quint8_avx2.onnx")
+# Diretório local com `model.onnx` e `tokenizer.json` (sem download)
+EMBEDDINGS_ONNX_DIR = os.getenv("EMBEDDINGS_ONNX_DIR")
+EMBEDDINGS_THREADS = int(os.getenv("EMBEDDINGS_THREADS", "0"))
+EMBEDDINGS_ONNX_LOTE = int(os.getenv("EMBEDDINGS_ONNX_LOTE", "32"))
+# 0 = sem espera: uma pergunta sozinha não paga nada pelo agrupamento
+EMBEDDINGS_ESPERA_LOTE_MS = float(os.getenv("EMBEDDINGS_ESPERA_LOTE_MS", "0"))
+
+# max_seq_length do all-MiniLM-L6-v2
+MAX_TOKENS = 256
+
+
+class AgrupadorConsultas:
+    """Junta textos enviados por várias threads em lotes para uma função
+
+    Uma thread própria pega o primeiro texto da fila, junta os que já
+    estiverem esperando (aguardando até `espera` segundos por mais, sem
+    passar de `max_lote`) e processa todos de uma vez.
+
+    Args:
+        funcao_lote: Recebe uma lista de textos e devolve uma matriz, uma
+            linha por texto
+        max_lote: Textos por lote
+        espera: Segundos que o primeiro texto aguarda por outros
+    """
+
+    def __init__(
+        self,
+        funcao_lote: Callable[[List[str]], np.ndarray],
+        max_lote: int = EMBEDDINGS_ONNX_LOTE,
+        espera: float = EMBEDDINGS_ESPERA_LOTE_MS / 1000,
+    ):
+        self.funcao_lote = funcao_lote
+        self.max_lote = max(1, max_lote)
+        self.espera = espera
+        self.lotes = 0
+        self.textos = 0
+        self._fila: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enviar(self, texto: str) -> Future:
+        """Enfileira o texto; o Future recebe o vetor"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._trabalhar, name="agrupador-embeddings", daemon=True)
+                self._thread.start()
+        futuro: Future = Future()
+        self._fila.put((texto, futuro))
+        return futuro
+
+    def _trabalhar(self) -> None:
+        while True:
+            lote = [self._fila.get()]
+            limite = time.monotonic() + self.espera
+            while len(lote) < self.max_lote:
+                try:
+                    restante = limite - time.monotonic()
+                    lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            lote = [(texto, futuro) for texto, futuro in lote if futuro.set_running_or_notify_cancel()]
+            if not lote:
+                continue
+            try:
+                vetores = self.funcao_lote([texto for texto, _ in lote])
+            except Exception as e:
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+                continue
+            self.lotes += 1
+            self.textos += len(lote)
+            for (_, futuro), vetor in zip(lote, vetores):
+                futuro.set_result(vetor)
+
+
+class EmbeddingsONNX(Embeddings):
+    """Sentence embeddings (mean pooling + normalização) em ONNX Runtime
+
+    Args:
+        caminho_modelo: Arquivo .onnx do encoder
+        caminho_tokenizer: `tokenizer.json` do modelo
+        threads: Threads de CPU por inferência (0 = padrão do ONNX Runtime)
+        tamanho_lote: Textos por inferência, na indexação e no agrupador
+        espera_lote: Segundos que uma pergunta espera por outras no agrupador
+    """
+
+    def __init__(
+        self,
+        caminho_modelo: Path,
+        caminho_tokenizer: Path,
+        threads: int = EMBEDDINGS_THREADS,
+        tamanho_lote: int = EMBEDDINGS_ONNX_LOTE,
+        espera_lote: float = EMBEDDINGS_ESPERA_LOTE_MS / 1000,
+        max_tokens: int = MAX_TOKENS,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        opcoes = ort.SessionOptions()
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opcoes.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opcoes.inter_op_num_threads = 1
+        if threads > 0:
+            opcoes.intra_op_num_threads = threads
+        self.sessao = ort.InferenceSession(str(caminho_modelo), opcoes, providers=["CPUExecutionProvider"])
+        self.entradas = {entrada.name for entrada in self.sessao.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(caminho_tokenizer))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.agrupador = AgrupadorConsultas(self._embutir_lote, self.tamanho_lote, espera_lote)
+
+    def _embutir_lote(self, textos: List[str]) -> np.ndarray:
+        codificados = self.tokenizer.encode_batch(textos)
+        comprimento = max(len(c.ids) for c in codificados)
+        ids = np.zeros((len(textos), comprimento), dtype=np.int64)
+        mascara = np.zeros((len(textos), comprimento), dtype=np.int64)
+        for i, codificado in enumerate(codificados):
+            ids[i, :len(codificado.ids)] = codificado.ids
+            mascara[i, :len(codificado.ids)] = 1
+        entradas = {"input_ids": ids, "attention_mask": mascara}
+        if "token_type_ids" in self.entradas:
+            entradas["token_type_ids"] = np.zeros_like(ids)
+
+        estados = self.sessao.run(None, entradas)[0]
+        pesos = mascara[..., None].astype(np.float32)
+        vetores = (estados * pesos).sum(axis=1) / np.clip(pesos.sum(axis=1), 1e-9, None)
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        return (vetores / np.clip(normas, 1e-12, None)).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Textos de tamanho parecido no mesmo lote: menos padding
+        ordem = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        resultado: List[Optional[np.ndarray]] = [None] * len(texts)
+        for inicio in range(0, len(ordem), self.tamanho_lote):
+            posicoes = ordem[inicio:inicio + self.tamanho_lote]
+            for posicao, vetor in zip(posicoes, self._embutir_lote([texts[p] for p in posicoes])):
+                resultado[posicao] = vetor
+        return np.vstack(resultado).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.agrupador.enviar(text).result().tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vetor = await asyncio.wrap_future(self.agrupador.enviar(text))
+        return vetor.tolist()
+
+
+def arquivos_modelo(modelo: str, arquivo: str = EMBEDDINGS_ONNX_ARQUIVO) -> Tuple[Path, Path]:
+    """Caminhos do .onnx e do tokenizer.json (baixados do Hugging Face se preciso)"""
+    if EMBEDDINGS_ONNX_DIR:
+        pasta = Path(EMBEDDINGS_ONNX_DIR)
+        return pasta / "model.onnx", pasta / "tokenizer.json"
+    from huggingface_hub import hf_hub_download
+
+    return Path(hf_hub_download(modelo, arquivo)), Path(hf_hub_download(modelo, "tokenizer.json"))
+
+
+def carregar_embeddings_onnx(modelo: str, arquivo: str = EMBEDDINGS_ONNX_ARQUIVO) -> Tuple[EmbeddingsONNX, str]:
+    """Embeddings ONNX do `modelo` e o nome que identifica seus vetores
+
+    Returns:
+        Tupla (embeddings, nome do modelo), como `criar_embeddings`
+    """
+    caminho_modelo, caminho_tokenizer = arquivos_modelo(modelo, arquivo)
+    origem = f"{Path(EMBEDDINGS_ONNX_DIR).name}/model.onnx" if EMBEDDINGS_ONNX_DIR else arquivo
+    return EmbeddingsONNX(caminho_modelo, caminho_tokenizer), f"{modelo}:{origem}"
@@ -0,0 +1,159 @@
+"""Empacotamento do contexto antes do prompt RAG
+
+Os chunks recuperados vão quase inteiros para o prompt, e o tamanho do
+prompt manda na latência e no custo do LLM. Com o overlap de 200
+caracteres, chunks vizinhos repetem o mesmo texto. Aqui, entre a busca e
+o `create_rag_chain`:
+
+1. chunks da mesma página que se sobrepõem são unidos em um só trecho;
+2. trechos quase iguais (Jaccard de shingles de palavras) são descartados,
+   ficando o mais relevante;
+3. os trechos entram em ordem de relevância até o orçamento de tokens.
+
+Os tokens são estimados por caracteres (~4 por token em português), o
+que basta para comparar antes/depois e respeitar o orçamento.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Set
+
+from langchain_core.documents import Document
+
+# Orçamento de tokens do contexto (0 = sem limite)
+CONTEXTO_MAX_TOKENS = int(os.getenv("CONTEXTO_MAX_TOKENS", "2000"))
+# Similaridade (Jaccard de shingles) a partir da qual dois trechos são duplicatas
+CONTEXTO_LIMIAR_DUPLICATA = float(os.getenv("CONTEXTO_LIMIAR_DUPLICATA", "0.8"))
+
+CARACTERES_POR_TOKEN = 4
+# Sobreposição mínima (caracteres) para unir dois chunks
+SOBREPOSICAO_MINIMA = 30
+TAMANHO_SHINGLE = 5
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa de tokens pelo número de caracteres"""
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+def _sobreposicao(a: str, b: str, maximo: int = 1000) -> int:
+    """Tamanho do maior sufixo de `a` que é prefixo de `b`"""
+    for tamanho in range(min(len(a), len(b), maximo), SOBREPOSICAO_MINIMA - 1, -1):
+        if a.endswith(b[:tamanho]):
+            return tamanho
+    return 0
+
+
+def _shingles(texto: str) -> Set[str]:
+    palavras = re.findall(r"\w+", texto.lower())
+    if len(palavras) < TAMANHO_SHINGLE:
+        return {" ".join(palavras)}
+    return {" ".join(palavras[i:i + TAMANHO_SHINGLE]) for i in range(len(palavras) - TAMANHO_SHINGLE + 1)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _mesma_pagina(a: Document, b: Document) -> bool:
+    return (
+        a.metadata.get("source") == b.metadata.get("source")
+        and a.metadata.get("page") == b.metadata.get("page")
+    )
+
+
+def _unir_sobrepostos(docs: Sequence[Document]) -> List[Document]:
+    """Une chunks da mesma página cujo fim de um é o começo do outro
+
+    O trecho unido fica na posição (relevância) do melhor dos dois.
+    """
+    trechos: List[Document] = []
+    for doc in docs:
+        texto = doc.page_content.strip()
+        for i, existente in enumerate(trechos):
+            if not _mesma_pagina(existente, doc):
+                continue
+            atual = existente.page_content
+            if texto in atual:
+                break
+            if atual in texto:
+                trechos[i] = Document(page_content=texto, metadata=doc.metadata)
+                break
+            depois = _sobreposicao(atual, texto)
+            if depois:
+                trechos[i] = Document(page_content=atual + texto[depois:], metadata=existente.metadata)
+                break
+            antes = _sobreposicao(texto, atual)
+            if antes:
+                trechos[i] = Document(page_content=texto + atual[antes:], metadata=doc.metadata)
+                break
+        else:
+            trechos.append(Document(page_content=texto, metadata=doc.metadata))
+    return trechos
+
+
+def _remover_duplicatas(docs: Sequence[Document], limiar: float) -> List[Document]:
+    """Descarta trechos quase iguais a um mais relevante já escolhido"""
+    escolhidos: List[Document] = []
+    assinaturas: List[Set[str]] = []
+    for doc in docs:
+        assinatura = _shingles(doc.page_content)
+        if any(_jaccard(assinatura, outra) >= limiar for outra in assinaturas):
+            continue
+        escolhidos.append(doc)
+        assinaturas.append(assinatura)
+    return escolhidos
+
+
+def _cortar(doc: Document, max_tokens: int) -> Document:
+    """Corta um trecho no orçamento, no último fim de frase/linha possível"""
+    limite = max_tokens * CARACTERES_POR_TOKEN
+    texto = doc.page_content[:limite]
+    corte = max(texto.rfind(". "), texto.rfind("\n"))
+    if corte > limite // 2:
+        texto = texto[:corte + 1]
+    return Document(page_content=texto.rstrip(), metadata=doc.metadata)
+
+
+def empacotar(
+    docs: Sequence[Document],
+    max_tokens: Optional[int] = None,
+    limiar_duplicata: Optional[float] = None,
+) -> Dict:
+    """Une, deduplica e corta os chunks no orçamento de tokens
+
+    Args:
+        docs: Chunks em ordem de relevância (o primeiro é o mais relevante)
+        max_tokens: Orçamento do contexto (padrão CONTEXTO_MAX_TOKENS; 0 = sem limite)
+        limiar_duplicata: Jaccard mínimo para descartar um trecho
+
+    Returns:
+        Dicionário com `docs` (trechos empacotados, em ordem de relevância),
+        `tokens_originais`, `tokens_finais` e `tokens_economizados`
+    """
+    max_tokens = CONTEXTO_MAX_TOKENS if max_tokens is None else max_tokens
+    limiar_duplicata = CONTEXTO_LIMIAR_DUPLICATA if limiar_duplicata is None else limiar_duplicata
+
+    tokens_originais = sum(estimar_tokens(d.page_content) for d in docs)
+    trechos = _remover_duplicatas(_unir_sobrepostos(docs), limiar_duplicata)
+
+    if max_tokens > 0:
+        cabem: List[Document] = []
+        usados = 0
+        for doc in trechos:
+            tokens = estimar_tokens(doc.page_content)
+            if usados + tokens <= max_tokens:
+                cabem.append(doc)
+                usados += tokens
+            elif not cabem:
+                # O mais relevante entra sempre, mesmo que cortado
+                cabem.append(_cortar(doc, max_tokens))
+                usados = estimar_tokens(cabem[0].page_content)
+        trechos = cabem
+
+    tokens_finais = sum(estimar_tokens(d.page_content) for d in trechos)
+    return {
+        "docs": trechos,
+        "tokens_originais": tokens_originais,
+        "tokens_finais": tokens_finais,
+        "tokens_economizados": tokens_originais - tokens_finais,
+    }
@@ -0,0 +1,287 @@
+"""Escalonador de chamadas aos modelos, compartilhado por todas as sessões
+
+Sem ele, cada sessão do Streamlit (e cada thread do lote) chama o Gemini
+ou o Ollama por conta própria: com vários usuários, todos disputam às
+cegas os 15 req/min do plano gratuito ou o único Ollama local, e parte
+das chamadas volta com 429.
+
+O escalonador é um controle de admissão único no processo. Cada chamada
+pede a vez informando o recurso (`llm` ou `embeddings`) e a prioridade:
+
+- prioridade: recuperação (embedding da pergunta) passa na frente da
+  triagem, que passa na frente da geração da resposta;
+- justiça: dentro de uma prioridade, as sessões são atendidas em rodízio,
+  então uma sessão com muitas chamadas não trava as outras;
+- limite de taxa (token bucket) e de chamadas simultâneas por recurso:
+  um embedding calculado na CPU do processo não espera a vaga do Ollama,
+  e a busca especulativa corre junto com a triagem;
+- 429/timeout voltam para a fila com backoff, sem ocupar vaga.
+
+A chamada em si roda em quem pediu a vez: `executar` (threads, API
+síncrona) ou `aexecutar` (corrotinas, usado pelo `ainvoke` do grafo).
+Profundidade das filas, chamadas em andamento e tempo de espera vão para
+as métricas do processo.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Iterator, Optional, TypeVar
+
+import metricas
+from limites import LimitadorTaxa, eh_erro_transitorio
+
+T = TypeVar("T")
+
+# Chamadas simultâneas ao LLM
+ESCALONADOR_MAX_CONCORRENTES = int(os.getenv("ESCALONADOR_MAX_CONCORRENTES", "4"))
+
+# Menor número = atendida antes
+PRIORIDADES = {"recuperacao": 0, "triagem": 1, "geracao": 2}
+
+_sessao_atual: ContextVar[str] = ContextVar("sessao_escalonador", default="padrao")
+
+
+def definir_sessao(sessao: str):
+    """Identifica a sessão das chamadas feitas neste contexto (para o rodízio)
+
+    Returns:
+        Token para `restaurar_sessao`
+    """
+    return _sessao_atual.set(sessao)
+
+
+def restaurar_sessao(token) -> None:
+    _sessao_atual.reset(token)
+
+
+@dataclass
+class _Pedido:
+    recurso: str
+    prioridade: str
+    sessao: str
+    vez: Future = field(default_factory=Future)
+    criado: float = field(default_factory=time.monotonic)
+
+
+class EscalonadorRequisicoes:
+    """Fila justa com prioridades, limite de taxa por recurso e de concorrência
+
+    Args:
+        req_por_minuto: Limite por recurso, ex.: {"llm": 15, "embeddings": 100}
+            (recursos ausentes ou com 0 não têm limite de taxa)
+        max_concorrentes: Chamadas em andamento ao mesmo tempo por recurso,
+            ex.: {"llm": 1, "embeddings": 4} (recursos ausentes ou com 0 não
+            têm limite; padrão: ESCALONADOR_MAX_CONCORRENTES só no LLM)
+        max_tentativas: Tentativas por chamada em erros transitórios
+        limitadores: Limitadores já existentes por recurso, no lugar de
+            `req_por_minuto` (ex.: para manter a cota que já vinha sendo usada)
+    """
+
+    def __init__(
+        self,
+        req_por_minuto: Optional[Dict[str, float]] = None,
+        max_concorrentes: Optional[Dict[str, int]] = None,
+        max_tentativas: int = 6,
+        espera_base: float = 2.0,
+        espera_maxima: float = 60.0,
+        limitadores: Optional[Dict[str, Optional[LimitadorTaxa]]] = None,
+    ):
+        self.limitadores = {
+            recurso: LimitadorTaxa(taxa)
+            for recurso, taxa in (req_por_minuto or {}).items() if taxa > 0
+        }
+        self.limitadores.update({r: l for r, l in (limitadores or {}).items() if l is not None})
+        if max_concorrentes is None:
+            max_concorrentes = {"llm": ESCALONADOR_MAX_CONCORRENTES}
+        self.max_concorrentes = {recurso: n for recurso, n in max_concorrentes.items() if n > 0}
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.em_andamento: Dict[str, int] = {}
+        self.concluidas = 0
+        self._filas: Dict[str, "OrderedDict[str, Deque[_Pedido]]"] = {p: OrderedDict() for p in PRIORIDADES}
+        self._lock = threading.Lock()
+        self._temporizador: Optional[threading.Timer] = None
+
+    # ------------------------------------------------------------------ fila
+
+    def _enfileirar(self, recurso: str, prioridade: str) -> _Pedido:
+        if prioridade not in PRIORIDADES:
+            raise ValueError(f"Prioridade desconhecida: {prioridade} (use {', '.join(PRIORIDADES)})")
+        pedido = _Pedido(recurso, prioridade, _sessao_atual.get())
+        with self._lock:
+            self._filas[prioridade].setdefault(pedido.sessao, deque()).append(pedido)
+        self._despachar()
+        return pedido
+
+    def _proximo(self) -> Optional[_Pedido]:
+        """Próximo pedido liberado; agenda um novo despacho se só falta taxa
+
+        Chamado com o lock. Percorre as prioridades em ordem e, em cada uma,
+        as sessões em rodízio; pedidos de um recurso sem vaga ou sem token
+        são pulados (outro recurso pode estar livre).
+        """
+        menor_espera = None
+        bloqueados = set()
+        for prioridade in PRIORIDADES:
+            filas = self._filas[prioridade]
+            for sessao in list(filas):
+                fila = filas[sessao]
+                # Pedidos cancelados enquanto esperavam saem aqui
+                while fila and fila[0].vez.cancelled():
+                    fila.popleft()
+                if not fila:
+                    del filas[sessao]
+                    continue
+                pedido = fila[0]
+                if pedido.recurso in bloqueados:
+                    continue
+                # Sem vaga, nem consome token: o recurso volta a andar em `_liberar`
+                if self.em_andamento.get(pedido.recurso, 0) >= self.max_concorrentes.get(pedido.recurso, float("inf")):
+                    bloqueados.add(pedido.recurso)
+                    continue
+                limitador = self.limitadores.get(pedido.recurso)
+                espera = limitador.tentar_adquirir() if limitador is not None else 0.0
+                if espera > 0:
+                    bloqueados.add(pedido.recurso)
+                    menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+                    continue
+                fila.popleft()
+                # A sessão atendida vai para o fim do rodízio
+                del filas[sessao]
+                if fila:
+                    filas[sessao] = fila
+                return pedido
+        if menor_espera is not None and self._temporizador is None:
+            self._temporizador = threading.Timer(menor_espera, self._ao_expirar)
+            self._temporizador.daemon = True
+            self._temporizador.start()
+        return None
+
+    def _ao_expirar(self) -> None:
+        with self._lock:
+            self._temporizador = None
+        self._despachar()
+
+    def _despachar(self) -> None:
+        liberados = []
+        with self._lock:
+            while True:
+                pedido = self._proximo()
+                if pedido is None:
+                    break
+                if not pedido.vez.set_running_or_notify_cancel():
+                    continue
+                self.em_andamento[pedido.recurso] = self.em_andamento.get(pedido.recurso, 0) + 1
+                liberados.append(pedido)
+            self._publicar_metricas()
+        for pedido in liberados:
+            metricas.REGISTRO.observar(
+                "escalonador_espera_segundos", time.monotonic() - pedido.criado,
+                ajuda="Tempo na fila do escalonador", prioridade=pedido.prioridade,
+            )
+            pedido.vez.set_result(None)
+
+    def _liberar(self, recurso: str) -> None:
+        with self._lock:
+            self.em_andamento[recurso] -= 1
+            self.concluidas += 1
+        self._despachar()
+
+    def _publicar_metricas(self) -> None:
+        """Chamado com o lock"""
+        for prioridade, filas in self._filas.items():
+            metricas.REGISTRO.definir(
+                "escalonador_fila", sum(len(f) for f in filas.values()),
+                ajuda="Chamadas aguardando vez no escalonador", prioridade=prioridade,
+            )
+        for recurso, em_andamento in self.em_andamento.items():
+            metricas.REGISTRO.definir(
+                "escalonador_em_andamento", em_andamento, ajuda="Chamadas em andamento nos backends", recurso=recurso
+            )
+
+    def estado(self) -> Dict:
+        """Profundidade das filas e chamadas em andamento (para a interface)"""
+        with self._lock:
+            return {
+                "fila": {p: sum(len(f) for f in filas.values()) for p, filas in self._filas.items()},
+                "sessoes": len({s for filas in self._filas.values() for s in filas}),
+                "em_andamento": sum(self.em_andamento.values()),
+                "em_andamento_por_recurso": dict(self.em_andamento),
+                "concluidas": self.concluidas,
+            }
+
+    # ---------------------------------------------------------------- vez
+
+    @contextmanager
+    def vez(self, recurso: str, prioridade: str) -> Iterator[None]:
+        """Bloqueia a thread até a chamada ser liberada; a vaga volta na saída"""
+        self._enfileirar(recurso, prioridade).vez.result()
+        try:
+            yield
+        finally:
+            self._liberar(recurso)
+
+    @asynccontextmanager
+    async def avez(self, recurso: str, prioridade: str):
+        """Versão assíncrona de `vez` (funciona em qualquer event loop)"""
+        pedido = self._enfileirar(recurso, prioridade)
+        try:
+            await asyncio.wrap_future(pedido.vez)
+        except asyncio.CancelledError:
+            # Cancelada na fila sai no próximo despacho; se a vez já tinha saído, devolver a vaga
+            if not pedido.vez.cancel():
+                self._liberar(recurso)
+            raise
+        try:
+            yield
+        finally:
+            self._liberar(recurso)
+
+    def _espera_retentativa(self, tentativa: int) -> float:
+        espera = min(self.espera_maxima, self.espera_base * (2 ** tentativa))
+        return espera * (0.5 + random.random() / 2)
+
+    def executar(
+        self, funcao: Callable[[], T], recurso: str, prioridade: str, max_tentativas: Optional[int] = None
+    ) -> T:
+        """Executa `funcao` na thread atual quando chegar a vez, repetindo erros transitórios"""
+        max_tentativas = max_tentativas or self.max_tentativas
+        for tentativa in range(max_tentativas):
+            try:
+                with self.vez(recurso, prioridade):
+                    return funcao()
+            except Exception as e:
+                if tentativa == max_tentativas - 1 or not eh_erro_transitorio(e):
+                    raise
+                metricas.REGISTRO.incrementar("escalonador_retentativas", recurso=recurso)
+            # A espera do backoff acontece fora da vaga
+            time.sleep(self._espera_retentativa(tentativa))
+        raise RuntimeError("max_tentativas deve ser maior que zero")
+
+    async def aexecutar(
+        self,
+        funcao: Callable[[], Awaitable[T]],
+        recurso: str,
+        prioridade: str,
+        max_tentativas: Optional[int] = None,
+    ) -> T:
+        """Versão assíncrona de `executar`: `funcao` devolve a corrotina da chamada"""
+        max_tentativas = max_tentativas or self.max_tentativas
+        for tentativa in range(max_tentativas):
+            try:
+                async with self.avez(recurso, prioridade):
+                    return await funcao()
+            except Exception as e:
+                if tentativa == max_tentativas - 1 or not eh_erro_transitorio(e):
+                    raise
+                metricas.REGISTRO.incrementar("escalonador_retentativas", recurso=recurso)
+            await asyncio.sleep(self._espera_retentativa(tentativa))
+        raise RuntimeError("max_tentativas deve ser maior que zero")
@@ -0,0 +1,269 @@
+"""Tipos de índice FAISS para corpora grandes
+
+O índice salvo por `indice.py` é sempre plano (busca exata): é ele que
+recebe as atualizações incrementais e guarda os vetores originais. Para
+corpora grandes, a busca pode usar um índice aproximado derivado dele:
+
+- `flat`: o próprio índice plano (padrão);
+- `hnsw`: grafo HNSW, busca sublinear sem treino, ~4·M bytes extras por vetor;
+- `ivfpq`: listas invertidas + product quantization, treinado com uma
+  amostra dos vetores; ocupa uma fração da memória do plano.
+
+O índice derivado é gravado ao lado do plano e refeito quando o
+fingerprint do corpus ou os parâmetros mudam. As posições dos vetores são
+as mesmas do plano, então docstore e índice lexical continuam valendo.
+Recall e latência são medidos uma vez, na construção, e gravados no JSON
+do índice: a partida só os lê, sem copiar os vetores do plano (mmap) para
+a memória.
+"""
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+INDICE_TIPO = os.getenv("INDICE_TIPO", "flat")
+INDICE_HNSW_M = int(os.getenv("INDICE_HNSW_M", "32"))
+INDICE_HNSW_EF_BUSCA = int(os.getenv("INDICE_HNSW_EF_BUSCA", "64"))
+# Listas do IVF (0 = automático, ~4·√n)
+INDICE_IVF_NLIST = int(os.getenv("INDICE_IVF_NLIST", "0"))
+INDICE_IVF_NPROBE = int(os.getenv("INDICE_IVF_NPROBE", "8"))
+# Subquantizadores do PQ (0 = automático, dimensão/8)
+INDICE_PQ_M = int(os.getenv("INDICE_PQ_M", "0"))
+# Vetores usados no treino do IVF-PQ
+INDICE_AMOSTRA_TREINO = int(os.getenv("INDICE_AMOSTRA_TREINO", "20000"))
+
+TIPOS_INDICE = ("flat", "hnsw", "ivfpq")
+
+
+def assinatura_tipo(tipo: str = INDICE_TIPO) -> str:
+    """Tipo + parâmetros de construção (o que muda o índice derivado)"""
+    if tipo == "hnsw":
+        return f"hnsw-m{INDICE_HNSW_M}"
+    if tipo == "ivfpq":
+        return f"ivfpq-l{INDICE_IVF_NLIST}-m{INDICE_PQ_M}"
+    return "flat"
+
+
+def vetores_do_indice(index: faiss.Index) -> np.ndarray:
+    """Vetores originais de um índice plano, na ordem das posições"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _parametros_ivfpq(n: int, dimensao: int) -> Optional[Dict[str, int]]:
+    """nlist, m e bits por código compatíveis com o tamanho do corpus
+
+    O k-means do IVF e dos subquantizadores precisa de pelo menos um ponto
+    de treino por centróide; corpora pequenos demais ficam sem IVF-PQ.
+    """
+    nlist = INDICE_IVF_NLIST or max(1, int(4 * math.sqrt(n)))
+    nlist = max(1, min(nlist, n // 39 or 1))
+    m = INDICE_PQ_M or max(1, dimensao // 8)
+    while dimensao % m:
+        m -= 1
+    bits = min(8, int(math.log2(n // 39))) if n >= 39 * 16 else 0
+    if bits < 4:
+        return None
+    return {"nlist": nlist, "m": m, "bits": bits}
+
+
+def construir_indice(vetores: np.ndarray, tipo: str = INDICE_TIPO) -> faiss.Index:
+    """Constrói um índice do tipo pedido com os vetores dados (distância L2)
+
+    Raises:
+        ValueError: tipo desconhecido ou corpus pequeno demais para o tipo
+    """
+    vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+    n, dimensao = vetores.shape
+    if tipo == "flat":
+        index = faiss.IndexFlatL2(dimensao)
+    elif tipo == "hnsw":
+        index = faiss.IndexHNSWFlat(dimensao, INDICE_HNSW_M)
+    elif tipo == "ivfpq":
+        parametros = _parametros_ivfpq(n, dimensao)
+        if parametros is None:
+            raise ValueError(f"Corpus pequeno demais para IVF-PQ ({n} vetores)")
+        quantizador = faiss.IndexFlatL2(dimensao)
+        index = faiss.IndexIVFPQ(quantizador, dimensao, parametros["nlist"], parametros["m"], parametros["bits"])
+        rng = np.random.default_rng(0)
+        amostra = vetores[rng.permutation(n)[:INDICE_AMOSTRA_TREINO]]
+        index.train(amostra)
+    else:
+        raise ValueError(f"Tipo de índice desconhecido: {tipo} (use {', '.join(TIPOS_INDICE)})")
+    index.add(vetores)
+    configurar_busca(index)
+    return index
+
+
+def configurar_busca(index: faiss.Index) -> None:
+    """Parâmetros de busca (não são gravados junto com o índice)"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = INDICE_HNSW_EF_BUSCA
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = INDICE_IVF_NPROBE
+
+
+def aplicar_tipo(
+    vectorstore: FAISS,
+    diretorio: Path,
+    fingerprint: str,
+    tipo: str = INDICE_TIPO,
+    avisar: Callable[[str], None] = print,
+) -> Tuple[FAISS, Dict]:
+    """Troca o índice plano do vectorstore pelo índice do tipo configurado
+
+    O índice derivado é lido de `diretorio` se estiver em dia com o
+    fingerprint; senão é construído, medido contra o plano e gravado. Em
+    caso de erro, fica o plano.
+
+    Returns:
+        Tupla (vectorstore, estatísticas do índice em uso)
+    """
+    if tipo == "flat":
+        return vectorstore, estatisticas_plano(vectorstore.index)
+
+    assinatura = assinatura_tipo(tipo)
+    caminho = diretorio / f"index.{assinatura}.faiss"
+    caminho_info = diretorio / f"index.{assinatura}.json"
+
+    index = None
+    estatisticas = None
+    try:
+        with open(caminho_info, encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("fingerprint") == fingerprint:
+            index = faiss.read_index(str(caminho))
+            configurar_busca(index)
+            estatisticas = info.get("estatisticas")
+    except (OSError, RuntimeError, json.JSONDecodeError):
+        index = None
+
+    if index is None or index.ntotal != vectorstore.index.ntotal or estatisticas is None:
+        vetores = vetores_do_indice(vectorstore.index)
+        try:
+            index = construir_indice(vetores, tipo)
+        except ValueError as e:
+            avisar(f"{e}; usando índice plano")
+            return vectorstore, estatisticas_plano(vectorstore.index)
+        estatisticas = medir_indice(index, vetores=vetores, plano=vectorstore.index)
+        try:
+            faiss.write_index(index, str(caminho))
+            with open(caminho_info, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "tipo": assinatura, "estatisticas": estatisticas}, f)
+        except (OSError, RuntimeError) as e:
+            avisar(f"Não foi possível salvar o índice {assinatura}: {e}")
+
+    vectorstore = FAISS(
+        embedding_function=vectorstore.embeddings,
+        index=index,
+        docstore=vectorstore.docstore,
+        index_to_docstore_id=vectorstore.index_to_docstore_id,
+    )
+    return vectorstore, estatisticas
+
+
+def bytes_por_vetor(index: faiss.Index) -> float:
+    """Tamanho serializado do índice dividido pelo número de vetores"""
+    if index.ntotal == 0:
+        return 0.0
+    return len(faiss.serialize_index(index)) / index.ntotal
+
+
+def _consultas_amostra(index: faiss.Index, quantidade: int, vetores: Optional[np.ndarray] = None) -> np.ndarray:
+    """Consultas sintéticas: vetores do corpus com um pouco de ruído"""
+    if vetores is None:
+        vetores = vetores_do_indice(index) if isinstance(index, faiss.IndexFlat) else None
+    rng = np.random.default_rng(1)
+    if vetores is None or len(vetores) == 0:
+        return rng.standard_normal((quantidade, index.d)).astype(np.float32)
+    escolhidos = vetores[rng.integers(0, len(vetores), quantidade)]
+    ruido = rng.standard_normal(escolhidos.shape).astype(np.float32) * float(np.std(vetores)) * 0.5
+    return np.ascontiguousarray(escolhidos + ruido, dtype=np.float32)
+
+
+def _tempos_busca(index: faiss.Index, consultas: np.ndarray, k: int) -> List[float]:
+    """Latência (ms) de cada consulta, uma por vez como na aplicação"""
+    tempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        index.search(consulta[None, :], k)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def estatisticas_plano(index: faiss.Index) -> Dict:
+    """Estatísticas do índice plano sem tocar nos vetores (busca exata, 4 bytes por dimensão)"""
+    return {"tipo": type(index).__name__, "bytes_por_vetor": 4.0 * index.d, "p95_ms": None, "recall": 1.0}
+
+
+def medir_indice(
+    index: faiss.Index,
+    consultas: int = 50,
+    k: int = 5,
+    vetores: Optional[np.ndarray] = None,
+    plano: Optional[faiss.Index] = None,
+) -> Dict:
+    """Memória por vetor, latência p95 de busca e, com o `plano`, recall@k contra a busca exata
+
+    Lê os vetores e serializa o índice: é para a construção, não para a partida.
+    """
+    amostra = _consultas_amostra(index, consultas, vetores)
+    tempos = _tempos_busca(index, amostra, k) if index.ntotal else [0.0]
+    recall = None
+    if plano is not None and index.ntotal:
+        _, exatos = plano.search(amostra, k)
+        _, encontrados = index.search(amostra, k)
+        recall = sum(len(set(e) & set(a)) for e, a in zip(exatos, encontrados)) / exatos.size
+    return {
+        "tipo": type(index).__name__,
+        "bytes_por_vetor": bytes_por_vetor(index),
+        "p95_ms": float(np.percentile(tempos, 95)),
+        "recall": recall,
+    }
+
+
+def relatorio_recall(
+    vetores: np.ndarray,
+    tipos=TIPOS_INDICE,
+    k: int = 5,
+    consultas: int = 200,
+) -> List[Dict]:
+    """Recall@k e latência de cada tipo contra a busca exata
+
+    Returns:
+        Uma linha por tipo com `tipo`, `recall`, `p50_ms`, `p95_ms`,
+        `bytes_por_vetor` e `construcao_s` (ou `erro`)
+    """
+    vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+    plano = construir_indice(vetores, "flat")
+    amostra = _consultas_amostra(plano, consultas, vetores)
+    _, exatos = plano.search(amostra, k)
+
+    linhas = []
+    for tipo in tipos:
+        inicio = time.perf_counter()
+        try:
+            index = plano if tipo == "flat" else construir_indice(vetores, tipo)
+        except ValueError as e:
+            linhas.append({"tipo": assinatura_tipo(tipo), "erro": str(e)})
+            continue
+        construcao = time.perf_counter() - inicio
+        _, encontrados = index.search(amostra, k)
+        acertos = sum(len(set(e) & set(a)) for e, a in zip(exatos, encontrados))
+        tempos = _tempos_busca(index, amostra, k)
+        linhas.append({
+            "tipo": assinatura_tipo(tipo),
+            "recall": acertos / exatos.size,
+            "p50_ms": float(np.percentile(tempos, 50)),
+            "p95_ms": float(np.percentile(tempos, 95)),
+            "bytes_por_vetor": bytes_por_vetor(index),
+            "construcao_s": construcao,
+        })
+    return linhas
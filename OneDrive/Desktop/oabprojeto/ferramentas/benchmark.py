@@ -0,0 +1,566 @@
+"""Benchmark de ingestão, busca e latência ponta a ponta do grafo
+
+Mede, para o PDF da Lei Orgânica e para corpora sintéticos N vezes
+maiores (cópias do PDF com artigos renumerados e palavras trocadas):
+
+- leitura + divisão em chunks (páginas/s, chunks/s);
+- throughput de embeddings pelo agendador (textos/s);
+- construção dos índices FAISS e lexical;
+- latência das buscas (p50/p95/p99) e recall@k do conjunto ouro
+  (`perguntas_ouro.jsonl`: pergunta -> artigos que a respondem);
+- com reranqueamento: recall@N, latência do reranqueamento e tokens do
+  contexto antes/depois;
+- latência do grafo inteiro (triagem → RAG), total e por nó, e chamadas
+  ao LLM por mensagem (`--modo-fundido` compara com a chamada única);
+- as regras locais da triagem com mensagens de decisão conhecida (None =
+  vai para o LLM): frases vagas que citam artigo e palavras de exceção em
+  perguntas válidas não podem virar PEDIR_INFO/ABRIR_CHAMADO sem o LLM;
+- o cache semântico de respostas com perguntas que só diferem no
+  dispositivo ("artigo 45" / "artigo 46"), com o mesmo embedding (o pior
+  caso): nenhuma pode receber a resposta da outra;
+- o mesmo grafo atrás do escalonador do Ollama (`criar_escalonador(False)`,
+  uma geração por vez), com uma sessão e com `--sessoes-grafo` sessões
+  perguntando ao mesmo tempo: mostra se o embedding da pergunta e a busca
+  especulativa esperam a vaga do LLM.
+
+LLM e embeddings são os substitutos determinísticos de `substitutos.py`
+(com latência simulada opcional), então os números medem o código do
+projeto e não a rede. O resultado vai para um JSON com chaves ordenadas,
+para comparar execuções com `diff`.
+
+Uso:
+    python ferramentas/benchmark.py
+    python ferramentas/benchmark.py --escalas 1,5,20 --tipos flat,hnsw --saida benchmark.json
+    python ferramentas/benchmark.py --latencia-llm 0.8 --latencia-embeddings 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pymupdf
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import busca_lexical  # noqa: E402
+import fabrica_indice  # noqa: E402
+import ingestao  # noqa: E402
+from agendador_embeddings import AgendadorEmbeddings  # noqa: E402
+from busca_lexical import IndiceLexical, RecuperadorHibrido  # noqa: E402
+from cache_respostas import CacheSemantico  # noqa: E402
+from consulta import (  # noqa: E402
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    KEYWORDS_ABRIR_TICKET,
+    MotorConsulta,
+    criar_escalonador,
+    encontrar_pdfs,
+)
+from reranqueamento import Reranqueador  # noqa: E402
+from substitutos import EmbeddingsHash, LLMDeterministico, PontuadorSobreposicao  # noqa: E402
+from triagem_rapida import ClassificadorTriagem  # noqa: E402
+
+ARQUIVO_OURO = Path(__file__).parent / "perguntas_ouro.jsonl"
+
+# Mensagens extras do grafo, para passar também por pedir_info e abrir_chamado
+MENSAGENS_EXTRAS = (
+    "preciso de ajuda",
+    "Quero abrir chamado para liberação de acesso especial",
+    "Quem substitui o Prefeito quando ele viaja?",
+)
+
+RE_NUMERO_ARTIGO = re.compile(r"(Art\.?\s*)(\d+)")
+
+# (mensagem, decisão local esperada; None = vai para o LLM)
+CASOS_TRIAGEM = (
+    ("Tenho uma dúvida sobre o artigo 45 da lei orgânica", "AUTO_RESOLVER"),
+    ("Preciso de ajuda para entender o art. 12, § 2º", "AUTO_RESOLVER"),
+    ("Uma pergunta: o que diz o art. 5?", "AUTO_RESOLVER"),
+    ("Qual o artigo sobre aprovação do plano diretor?", "AUTO_RESOLVER"),
+    ("Qual a regra de exceção ao concurso público no art. 30?", "AUTO_RESOLVER"),
+    ("Art. 45", "AUTO_RESOLVER"),
+    ("Quero abrir chamado para liberação de acesso especial", "ABRIR_CHAMADO"),
+    ("Preciso de liberação de acesso especial ao sistema", None),
+    ("quero saber sobre leis", None),
+    ("preciso de ajuda", "PEDIR_INFO"),
+    ("me ajuda", "PEDIR_INFO"),
+)
+
+# (pergunta guardada, pergunta nova, deve sair do cache?)
+PARES_CACHE = (
+    ("O que diz o artigo 45?", "O que diz o artigo 46?", False),
+    ("O que diz o § 2º do art. 10?", "O que diz o § 3º do art. 10?", False),
+    ("O que diz o art. 12, inciso II?", "O que diz o art. 12, inciso III?", False),
+    ("Qual o artigo sobre zoneamento urbano?", "O que diz o artigo 45?", False),
+    ("O que diz o artigo 45?", "o que diz o art. 45", True),
+    ("artigo sobre zoneamento urbano", "qual o artigo sobre o zoneamento urbano?", True),
+)
+
+
+def percentis(valores: Sequence[float]) -> Dict[str, float]:
+    """n, média e p50/p95/p99 de uma lista de latências"""
+    if not valores:
+        return {"n": 0}
+    return {
+        "n": len(valores),
+        "media": float(np.mean(valores)),
+        "p50": float(np.percentile(valores, 50)),
+        "p95": float(np.percentile(valores, 95)),
+        "p99": float(np.percentile(valores, 99)),
+    }
+
+
+def _arredondar(valor):
+    """4 casas decimais, para o JSON não mudar por ruído irrelevante"""
+    if isinstance(valor, float):
+        return round(valor, 4)
+    if isinstance(valor, dict):
+        return {k: _arredondar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_arredondar(v) for v in valor]
+    return valor
+
+
+def ler_ouro(caminho: Path = ARQUIVO_OURO) -> List[Dict]:
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip() and not linha.startswith("#")]
+
+
+# ------------------------------------------------------------------ corpus
+
+def _variar_texto(texto: str, copia: int, rng: random.Random, vocabulario: List[str]) -> str:
+    """Artigos renumerados (+1000 por cópia) e ~3% das palavras trocadas"""
+    texto = RE_NUMERO_ARTIGO.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + 1000 * copia}", texto)
+    linhas = []
+    for linha in texto.split("\n"):
+        palavras = linha.split(" ")
+        for i in range(len(palavras)):
+            if rng.random() < 0.03:
+                palavras[i] = rng.choice(vocabulario)
+        linhas.append(" ".join(palavras))
+    return "\n".join(linhas)
+
+
+def corpus_sintetico(pdf: Path, fator: int, destino: Path) -> List[Path]:
+    """O PDF original mais `fator - 1` cópias variadas, gravadas em `destino`
+
+    As cópias não repetem o texto (o agendador deduplica textos iguais, o
+    que esconderia o custo real dos embeddings) e têm numeração de artigos
+    própria, então o conjunto ouro continua apontando só para o original.
+    """
+    if fator <= 1:
+        return [pdf]
+    with pymupdf.open(pdf) as original:
+        paginas = [pagina.get_text() for pagina in original]
+    vocabulario = sorted({p for texto in paginas for p in texto.split() if p.isalpha() and len(p) > 3})
+
+    pdfs = [pdf]
+    for copia in range(1, fator):
+        caminho = destino / f"sintetico_{fator:03d}_{copia:03d}.pdf"
+        if not caminho.exists():
+            rng = random.Random(copia)
+            with pymupdf.open() as documento:
+                for texto in paginas:
+                    # Fonte pequena: a página inteira cabe sem quebrar linhas
+                    documento.new_page().insert_text((36, 36), _variar_texto(texto, copia, rng, vocabulario), fontsize=6)
+                documento.save(caminho)
+        pdfs.append(caminho)
+    return pdfs
+
+
+# ------------------------------------------------------------------ etapas
+
+def medir_ingestao(pdfs: List[Path], estrategia: str, workers: int):
+    inicio = time.perf_counter()
+    resultado = ingestao.processar_pdfs(
+        pdfs, CHUNK_SIZE, CHUNK_OVERLAP, workers=workers, avisar=lambda _: None, estrategia=estrategia
+    )
+    segundos = time.perf_counter() - inicio
+    paginas = sum(p for p, _ in resultado.values())
+    chunks = [c for _, lista in resultado.values() for c in lista]
+    return {
+        "arquivos": len(pdfs),
+        "paginas": paginas,
+        "chunks": len(chunks),
+        "segundos": segundos,
+        "paginas_por_s": paginas / segundos if segundos else 0.0,
+        "chunks_por_s": len(chunks) / segundos if segundos else 0.0,
+    }, chunks
+
+
+def medir_embeddings(embeddings, textos: List[str], concorrencia: int, tamanho_lote: int):
+    agendador = AgendadorEmbeddings(
+        embeddings, "benchmark", tamanho_lote=tamanho_lote, concorrencia=concorrencia, checkpoint=False
+    )
+    inicio = time.perf_counter()
+    vetores = agendador.embutir(textos)
+    segundos = time.perf_counter() - inicio
+    return {
+        "textos": len(textos),
+        "segundos": segundos,
+        "textos_por_s": len(textos) / segundos if segundos else 0.0,
+        "concorrencia": concorrencia,
+        "tamanho_lote": tamanho_lote,
+    }, vetores
+
+
+def construir_base(chunks, vetores: np.ndarray, embeddings):
+    """Vectorstore plano + índice lexical, como o app monta"""
+    ids = [f"bench-{i:07d}" for i in range(len(chunks))]
+    inicio = time.perf_counter()
+    pares = list(zip([c.page_content for c in chunks], vetores.tolist()))
+    vectorstore = FAISS.from_embeddings(pares, embeddings, metadatas=[c.metadata for c in chunks], ids=ids)
+    faiss_s = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    lexical = IndiceLexical.construir(ids, chunks)
+    lexical_s = time.perf_counter() - inicio
+    return vectorstore, lexical, {"faiss_plano_s": faiss_s, "lexical_s": lexical_s}
+
+
+def consultas_sinteticas(chunks, quantidade: int) -> List[str]:
+    """Começos de chunks sorteados, usados como perguntas"""
+    rng = random.Random(0)
+    escolhidos = [rng.choice(chunks).page_content for _ in range(quantidade)]
+    return [" ".join(texto.split()[:12]) for texto in escolhidos]
+
+
+def medir_consultas(retriever: RecuperadorHibrido, perguntas: List[str]) -> Dict:
+    """Latência (ms) do embedding da pergunta, da busca vetorial e da busca híbrida"""
+    embedding, vetorial, hibrida = [], [], []
+    k = retriever.search_kwargs["k"]
+    for pergunta in perguntas:
+        inicio = time.perf_counter()
+        vetor = retriever.vectorstore.embeddings.embed_query(pergunta)
+        embedding.append((time.perf_counter() - inicio) * 1000)
+
+        inicio = time.perf_counter()
+        retriever.vectorstore.index.search(np.asarray([vetor], dtype=np.float32), k)
+        vetorial.append((time.perf_counter() - inicio) * 1000)
+
+        inicio = time.perf_counter()
+        retriever.buscar(pergunta, vetor)
+        hibrida.append((time.perf_counter() - inicio) * 1000)
+    return {"embedding_ms": percentis(embedding), "vetorial_ms": percentis(vetorial), "hibrida_ms": percentis(hibrida)}
+
+
+def _esperados(retriever: RecuperadorHibrido, lexical: IndiceLexical, item: Dict) -> set:
+    """Textos dos chunks dos artigos que respondem a pergunta"""
+    docstore = retriever.vectorstore.docstore
+    ids = retriever.vectorstore.index_to_docstore_id
+    return {
+        docstore.search(ids[p]).page_content
+        for artigo in item["artigos"]
+        for p in lexical.dispositivos.get(f"art:{int(artigo)}", [])
+    }
+
+
+def _recall(posicoes: Dict, k: int) -> Dict:
+    encontrados = [p for p in posicoes.values() if p is not None]
+    return {
+        "k": k,
+        "recall": len(encontrados) / len(posicoes) if posicoes else 0.0,
+        "mrr": float(np.mean([1 / p if p else 0.0 for p in posicoes.values()])) if posicoes else 0.0,
+        "posicoes": posicoes,
+    }
+
+
+def recall_ouro(retriever: RecuperadorHibrido, lexical: IndiceLexical, ouro: List[Dict]) -> Dict:
+    """recall@k e MRR: acerto é um chunk do artigo esperado entre os k primeiros"""
+    posicoes = {}
+    for item in ouro:
+        esperados = _esperados(retriever, lexical, item)
+        docs = retriever.buscar(item["pergunta"])
+        posicoes[item["id"]] = next((i + 1 for i, doc in enumerate(docs) if doc.page_content in esperados), None)
+    return _recall(posicoes, retriever.search_kwargs["k"])
+
+
+def medir_rerank(
+    retriever: RecuperadorHibrido, lexical: IndiceLexical, ouro: List[Dict], reranqueador: Reranqueador
+) -> Dict:
+    """recall@N com reranqueamento, latência do reranqueamento e tokens antes/depois
+
+    Duas passadas: a primeira pontua tudo, a segunda sai do cache.
+    """
+    k = retriever.search_kwargs["k"]
+    resultado = {"candidatos": reranqueador.candidatos}
+    for passada in ("sem_cache", "com_cache"):
+        posicoes, latencias, antes, depois = {}, [], [], []
+        for item in ouro:
+            candidatos = retriever.buscar(item["pergunta"], k=reranqueador.candidatos)
+            docs, estatisticas = reranqueador.reranquear(item["pergunta"], candidatos, k)
+            esperados = _esperados(retriever, lexical, item)
+            posicoes[item["id"]] = next((i + 1 for i, doc in enumerate(docs) if doc.page_content in esperados), None)
+            latencias.append(estatisticas["ms"])
+            antes.append(estatisticas["tokens_antes"])
+            depois.append(estatisticas["tokens_depois"])
+        resultado[passada] = {"rerank_ms": percentis(latencias)}
+    resultado["recall_ouro"] = _recall(posicoes, reranqueador.top_n)
+    resultado["tokens_contexto"] = {
+        "antes": float(np.mean(antes)) if antes else 0.0,
+        "depois": float(np.mean(depois)) if depois else 0.0,
+    }
+    return resultado
+
+
+def medir_grafo(motor: MotorConsulta, mensagens: List[str], repeticoes: int, sessoes: int = 1) -> Dict:
+    """Latência do grafo por mensagem (ms), total e por nó, chamadas ao LLM e as ações finais
+
+    Com `sessoes` > 1, as mensagens são divididas entre sessões que
+    perguntam ao mesmo tempo (cada uma em sequência).
+    """
+    totais, por_no, acoes, chamadas = [], {}, Counter(), []
+
+    def consultar(mensagem: str, sessao: str) -> None:
+        inicio = time.perf_counter()
+        estado = motor.consultar(mensagem, sessao=sessao)
+        totais.append((time.perf_counter() - inicio) * 1000)
+        acoes[estado.get("acao_final", "SEM_ACAO")] += 1
+        chamadas.append(sum(m.get("chamadas_llm", 0) for m in estado.get("metricas", {}).values()))
+        for no, segundos in estado.get("tempos", {}).items():
+            por_no.setdefault(no, []).append(segundos * 1000)
+
+    fila = [mensagem for _ in range(repeticoes) for mensagem in mensagens]
+    with ThreadPoolExecutor(max_workers=sessoes, thread_name_prefix="sessao") as sessoes_pool:
+        list(sessoes_pool.map(
+            lambda i: [consultar(m, f"sessao-{i}") for m in fila[i::sessoes]], range(sessoes)
+        ))
+    return {
+        "total_ms": percentis(totais),
+        "nos_ms": {no: percentis(valores) for no, valores in sorted(por_no.items())},
+        "chamadas_llm_por_mensagem": sum(chamadas) / len(chamadas) if chamadas else 0.0,
+        "acoes": dict(sorted(acoes.items())),
+    }
+
+
+def verificar_triagem_local(pasta: Path) -> Dict:
+    """Mensagens de `CASOS_TRIAGEM` cuja decisão local (só regras, sem log) foge da esperada"""
+    classificador = ClassificadorTriagem(KEYWORDS_ABRIR_TICKET, arquivo_log=pasta / "triagem_regras.jsonl")
+    divergencias = []
+    for mensagem, esperada in CASOS_TRIAGEM:
+        resultado, _ = classificador.classificar(mensagem)
+        obtida = resultado["decisao"] if resultado is not None else None
+        if obtida != esperada:
+            divergencias.append(f"{mensagem}: {obtida} (esperado {esperada})")
+    return {"casos": len(CASOS_TRIAGEM), "divergencias": divergencias}
+
+
+def verificar_cache_dispositivos(dimensao: int) -> Dict:
+    """Acertos indevidos do cache semântico entre perguntas de dispositivos diferentes
+
+    As duas perguntas de cada par recebem o mesmo vetor, como se o modelo
+    de embeddings não distinguisse "artigo 45" de "artigo 46".
+    """
+    vetor = np.random.default_rng(0).standard_normal(dimensao)
+    indevidos, perdidos = [], []
+    for guardada, nova, deve_acertar in PARES_CACHE:
+        cache = CacheSemantico()
+        cache.guardar(vetor, {"answer": guardada}, "benchmark", busca_lexical.extrair_referencias(guardada))
+        acertou = cache.buscar(vetor, "benchmark", busca_lexical.extrair_referencias(nova)) is not None
+        if acertou and not deve_acertar:
+            indevidos.append(f"{guardada} -> {nova}")
+        elif deve_acertar and not acertou:
+            perdidos.append(f"{guardada} -> {nova}")
+    return {"pares": len(PARES_CACHE), "acertos_indevidos": indevidos, "acertos_perdidos": perdidos}
+
+
+# ------------------------------------------------------------------- execução
+
+def _ambiente() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).parent,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "data": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+def executar_escala(pdf: Path, fator: int, args, ouro: List[Dict], pasta: Path) -> Dict:
+    pdfs = corpus_sintetico(pdf, fator, pasta)
+    ingestao_stats, chunks = medir_ingestao(pdfs, args.chunker, args.workers_ingestao)
+    print(f"[x{fator}] ingestão: {ingestao_stats['chunks']} chunks em {ingestao_stats['segundos']:.2f}s", file=sys.stderr)
+
+    embeddings = EmbeddingsHash(
+        dimensao=args.dimensao, latencia_lote=args.latencia_embeddings, latencia_consulta=args.latencia_consulta
+    )
+    embeddings_stats, vetores = medir_embeddings(
+        embeddings, [c.page_content for c in chunks], args.concorrencia_embeddings, args.tamanho_lote
+    )
+    print(f"[x{fator}] embeddings: {embeddings_stats['textos_por_s']:.0f} textos/s", file=sys.stderr)
+
+    plano, lexical, construcao = construir_base(chunks, vetores, embeddings)
+    perguntas = [item["pergunta"] for item in ouro] + consultas_sinteticas(chunks, args.consultas)
+
+    indices = {}
+    retriever_grafo = None
+    for tipo in args.tipos.split(","):
+        inicio = time.perf_counter()
+        try:
+            index = plano.index if tipo == "flat" else fabrica_indice.construir_indice(vetores, tipo)
+        except ValueError as e:
+            indices[tipo] = {"erro": str(e)}
+            continue
+        vectorstore = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=plano.docstore,
+            index_to_docstore_id=plano.index_to_docstore_id,
+        )
+        retriever = RecuperadorHibrido(vectorstore, lexical, k=args.k)
+        indices[tipo] = {
+            "construcao_s": construcao["faiss_plano_s"] if tipo == "flat" else time.perf_counter() - inicio,
+            "bytes_por_vetor": fabrica_indice.bytes_por_vetor(index),
+            "consultas": medir_consultas(retriever, perguntas),
+            "recall_ouro": recall_ouro(retriever, lexical, ouro),
+        }
+        print(
+            f"[x{fator}] {tipo}: p95 híbrida {indices[tipo]['consultas']['hibrida_ms']['p95']:.2f} ms, "
+            f"recall@{args.k} {indices[tipo]['recall_ouro']['recall']:.2f}",
+            file=sys.stderr,
+        )
+        if args.rerank_top_n > 0:
+            reranqueador = Reranqueador(
+                PontuadorSobreposicao(args.latencia_rerank),
+                top_n=args.rerank_top_n,
+                candidatos=args.rerank_candidatos,
+            )
+            indices[tipo]["rerank"] = medir_rerank(retriever, lexical, ouro, reranqueador)
+            rerank = indices[tipo]["rerank"]
+            print(
+                f"[x{fator}] {tipo} + rerank: recall@{args.rerank_top_n} {rerank['recall_ouro']['recall']:.2f}, "
+                f"p95 {rerank['sem_cache']['rerank_ms']['p95']:.2f} ms, "
+                f"tokens {rerank['tokens_contexto']['antes']:.0f} -> {rerank['tokens_contexto']['depois']:.0f}",
+                file=sys.stderr,
+            )
+        retriever_grafo = retriever_grafo or retriever
+
+    resultado = {
+        "fator": fator,
+        "ingestao": ingestao_stats,
+        "embeddings": embeddings_stats,
+        "indice_lexical_s": construcao["lexical_s"],
+        "indices": indices,
+    }
+
+    if retriever_grafo is not None and args.repeticoes_grafo > 0:
+        llm = LLMDeterministico(latencia=args.latencia_llm, tokens_por_segundo=args.tokens_por_segundo)
+        mensagens = [item["pergunta"] for item in ouro] + list(MENSAGENS_EXTRAS)
+        casos = (
+            ("grafo", False, 1),
+            ("grafo_escalonador_ollama", True, 1),
+            ("grafo_escalonador_ollama_sessoes", True, args.sessoes_grafo),
+        )
+        for nome, com_escalonador, sessoes in casos:
+            escalonador = criar_escalonador(False) if com_escalonador else None
+            with ThreadPoolExecutor(max_workers=2 * sessoes, thread_name_prefix="busca-especulativa") as executor:
+                motor = MotorConsulta(
+                    llm_triagem=llm,
+                    model_name="deterministico",
+                    retriever=retriever_grafo,
+                    fingerprint_indice=f"benchmark-{fator}",
+                    classificador=ClassificadorTriagem(
+                        KEYWORDS_ABRIR_TICKET, arquivo_log=pasta / f"triagem_{fator}_{nome}.jsonl"
+                    ),
+                    # Limiar acima de 1: nenhuma pergunta repetida sai do cache
+                    cache_respostas=CacheSemantico(limiar=2.0),
+                    executor=executor,
+                    escalonador=escalonador,
+                    modo_fundido=args.modo_fundido,
+                )
+                resultado[nome] = medir_grafo(motor, mensagens, args.repeticoes_grafo, sessoes)
+            print(
+                f"[x{fator}] {nome} ({sessoes} sessão(ões)): p95 {resultado[nome]['total_ms']['p95']:.1f} ms, "
+                f"{resultado[nome]['chamadas_llm_por_mensagem']:.2f} chamadas ao LLM por mensagem",
+                file=sys.stderr,
+            )
+    return resultado
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", type=Path, help="PDF base (padrão: o primeiro encontrado pelo app)")
+    parser.add_argument("--escalas", default="1,5", help="Fatores de multiplicação do corpus")
+    parser.add_argument("--chunker", default=ingestao.CHUNKER, choices=("recursivo", "legal"))
+    parser.add_argument("--workers-ingestao", type=int, default=ingestao.INGESTAO_WORKERS)
+    parser.add_argument("--tipos", default="flat", help="Tipos de índice FAISS (flat,hnsw,ivfpq)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--consultas", type=int, default=200, help="Consultas sintéticas além do conjunto ouro")
+    parser.add_argument("--repeticoes-grafo", type=int, default=2, help="Passadas do conjunto ouro pelo grafo (0 pula)")
+    parser.add_argument(
+        "--sessoes-grafo", type=int, default=4, help="Sessões simultâneas no grafo atrás do escalonador do Ollama"
+    )
+    parser.add_argument("--rerank-top-n", type=int, default=3, help="Chunks após o reranqueamento (0 pula)")
+    parser.add_argument("--rerank-candidatos", type=int, default=20)
+    parser.add_argument("--latencia-rerank", type=float, default=0.0, help="Segundos por lote do reranqueamento")
+    parser.add_argument("--dimensao", type=int, default=384)
+    parser.add_argument("--tamanho-lote", type=int, default=100)
+    parser.add_argument("--concorrencia-embeddings", type=int, default=4)
+    parser.add_argument("--latencia-embeddings", type=float, default=0.0, help="Segundos por lote de embeddings")
+    parser.add_argument("--latencia-consulta", type=float, default=0.0, help="Segundos por embedding de pergunta")
+    parser.add_argument("--latencia-llm", type=float, default=0.0, help="Segundos até o primeiro token do LLM")
+    parser.add_argument(
+        "--modo-fundido", action="store_true", help="Triagem e resposta em uma chamada ao LLM (MODO_FUNDIDO)"
+    )
+    parser.add_argument("--tokens-por-segundo", type=float, default=0.0, help="Velocidade do LLM (0 = instantâneo)")
+    parser.add_argument("--ouro", type=Path, default=ARQUIVO_OURO)
+    parser.add_argument("--saida", type=Path, default=Path("benchmark.json"))
+    args = parser.parse_args(argv)
+
+    pdf = args.pdf or next(iter(encontrar_pdfs()), None)
+    if pdf is None:
+        raise SystemExit("Nenhum PDF encontrado; use --pdf")
+    ouro = ler_ouro(args.ouro)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as temporario:
+        escalas = [
+            executar_escala(pdf, int(fator), args, ouro, Path(temporario))
+            for fator in args.escalas.split(",")
+        ]
+        triagem = verificar_triagem_local(Path(temporario))
+
+    cache = verificar_cache_dispositivos(args.dimensao)
+
+    parametros = {k: (str(v) if isinstance(v, Path) else v) for k, v in sorted(vars(args).items())}
+    parametros["pdf"] = pdf.name
+    relatorio = {
+        "ambiente": _ambiente(),
+        "parametros": parametros,
+        "escalas": _arredondar(escalas),
+        "cache_dispositivos": cache,
+        "triagem_regras": triagem,
+    }
+    args.saida.write_text(json.dumps(relatorio, indent=2, sort_keys=True, ensure_ascii=False) + "\n", encoding="utf-8")
+    print(f"Resultados em {args.saida}", file=sys.stderr)
+    falhou = False
+    if triagem["divergencias"]:
+        print(f"✗ Regras da triagem: {triagem['divergencias']}", file=sys.stderr)
+        falhou = True
+    if cache["acertos_indevidos"] or cache["acertos_perdidos"]:
+        print(f"✗ Cache semântico entre dispositivos: {cache}", file=sys.stderr)
+        falhou = True
+    if falhou:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Carga no LLM com a cota do Gemini apertada: um backend x roteamento
+
+Sobe dois servidores fake no próprio processo (`servidor_fake.py`): o
+"Gemini", com 429 aleatórios e uma cauda de respostas lentas, e a reserva
+(API do Ollama ou, com `--reserva gemini`, uma segunda API do Gemini, para
+ambientes sem o langchain-ollama). Dispara as mesmas perguntas de triagem em
+paralelo em três cenários:
+
+- `so_gemini`: o cliente do Gemini de hoje, com as retentativas dele;
+- `failover`: `RoteadorLLM` gemini → reserva;
+- `failover_hedge`: o mesmo, com hedge no p95.
+
+e mede latência (p50/p95/p99), taxa de erro e quem respondeu.
+
+Uso:
+    python ferramentas/carga_roteamento.py
+    python ferramentas/carga_roteamento.py --perguntas 300 --taxa-429 0.4 --stream --json roteamento.json
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmark import ARQUIVO_OURO, ler_ouro, percentis  # noqa: E402
+from consulta import get_triagem_prompt  # noqa: E402
+from registro_modelos import ConfiguracaoLLM, RegistroModelos  # noqa: E402
+from roteador_llm import EstadoRoteamento, RoteadorLLM  # noqa: E402
+from servidor_fake import EstadoServidor, criar_handler  # noqa: E402
+
+CHAVE_FAKE = "fake-key-para-testes"
+
+
+def subir_servidor(estado: EstadoServidor) -> str:
+    """Servidor fake em uma thread; devolve a URL base"""
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), criar_handler(estado))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def medir(modelo: Any, prompts: List[str], concorrencia: int, stream: bool) -> Dict:
+    """Latência até a resposta completa e erros de cada prompt"""
+    erros: List[str] = []
+
+    def chamar(prompt: str) -> Optional[float]:
+        inicio = time.perf_counter()
+        try:
+            if stream:
+                for _ in modelo.stream(prompt):
+                    pass
+            else:
+                modelo.invoke(prompt)
+        except Exception as e:
+            erros.append(type(e).__name__)
+            return None
+        return time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        latencias = [s for s in executor.map(chamar, prompts) if s is not None]
+    return {
+        "latencia_s": percentis(latencias),
+        "taxa_erro": len(erros) / len(prompts),
+        "erros": sorted(set(erros)),
+    }
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--perguntas", type=int, default=120, help="Chamadas por cenário")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--taxa-429", type=float, default=0.3, help="Probabilidade de 429 no Gemini fake")
+    parser.add_argument("--taxa-lenta", type=float, default=0.05, help="Fração de respostas lentas no Gemini fake")
+    parser.add_argument("--latencia-lenta", type=float, default=3.0, help="Segundos a mais nas respostas lentas")
+    parser.add_argument("--latencia", type=float, default=0.1, help="Latência base do Gemini fake")
+    parser.add_argument("--latencia-reserva", type=float, default=0.3, help="Latência da reserva")
+    parser.add_argument("--reserva", choices=("ollama", "gemini"), default="ollama", help="API da reserva")
+    parser.add_argument(
+        "--resfriamento", type=float, default=5.0,
+        help="Segundos do Gemini no fim da fila após 429 (o app usa ROTEADOR_RESFRIAMENTO)",
+    )
+    parser.add_argument(
+        "--hedge-atraso-inicial", type=float, default=1.0,
+        help="Espera do hedge até juntar latências (o app usa ROTEADOR_HEDGE_ATRASO_INICIAL)",
+    )
+    parser.add_argument("--stream", action="store_true", help="Mede com streaming (o hedge olha o 1º token)")
+    parser.add_argument("--ouro", type=Path, default=ARQUIVO_OURO)
+    parser.add_argument("--json", type=Path, help="Grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    url_gemini = subir_servidor(EstadoServidor(
+        768, args.latencia, args.taxa_429, 0, taxa_lenta=args.taxa_lenta, latencia_lenta=args.latencia_lenta
+    ))
+    url_reserva = subir_servidor(EstadoServidor(768, args.latencia_reserva, 0.0, 0))
+
+    gemini = ConfiguracaoLLM("gemini", "gemini-2.5-flash", base_url=url_gemini, api_key=CHAVE_FAKE)
+    if args.reserva == "ollama":
+        reserva = ConfiguracaoLLM("ollama", "llama3.2", base_url=url_reserva)
+    else:
+        reserva = ConfiguracaoLLM("gemini", "gemini-2.5-flash", base_url=url_reserva, api_key=CHAVE_FAKE, max_tentativas=1)
+    _, gemini_atual = RegistroModelos().obter(gemini)
+    _, gemini_rapido = RegistroModelos().obter(replace(gemini, max_tentativas=1))
+    _, llm_reserva = RegistroModelos().obter(reserva)
+
+    perguntas = [item["pergunta"] for item in ler_ouro(args.ouro)]
+    prompts = [get_triagem_prompt(perguntas[i % len(perguntas)]) for i in range(args.perguntas)]
+
+    relatorio: Dict[str, Any] = {"parametros": {k: str(v) for k, v in vars(args).items()}}
+    relatorio["so_gemini"] = medir(gemini_atual, prompts, args.concorrencia, args.stream)
+    for cenario, hedge in (("failover", False), ("failover_hedge", True)):
+        estado = EstadoRoteamento(
+            ["gemini", args.reserva if args.reserva == "ollama" else "reserva"], resfriamento=args.resfriamento,
+            atraso_inicial_hedge=args.hedge_atraso_inicial,
+        )
+        roteador = RoteadorLLM(modelos=dict(zip(estado.backends, (gemini_rapido, llm_reserva))), estado=estado, hedge=hedge)
+        relatorio[cenario] = {**medir(roteador, prompts, args.concorrencia, args.stream), **estado.resumo()}
+
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    if args.json:
+        args.json.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Paridade e velocidade dos embeddings ONNX int8 x PyTorch
+
+Compara o motor `EMBEDDINGS_LOCAL_MOTOR=onnx` com o `HuggingFaceEmbeddings`
+atual (all-MiniLM-L6-v2), nos chunks do PDF e nas perguntas do conjunto
+ouro:
+
+- cosseno entre os dois vetores de cada texto (mínimo, p1, média);
+- ranking: sobreposição dos k chunks mais próximos de cada pergunta e
+  concordância do primeiro colocado;
+- velocidade: textos/s na indexação, latência p50/p95 de uma pergunta e
+  perguntas/s com várias threads ao mesmo tempo (agrupamento dinâmico).
+
+Sai com código 1 se o cosseno ficar abaixo dos limiares.
+
+Uso:
+    python ferramentas/paridade_embeddings.py
+    python ferramentas/paridade_embeddings.py --chunks 500 --threads-consulta 8 --json paridade.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ingestao  # noqa: E402
+from benchmark import ARQUIVO_OURO, ler_ouro, percentis  # noqa: E402
+from consulta import CHUNK_OVERLAP, CHUNK_SIZE, EMBEDDING_MODEL_LOCAL, encontrar_pdfs  # noqa: E402
+from embeddings_onnx import carregar_embeddings_onnx  # noqa: E402
+
+
+def comparar_vetores(referencia: np.ndarray, candidato: np.ndarray) -> Dict:
+    """Cosseno linha a linha entre duas matrizes de vetores normalizados"""
+    cossenos = np.sum(referencia * candidato, axis=1) / (
+        np.linalg.norm(referencia, axis=1) * np.linalg.norm(candidato, axis=1)
+    )
+    return {
+        "minimo": float(cossenos.min()),
+        "p1": float(np.percentile(cossenos, 1)),
+        "media": float(cossenos.mean()),
+    }
+
+
+def comparar_rankings(
+    chunks_ref: np.ndarray, chunks_cand: np.ndarray, perguntas_ref: np.ndarray, perguntas_cand: np.ndarray, k: int
+) -> Dict:
+    """Sobreposição dos top-k (busca exata) de cada pergunta nos dois espaços"""
+    topo_ref = np.argsort(-(perguntas_ref @ chunks_ref.T), axis=1)[:, :k]
+    topo_cand = np.argsort(-(perguntas_cand @ chunks_cand.T), axis=1)[:, :k]
+    sobreposicoes = [len(set(a) & set(b)) / k for a, b in zip(topo_ref, topo_cand)]
+    return {
+        "k": k,
+        "sobreposicao_media": float(np.mean(sobreposicoes)),
+        "primeiro_igual": float(np.mean(topo_ref[:, 0] == topo_cand[:, 0])),
+    }
+
+
+def medir_velocidade(embeddings, textos: List[str], perguntas: List[str], threads: int) -> Dict:
+    """Indexação (textos/s), latência de uma pergunta e vazão com várias threads"""
+    embeddings.embed_query(perguntas[0])  # aquecimento (carga preguiçosa, alocações)
+
+    inicio = time.perf_counter()
+    embeddings.embed_documents(textos)
+    segundos = time.perf_counter() - inicio
+
+    latencias = []
+    for pergunta in perguntas:
+        inicio = time.perf_counter()
+        embeddings.embed_query(pergunta)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        inicio = time.perf_counter()
+        list(executor.map(embeddings.embed_query, perguntas * 4))
+        concorrente_s = time.perf_counter() - inicio
+
+    return {
+        "indexacao_textos_por_s": len(textos) / segundos if segundos else 0.0,
+        "consulta_ms": percentis(latencias),
+        "consultas_concorrentes_por_s": 4 * len(perguntas) / concorrente_s if concorrente_s else 0.0,
+    }
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", type=Path, help="PDF de onde tirar os chunks (padrão: o do app)")
+    parser.add_argument("--chunks", type=int, default=300, help="Chunks sorteados para a comparação")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads-consulta", type=int, default=8, help="Threads no teste de perguntas simultâneas")
+    parser.add_argument("--limiar-media", type=float, default=0.99, help="Cosseno médio mínimo")
+    parser.add_argument("--limiar-minimo", type=float, default=0.95, help="Cosseno mínimo aceito em qualquer texto")
+    parser.add_argument("--ouro", type=Path, default=ARQUIVO_OURO)
+    parser.add_argument("--json", type=Path, help="Grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    pdf = args.pdf or next(iter(encontrar_pdfs()), None)
+    if pdf is None:
+        raise SystemExit("Nenhum PDF encontrado; use --pdf")
+    chunks = [c.page_content for c in ingestao.processar_pdfs([pdf], CHUNK_SIZE, CHUNK_OVERLAP)[pdf.name][1]]
+    chunks = random.Random(0).sample(chunks, min(args.chunks, len(chunks)))
+    perguntas = [item["pergunta"] for item in ler_ouro(args.ouro)]
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    inicio = time.perf_counter()
+    referencia = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_LOCAL, model_kwargs={"device": "cpu"}, encode_kwargs={"normalize_embeddings": True}
+    )
+    carga_ref = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    candidato, nome = carregar_embeddings_onnx(EMBEDDING_MODEL_LOCAL)
+    carga_cand = time.perf_counter() - inicio
+
+    chunks_ref = np.asarray(referencia.embed_documents(chunks), dtype=np.float32)
+    chunks_cand = np.asarray(candidato.embed_documents(chunks), dtype=np.float32)
+    perguntas_ref = np.asarray([referencia.embed_query(p) for p in perguntas], dtype=np.float32)
+    perguntas_cand = np.asarray([candidato.embed_query(p) for p in perguntas], dtype=np.float32)
+
+    relatorio = {
+        "modelo": EMBEDDING_MODEL_LOCAL,
+        "onnx": nome,
+        "textos": len(chunks),
+        "perguntas": len(perguntas),
+        "cosseno_chunks": comparar_vetores(chunks_ref, chunks_cand),
+        "cosseno_perguntas": comparar_vetores(perguntas_ref, perguntas_cand),
+        "ranking": comparar_rankings(chunks_ref, chunks_cand, perguntas_ref, perguntas_cand, args.k),
+        "torch": {"carga_s": carga_ref, **medir_velocidade(referencia, chunks, perguntas, args.threads_consulta)},
+        "onnx_int8": {"carga_s": carga_cand, **medir_velocidade(candidato, chunks, perguntas, args.threads_consulta)},
+    }
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    if args.json:
+        args.json.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    cossenos = [relatorio["cosseno_chunks"], relatorio["cosseno_perguntas"]]
+    if any(c["media"] < args.limiar_media or c["minimo"] < args.limiar_minimo for c in cossenos):
+        print(
+            f"✗ Paridade abaixo do limiar (média >= {args.limiar_media}, mínimo >= {args.limiar_minimo})",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    print("✓ Paridade dentro do limiar", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
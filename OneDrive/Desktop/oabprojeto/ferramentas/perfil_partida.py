@@ -0,0 +1,157 @@
+"""Perfil da partida a frio do app: tempo até a primeira renderização
+
+Roda o `app.py` do zero, cada vez em um processo Python novo, pelo
+`AppTest` do Streamlit (sem servidor nem navegador), e relata o perfil
+gravado por `partida.py`:
+
+- segundos até a primeira renderização (título e campo de pergunta
+  enviados) e até o sistema ficar pronto para responder;
+- import e inicialização de cada componente (Streamlit, LangChain,
+  LangGraph, FAISS, SDK do backend, clientes do LLM, embeddings, índice,
+  reranqueador, grafo).
+
+Com `--repeticoes N`, relata a mediana de N processos. Antes deles roda
+uma partida de aquecimento, que constrói o índice e popula os caches de
+disco do sistema operacional (`--sem-aquecimento` desliga). Com
+`--servidor-fake`, o app usa o Gemini de `servidor_fake.py` e índice,
+caches e log da triagem em um diretório temporário. Sai com código 1 se
+a mediana da primeira renderização passar de `--limite-primeira-renderizacao`.
+
+Uso:
+    python ferramentas/perfil_partida.py --servidor-fake
+    python ferramentas/perfil_partida.py --repeticoes 5 --limite-primeira-renderizacao 2 --json partida.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+RAIZ = Path(__file__).resolve().parent.parent
+CHAVE_FAKE = "fake-key-para-testes"
+
+
+def partida_filho(timeout: float) -> Dict:
+    """Uma partida do app neste processo (que deve ser novo)"""
+    sys.path.insert(0, str(RAIZ))
+    import partida
+
+    testes = partida.importar("streamlit.testing.v1", "streamlit")
+    app = testes.AppTest.from_file(str(RAIZ / "app.py"), default_timeout=timeout)
+    app.run()
+    resumo = partida.PERFIL.resumo()
+    resumo["erros"] = [e.value for e in app.error] + [str(e.value) for e in app.exception]
+    return resumo
+
+
+def rodar_filho(timeout: float, ambiente: Dict[str, str]) -> Dict:
+    """Uma partida em um processo novo; devolve o perfil dela"""
+    saida = subprocess.run(
+        [sys.executable, __file__, "--filho", "--timeout", str(timeout)],
+        cwd=RAIZ, env=ambiente, capture_output=True, text=True, timeout=timeout + 60,
+    )
+    if saida.returncode != 0:
+        raise RuntimeError(f"A partida falhou:\n{saida.stderr[-2000:]}")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def mediana_perfis(perfis: List[Dict]) -> Dict:
+    """Mediana de cada marco e de cada (componente, fase) entre as partidas"""
+    marcos: Dict[str, List[float]] = {}
+    componentes: Dict[tuple, List[float]] = {}
+    for perfil in perfis:
+        for marco, segundos in perfil["marcos"].items():
+            marcos.setdefault(marco, []).append(segundos)
+        for medicao in perfil["componentes"]:
+            componentes.setdefault((medicao["componente"], medicao["fase"]), []).append(medicao["segundos"])
+    return {
+        "marcos": {marco: statistics.median(valores) for marco, valores in marcos.items()},
+        "componentes": [
+            {"componente": componente, "fase": fase, "segundos": statistics.median(valores)}
+            for (componente, fase), valores in componentes.items()
+        ],
+    }
+
+
+def subir_servidor_fake() -> str:
+    """Servidor fake do Gemini em uma thread; devolve a URL base"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from http.server import ThreadingHTTPServer
+
+    from servidor_fake import EstadoServidor, criar_handler
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), criar_handler(EstadoServidor(768, 0.0, 0.0, 0)))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=3, help="Partidas medidas (cada uma em um processo novo)")
+    parser.add_argument("--sem-aquecimento", action="store_true", help="Não rodar a partida de aquecimento")
+    parser.add_argument("--servidor-fake", action="store_true", help="Gemini fake e caches em diretório temporário")
+    parser.add_argument("--timeout", type=float, default=600, help="Segundos máximos de uma partida")
+    parser.add_argument("--limite-primeira-renderizacao", type=float, help="Falha se a mediana passar disto (s)")
+    parser.add_argument("--json", type=Path, help="Grava o relatório em JSON")
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.filho:
+        print(json.dumps(partida_filho(args.timeout)))
+        return
+
+    ambiente = {**os.environ, "METRICAS_PORTA": "0"}
+    temporario = None
+    if args.servidor_fake:
+        temporario = tempfile.TemporaryDirectory(prefix="perfil_partida_")
+        pasta = Path(temporario.name)
+        ambiente.update({
+            "GEMINI_BASE_URL": subir_servidor_fake(),
+            "GOOGLE_API_KEY": CHAVE_FAKE,
+            "INDICE_DIR": str(pasta / "indices"),
+            "EMBEDDINGS_CACHE_DIR": str(pasta / "embeddings"),
+            "EMBEDDINGS_CHECKPOINT_DIR": str(pasta / "embeddings_parciais"),
+            "TRIAGEM_LOG": str(pasta / "triagem_log.jsonl"),
+        })
+
+    try:
+        aquecimento = None
+        if not args.sem_aquecimento:
+            inicio = time.perf_counter()
+            rodar_filho(args.timeout, ambiente)
+            aquecimento = time.perf_counter() - inicio
+        perfis = [rodar_filho(args.timeout, ambiente) for _ in range(args.repeticoes)]
+    finally:
+        if temporario is not None:
+            temporario.cleanup()
+
+    relatorio = {
+        "repeticoes": len(perfis),
+        "aquecimento_s": aquecimento,
+        "mediana": mediana_perfis(perfis),
+        "partidas": [perfil["marcos"] for perfil in perfis],
+        "erros": sorted({erro for perfil in perfis for erro in perfil["erros"]}),
+    }
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    if args.json:
+        args.json.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    if relatorio["erros"]:
+        print("✗ O app mostrou erros na partida", file=sys.stderr)
+        sys.exit(1)
+    primeira = relatorio["mediana"]["marcos"].get("primeira_renderizacao")
+    if args.limite_primeira_renderizacao is not None and (
+        primeira is None or primeira > args.limite_primeira_renderizacao
+    ):
+        print(f"✗ Primeira renderização em {primeira}s (limite {args.limite_primeira_renderizacao}s)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
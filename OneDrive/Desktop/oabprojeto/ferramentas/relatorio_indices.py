@@ -0,0 +1,78 @@
+"""Relatório de recall x latência dos tipos de índice FAISS
+
+Usa os vetores de um índice já salvo (o mais recente em INDICE_DIR, ou o
+diretório indicado) e, opcionalmente, replica-os com ruído para simular
+um corpus maior. Cada tipo é comparado com a busca exata (flat).
+
+Uso:
+    python ferramentas/relatorio_indices.py
+    python ferramentas/relatorio_indices.py --escala 50 --tipos flat,hnsw,ivfpq --json relatorio.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fabrica_indice import TIPOS_INDICE, relatorio_recall, vetores_do_indice  # noqa: E402
+from indice import ARQUIVO_FAISS, DIRETORIO_INDICES  # noqa: E402
+
+
+def indice_mais_recente() -> Path:
+    candidatos = sorted(
+        (p for p in DIRETORIO_INDICES.glob("*/" + ARQUIVO_FAISS)),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    if not candidatos:
+        raise SystemExit(f"Nenhum índice salvo em {DIRETORIO_INDICES}; rode o app uma vez antes")
+    return candidatos[0].parent
+
+
+def escalar(vetores: np.ndarray, fator: int) -> np.ndarray:
+    """Réplicas com ruído dos vetores, para simular um corpus `fator` vezes maior"""
+    if fator <= 1:
+        return vetores
+    rng = np.random.default_rng(0)
+    desvio = float(np.std(vetores)) * 0.3
+    copias = [vetores] + [
+        vetores + rng.standard_normal(vetores.shape).astype(np.float32) * desvio for _ in range(fator - 1)
+    ]
+    return np.concatenate(copias).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--diretorio", type=Path, help="Diretório do índice (padrão: o mais recente)")
+    parser.add_argument("--tipos", default=",".join(TIPOS_INDICE))
+    parser.add_argument("--escala", type=int, default=1, help="Multiplicar o corpus com réplicas ruidosas")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--json", type=Path, help="Gravar o relatório em JSON")
+    args = parser.parse_args()
+
+    diretorio = args.diretorio or indice_mais_recente()
+    vetores = escalar(vetores_do_indice(faiss.read_index(str(diretorio / ARQUIVO_FAISS))), args.escala)
+    print(f"{len(vetores)} vetores de dimensão {vetores.shape[1]} ({diretorio.name})")
+
+    linhas = relatorio_recall(vetores, args.tipos.split(","), k=args.k, consultas=args.consultas)
+    print(f"{'tipo':<22}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}{'bytes/vetor':>14}{'build s':>10}")
+    for linha in linhas:
+        if "erro" in linha:
+            print(f"{linha['tipo']:<22}  {linha['erro']}")
+            continue
+        print(
+            f"{linha['tipo']:<22}{linha['recall']:>10.3f}{linha['p50_ms']:>10.3f}{linha['p95_ms']:>10.3f}"
+            f"{linha['bytes_por_vetor']:>14.1f}{linha['construcao_s']:>10.2f}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps({"vetores": len(vetores), "linhas": linhas}, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
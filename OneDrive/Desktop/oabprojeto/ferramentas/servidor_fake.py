@@ -0,0 +1,243 @@
+"""Servidor HTTP local que imita as APIs do Gemini e do Ollama
+
+Serve para testar o agendador de embeddings e o roteamento do LLM sem
+gastar cota:
+
+- Gemini: embeddings (`:embedContent`, `:batchEmbedContents`) e geração
+  (`:generateContent`, `:streamGenerateContent`);
+- Ollama: `/api/chat` (NDJSON), `/api/generate` e `/api/tags`.
+
+Vetores e respostas são determinísticos (hash do texto; as respostas são
+as do `LLMDeterministico`), e o servidor pode simular latência, uma cauda
+de requisições lentas, limite de requisições por minuto e 429 aleatórios.
+
+Uso:
+    python ferramentas/servidor_fake.py --porta 8765 --req-por-minuto 60 --taxa-429 0.1
+    GEMINI_BASE_URL=http://localhost:8765 GOOGLE_API_KEY=fake-key-para-testes streamlit run app.py
+    python ferramentas/servidor_fake.py --porta 11434 --taxa-lenta 0.1 --latencia-lenta 5   # "Ollama"
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from substitutos import responder_prompt
+
+
+def vetor_deterministico(texto: str, dimensao: int) -> list:
+    """Vetor unitário pseudoaleatório com semente no hash do texto"""
+    semente = int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "big")
+    gerador = random.Random(semente)
+    valores = [gerador.gauss(0.0, 1.0) for _ in range(dimensao)]
+    norma = math.sqrt(sum(v * v for v in valores)) or 1.0
+    return [v / norma for v in valores]
+
+
+class EstadoServidor:
+    """Configuração e contadores compartilhados entre as requisições"""
+
+    def __init__(
+        self,
+        dimensao: int,
+        latencia: float,
+        taxa_429: float,
+        req_por_minuto: int,
+        taxa_lenta: float = 0.0,
+        latencia_lenta: float = 0.0,
+        modelo_ollama: str = "llama3.2",
+        palavras_por_chunk: int = 8,
+    ):
+        self.dimensao = dimensao
+        self.latencia = latencia
+        self.taxa_429 = taxa_429
+        self.req_por_minuto = req_por_minuto
+        self.taxa_lenta = taxa_lenta
+        self.latencia_lenta = latencia_lenta
+        self.modelo_ollama = modelo_ollama
+        self.palavras_por_chunk = palavras_por_chunk
+        self.janela = deque()
+        self.lock = threading.Lock()
+        self.atendidas = 0
+        self.recusadas = 0
+
+    def deve_recusar(self) -> bool:
+        with self.lock:
+            agora = time.monotonic()
+            while self.janela and agora - self.janela[0] > 60:
+                self.janela.popleft()
+            recusar = (
+                (self.req_por_minuto > 0 and len(self.janela) >= self.req_por_minuto)
+                or random.random() < self.taxa_429
+            )
+            if recusar:
+                self.recusadas += 1
+            else:
+                self.janela.append(agora)
+                self.atendidas += 1
+            return recusar
+
+    def atraso(self) -> float:
+        """Latência desta requisição: a fixa, mais a da cauda lenta se sorteada"""
+        lenta = self.taxa_lenta > 0 and random.random() < self.taxa_lenta
+        return self.latencia + (self.latencia_lenta if lenta else 0.0)
+
+
+def _pedacos(texto: str, palavras_por_pedaco: int) -> list:
+    palavras = texto.split(" ")
+    return [
+        " ".join(palavras[i:i + palavras_por_pedaco]) + (" " if i + palavras_por_pedaco < len(palavras) else "")
+        for i in range(0, len(palavras), palavras_por_pedaco)
+    ]
+
+
+def _uso_gemini(prompt: str, resposta: str) -> dict:
+    entrada, saida = len(prompt) // 4, len(resposta) // 4
+    return {"promptTokenCount": entrada, "candidatesTokenCount": saida, "totalTokenCount": entrada + saida}
+
+
+def criar_handler(estado: EstadoServidor):
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, status: int, corpo: dict) -> None:
+            dados = json.dumps(corpo).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def _linhas(self, tipo: str, linhas) -> None:
+            """Resposta em streaming (SSE do Gemini ou NDJSON do Ollama), até fechar a conexão"""
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.end_headers()
+            for linha in linhas:
+                self.wfile.write(linha.encode("utf-8"))
+                self.wfile.flush()
+
+        def do_GET(self):
+            rota = urlparse(self.path).path
+            if rota == "/api/tags":
+                self._responder(200, {"models": [{"name": f"{estado.modelo_ollama}:latest"}]})
+            elif "/models/" in rota:
+                # models.get do aquecimento do cliente do Gemini
+                self._responder(200, {"name": rota.split("/v1beta/", 1)[-1]})
+            else:
+                self._responder(404, {"error": {"code": 404, "message": f"Rota desconhecida: {self.path}"}})
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+            rota = urlparse(self.path).path
+
+            atraso = estado.atraso()
+            if atraso:
+                time.sleep(atraso)
+            if estado.deve_recusar():
+                self._responder(429, {"error": {
+                    "code": 429,
+                    "message": "Resource has been exhausted (e.g. check quota).",
+                    "status": "RESOURCE_EXHAUSTED",
+                }})
+                return
+
+            def texto_de(conteudo: dict) -> str:
+                return "".join(p.get("text", "") for p in conteudo.get("parts", []))
+
+            if rota.endswith(":batchEmbedContents"):
+                self._responder(200, {"embeddings": [
+                    {"values": vetor_deterministico(texto_de(r.get("content", {})), estado.dimensao)}
+                    for r in corpo.get("requests", [])
+                ]})
+            elif rota.endswith(":embedContent"):
+                self._responder(200, {"embedding": {
+                    "values": vetor_deterministico(texto_de(corpo.get("content", {})), estado.dimensao)
+                }})
+            elif rota.endswith(":generateContent") or rota.endswith(":streamGenerateContent"):
+                prompt = "\n".join(texto_de(c) for c in corpo.get("contents", []))
+                resposta = responder_prompt(prompt)
+
+                def candidato(texto: str, fim: bool) -> dict:
+                    return {"candidates": [{
+                        "content": {"role": "model", "parts": [{"text": texto}]},
+                        "index": 0,
+                        **({"finishReason": "STOP"} if fim else {}),
+                    }], "usageMetadata": _uso_gemini(prompt, resposta)}
+
+                if rota.endswith(":generateContent"):
+                    self._responder(200, candidato(resposta, True))
+                    return
+                pedacos = _pedacos(resposta, estado.palavras_por_chunk)
+                self._linhas("text/event-stream", (
+                    f"data: {json.dumps(candidato(p, i == len(pedacos) - 1))}\r\n\r\n"
+                    for i, p in enumerate(pedacos)
+                ))
+            elif rota in ("/api/chat", "/api/generate"):
+                agora = datetime.now(timezone.utc).isoformat()
+                base = {"model": corpo.get("model", estado.modelo_ollama), "created_at": agora}
+                if rota == "/api/chat":
+                    prompt = "\n".join(str(m.get("content", "")) for m in corpo.get("messages", []))
+                else:
+                    prompt = corpo.get("prompt") or ""
+                if not prompt:
+                    # Sem prompt: o Ollama só carrega o modelo (aquecimento)
+                    self._responder(200, {**base, "response": "", "done": True})
+                    return
+                resposta = responder_prompt(prompt)
+                final = {
+                    **base, "done": True, "done_reason": "stop",
+                    "prompt_eval_count": len(prompt) // 4, "eval_count": len(resposta) // 4,
+                }
+
+                def pedaco(texto: str) -> dict:
+                    if rota == "/api/chat":
+                        return {**base, "message": {"role": "assistant", "content": texto}, "done": False}
+                    return {**base, "response": texto, "done": False}
+
+                if corpo.get("stream") is False:
+                    self._responder(200, {**pedaco(resposta), **final})
+                    return
+                linhas = [pedaco(p) for p in _pedacos(resposta, estado.palavras_por_chunk)]
+                linhas.append({**pedaco(""), **final})
+                self._linhas("application/x-ndjson", (json.dumps(linha) + "\n" for linha in linhas))
+            else:
+                self._responder(404, {"error": {"code": 404, "message": f"Rota desconhecida: {self.path}"}})
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--dimensao", type=int, default=768)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos de espera por requisição")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Probabilidade de devolver 429")
+    parser.add_argument("--req-por-minuto", type=int, default=0, help="Limite por minuto (0 = sem limite)")
+    parser.add_argument("--taxa-lenta", type=float, default=0.0, help="Probabilidade de uma requisição lenta")
+    parser.add_argument("--latencia-lenta", type=float, default=0.0, help="Segundos a mais nas requisições lentas")
+    parser.add_argument("--modelo-ollama", default="llama3.2", help="Modelo listado em /api/tags")
+    args = parser.parse_args()
+
+    estado = EstadoServidor(
+        args.dimensao, args.latencia, args.taxa_429, args.req_por_minuto,
+        taxa_lenta=args.taxa_lenta, latencia_lenta=args.latencia_lenta, modelo_ollama=args.modelo_ollama,
+    )
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.porta), criar_handler(estado))
+    print(f"Servidor fake ouvindo em http://127.0.0.1:{args.porta}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nAtendidas: {estado.atendidas} | recusadas (429): {estado.recusadas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Substitutos locais e determinísticos do LLM e dos embeddings
+
+Usados pelo benchmark (e úteis em testes manuais) para exercitar o
+pipeline inteiro sem rede nem cota:
+
+- `EmbeddingsHash`: bag-of-words com feature hashing sobre os mesmos
+  tokens do BM25. Perguntas e trechos que compartilham termos ficam
+  próximos, então o recall medido com ele ainda diz algo sobre o ranking;
+- `LLMDeterministico`: responde JSON de triagem aos prompts de triagem
+  (com a resposta junto, no prompt fundido) e um texto fixo, montado a
+  partir do contexto, aos prompts do RAG;
+- `PontuadorSobreposicao`: no lugar do cross-encoder do reranqueamento,
+  pontua pela fração dos termos da pergunta presentes no trecho.
+
+Todos aceitam latência simulada, para aproximar o custo de rede ou de CPU.
+"""
+import hashlib
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from busca_lexical import tokenizar  # noqa: E402
+
+
+class EmbeddingsHash(Embeddings):
+    """Embeddings por feature hashing dos tokens, normalizados
+
+    Args:
+        dimensao: Tamanho dos vetores
+        latencia_lote: Segundos de espera por chamada a `embed_documents`
+        latencia_consulta: Segundos de espera por `embed_query`
+    """
+
+    def __init__(self, dimensao: int = 384, latencia_lote: float = 0.0, latencia_consulta: float = 0.0):
+        self.dimensao = dimensao
+        self.latencia_lote = latencia_lote
+        self.latencia_consulta = latencia_consulta
+
+    def _vetor(self, texto: str) -> List[float]:
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        for token in tokenizar(texto):
+            # Radical grosseiro: "vereador" e "vereadores" caem no mesmo balde
+            digest = hashlib.blake2b(token[:7].encode(), digest_size=8).digest()
+            posicao = int.from_bytes(digest[:4], "little") % self.dimensao
+            vetor[posicao] += 1.0 if digest[4] & 1 else -1.0
+        norma = float(np.linalg.norm(vetor))
+        if norma == 0:
+            vetor[0] = 1.0
+            norma = 1.0
+        return (vetor / norma).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latencia_lote:
+            time.sleep(self.latencia_lote)
+        return [self._vetor(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latencia_consulta:
+            time.sleep(self.latencia_consulta)
+        return self._vetor(text)
+
+
+def responder_prompt(prompt: str, palavras_resposta: int = 120) -> str:
+    """Resposta determinística do `LLMDeterministico` (também usada pelo servidor fake)"""
+    if "retorne SOMENTE um JSON" in prompt:
+        mensagem = prompt.rsplit("Mensagem do usuário:", 1)[-1].strip()
+        decisao = "AUTO_RESOLVER" if mensagem.endswith("?") else "PEDIR_INFO"
+        campos = [] if decisao == "AUTO_RESOLVER" else ["tema e contexto específico"]
+        saida = {"decisao": decisao, "urgencia": "BAIXA", "campos_faltantes": campos}
+        if '"resposta"' in prompt:
+            # Prompt fundido: triagem e resposta no mesmo JSON
+            saida["resposta"] = _resposta_rag(prompt, palavras_resposta) if decisao == "AUTO_RESOLVER" else ""
+            return json.dumps(saida, ensure_ascii=False)
+        return json.dumps(saida)
+    return _resposta_rag(prompt, palavras_resposta)
+
+
+def _resposta_rag(prompt: str, palavras_resposta: int) -> str:
+    # Sem negações, que o app interpreta como "não encontrei"
+    palavras = [p for p in prompt.split() if not p.lower().lstrip("'\"(").startswith(("não", "nao"))]
+    inicio = int(hashlib.sha256(prompt.encode()).hexdigest(), 16) % max(1, len(palavras))
+    corpo = (palavras[inicio:] + palavras)[:palavras_resposta]
+    return "Conforme os trechos da Lei Orgânica: " + " ".join(corpo)
+
+
+class LLMDeterministico(BaseChatModel):
+    """Chat model que responde sempre a mesma coisa para o mesmo prompt
+
+    Prompts de triagem recebem AUTO_RESOLVER para perguntas (terminadas em
+    "?") e PEDIR_INFO para o resto. Os demais recebem `palavras_resposta`
+    palavras tiradas do próprio prompt.
+
+    Args:
+        latencia: Segundos até o primeiro token
+        tokens_por_segundo: Velocidade do streaming (0 = instantâneo)
+        palavras_resposta: Tamanho da resposta do RAG
+    """
+
+    latencia: float = 0.0
+    tokens_por_segundo: float = 0.0
+    palavras_resposta: int = 120
+
+    @property
+    def _llm_type(self) -> str:
+        return "deterministico"
+
+    def _responder(self, messages: List[BaseMessage]) -> str:
+        return responder_prompt("\n".join(str(m.content) for m in messages), self.palavras_resposta)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        texto = self._responder(messages)
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.tokens_por_segundo:
+            time.sleep(len(texto.split()) / self.tokens_por_segundo)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.latencia:
+            time.sleep(self.latencia)
+        for palavra in self._responder(messages).split(" "):
+            if self.tokens_por_segundo:
+                time.sleep(1 / self.tokens_por_segundo)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=palavra + " "))
+
+
+class PontuadorSobreposicao:
+    """Pontuador de pares (pergunta, trecho) com a interface do cross-encoder
+
+    A pontuação é a fração dos radicais da pergunta que aparecem no trecho,
+    com uma penalidade leve para trechos longos.
+
+    Args:
+        latencia_lote: Segundos de espera por chamada (um lote)
+    """
+
+    def __init__(self, latencia_lote: float = 0.0):
+        self.latencia_lote = latencia_lote
+
+    def __call__(self, pares: List[Tuple[str, str]]) -> List[float]:
+        if self.latencia_lote:
+            time.sleep(self.latencia_lote)
+        pontuacoes = []
+        for pergunta, texto in pares:
+            termos = {t[:7] for t in tokenizar(pergunta)}
+            tokens = [t[:7] for t in tokenizar(texto)]
+            presentes = termos & set(tokens)
+            pontuacoes.append(len(presentes) / max(1, len(termos)) - 0.01 * math.log1p(len(tokens)))
+        return pontuacoes
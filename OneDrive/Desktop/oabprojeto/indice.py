@@ -0,0 +1,379 @@
+"""Persistência e atualização incremental do índice vetorial
+
+O índice FAISS e o docstore ficam salvos em um diretório versionado cuja
+chave é a configuração de indexação (splitter e modelo de embeddings).
+Junto deles fica um manifesto com o hash de cada PDF e os ids dos chunks
+que ele gerou, de modo que só arquivos novos ou alterados precisam ser
+processados e os vetores de arquivos removidos são descartados.
+
+A indexação é um fluxo: páginas -> chunks -> lotes de embeddings ->
+índice. Os chunks chegam em blocos (`ingestao.iterar_pdfs`) e vão para o
+índice a cada `INDEXACAO_LOTE` chunks, então só o índice cresce com o
+corpus. O build completo pode rodar fora do app (`construir_indice.py`);
+com `INDICE_SOMENTE_LEITURA=1` o app só carrega o artefato pronto.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from agendador_embeddings import AgendadorEmbeddings
+from ingestao import BlocoChunks, chave_arquivo, contar_paginas
+
+# Incrementar quando o formato salvo mudar (invalida todos os artefatos antigos)
+INDICE_FORMATO_VERSAO = 3
+
+DIRETORIO_INDICES = Path(
+    os.getenv("INDICE_DIR", str(Path(__file__).parent / ".cache" / "indices"))
+)
+
+ARQUIVO_FAISS = "index.faiss"
+ARQUIVO_DOCSTORE = "docstore.json"
+ARQUIVO_METADADOS = "metadados.json"
+
+# Chunks acumulados antes de gerar os embeddings e acrescentar ao índice
+INDEXACAO_LOTE = int(os.getenv("INDEXACAO_LOTE", "1000"))
+# Só carregar o índice salvo, nunca construir (processos web)
+INDICE_SOMENTE_LEITURA = os.getenv("INDICE_SOMENTE_LEITURA", "0") == "1"
+
+# Recebe os PDFs a indexar e devolve os blocos de chunks, na ordem
+ProcessadorPDFs = Callable[[Sequence[Path]], Iterable[BlocoChunks]]
+
+
+class IndiceIndisponivel(RuntimeError):
+    """Modo somente leitura sem um índice salvo para a configuração atual"""
+
+
+def _contar_paginas(caminho: Path) -> int:
+    try:
+        return contar_paginas(caminho)
+    except Exception:
+        return 0  # o erro de leitura é avisado pela ingestão
+
+
+def hash_arquivo(caminho: Path) -> str:
+    """Calcula o SHA-256 do conteúdo de um arquivo"""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def fingerprint_configuracao(
+    chunk_size: int,
+    chunk_overlap: int,
+    modelo_embeddings: str,
+    estrategia: str = "recursivo",
+) -> str:
+    """Chave do diretório do índice: tudo que muda os vetores de um mesmo PDF"""
+    h = hashlib.sha256()
+    h.update(f"formato={INDICE_FORMATO_VERSAO}\n".encode())
+    h.update(f"chunk_size={chunk_size}\nchunk_overlap={chunk_overlap}\n".encode())
+    # Só entra quando difere do padrão, para não invalidar índices já salvos
+    if estrategia != "recursivo":
+        h.update(f"chunker={estrategia}\n".encode())
+    h.update(f"embeddings={modelo_embeddings}\n".encode())
+    return h.hexdigest()
+
+
+def fingerprint_corpus(configuracao: str, hashes: Dict[str, str]) -> str:
+    """Impressão digital do índice completo (configuração + conteúdo dos PDFs)
+
+    A ordem dos arquivos não altera o resultado; o caminho (`chave_arquivo`)
+    entra junto com o hash porque ele é o `source` das citações.
+    """
+    h = hashlib.sha256(configuracao.encode())
+    for nome, digest in sorted(hashes.items()):
+        h.update(f"{nome}:{digest}\n".encode())
+    return h.hexdigest()
+
+
+def diretorio_indice(configuracao: str) -> Path:
+    """Diretório onde o índice de uma configuração é salvo"""
+    return DIRETORIO_INDICES / f"v{INDICE_FORMATO_VERSAO}-{configuracao[:16]}"
+
+
+def ler_metadados(diretorio: Path) -> Optional[Dict]:
+    """Lê o manifesto salvo, sem carregar o índice"""
+    try:
+        with open(diretorio / ARQUIVO_METADADOS, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def salvar_indice(vectorstore: FAISS, diretorio: Path, metadados: Dict) -> None:
+    """Salva índice, docstore e metadados de forma atômica
+
+    Grava primeiro em um diretório temporário e só então renomeia, para que
+    um processo interrompido nunca deixe um artefato pela metade.
+    """
+    temporario = diretorio.with_name(diretorio.name + ".tmp")
+    if temporario.exists():
+        shutil.rmtree(temporario)
+    temporario.mkdir(parents=True)
+
+    faiss.write_index(vectorstore.index, str(temporario / ARQUIVO_FAISS))
+
+    # Docstore em JSON (na ordem do índice) em vez de pickle, um registro por vez
+    with open(temporario / ARQUIVO_DOCSTORE, "w", encoding="utf-8") as f:
+        f.write("[")
+        for posicao in range(len(vectorstore.index_to_docstore_id)):
+            doc_id = vectorstore.index_to_docstore_id[posicao]
+            doc = vectorstore.docstore.search(doc_id)
+            if posicao:
+                f.write(",")
+            json.dump({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}, f, ensure_ascii=False)
+        f.write("]")
+
+    with open(temporario / ARQUIVO_METADADOS, "w", encoding="utf-8") as f:
+        json.dump(metadados, f, ensure_ascii=False, indent=2)
+
+    if diretorio.exists():
+        shutil.rmtree(diretorio)
+    temporario.rename(diretorio)
+
+
+def carregar_indice(diretorio: Path, embeddings, mmap: bool = True) -> Optional[FAISS]:
+    """Carrega um índice salvo, ou None se não existir ou estiver corrompido
+
+    Com `mmap=True` o arquivo FAISS é mapeado em memória, para que o sistema
+    operacional pagine os vetores sob demanda. Use `mmap=False` quando o
+    índice for ser modificado.
+    """
+    caminho_faiss = diretorio / ARQUIVO_FAISS
+    caminho_docstore = diretorio / ARQUIVO_DOCSTORE
+    if not (caminho_faiss.exists() and caminho_docstore.exists()):
+        return None
+
+    try:
+        index = None
+        if mmap:
+            try:
+                index = faiss.read_index(str(caminho_faiss), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                # Nem todo tipo de índice suporta mmap
+                index = None
+        if index is None:
+            index = faiss.read_index(str(caminho_faiss))
+
+        with open(caminho_docstore, encoding="utf-8") as f:
+            registros: List[Dict] = json.load(f)
+    except (OSError, RuntimeError, json.JSONDecodeError):
+        return None
+
+    if index.ntotal != len(registros):
+        return None
+
+    docstore = InMemoryDocstore({
+        r["id"]: Document(page_content=r["page_content"], metadata=r["metadata"])
+        for r in registros
+    })
+    index_to_docstore_id = {i: r["id"] for i, r in enumerate(registros)}
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def ids_dos_chunks(nome: str, digest: str, quantidade: int, inicio: int = 0) -> List[str]:
+    """Ids estáveis dos chunks de um arquivo, derivados do nome e do conteúdo
+
+    O nome entra na chave para que duas cópias do mesmo PDF não colidam.
+    `inicio` é a posição do primeiro chunk no arquivo (blocos seguintes).
+    """
+    base = hashlib.sha256(f"{nome}:{digest}".encode()).hexdigest()[:16]
+    return [f"{base}-{i:05d}" for i in range(inicio, inicio + quantidade)]
+
+
+def adicionar_chunks(
+    vectorstore: Optional[FAISS],
+    chunks: List[Document],
+    ids: List[str],
+    embeddings,
+    agendador: AgendadorEmbeddings,
+    progresso: Optional[Callable[[float, str], None]] = None,
+) -> FAISS:
+    """Gera os embeddings dos chunks pelo agendador e os adiciona ao índice"""
+    textos = [c.page_content for c in chunks]
+    vetores = agendador.embutir(textos, progresso)
+    pares = list(zip(textos, vetores.tolist()))
+    metadatas = [c.metadata for c in chunks]
+    if vectorstore is None:
+        return FAISS.from_embeddings(pares, embeddings, metadatas=metadatas, ids=ids)
+    vectorstore.add_embeddings(pares, metadatas=metadatas, ids=ids)
+    return vectorstore
+
+
+def indexar_blocos(
+    vectorstore: Optional[FAISS],
+    blocos: Iterable[BlocoChunks],
+    hashes: Dict[str, str],
+    manifesto: Dict[str, Dict],
+    embeddings,
+    agendador: AgendadorEmbeddings,
+    progresso: Optional[Callable[[float, str], None]] = None,
+    total_paginas: int = 0,
+    tamanho_lote: int = INDEXACAO_LOTE,
+) -> Optional[FAISS]:
+    """Acrescenta ao índice os chunks dos blocos, `tamanho_lote` por vez
+
+    Preenche o `manifesto` de cada arquivo à medida que os blocos chegam.
+    Se um arquivo falhar no meio, os chunks dele que já entraram no índice
+    são removidos e ele fica fora do manifesto.
+    """
+    chunks: List[Document] = []
+    ids: List[str] = []
+    indexados: Set[str] = set()
+    paginas_lidas = 0
+
+    def descarregar():
+        nonlocal vectorstore
+        if chunks:
+            vectorstore = adicionar_chunks(vectorstore, chunks, ids, embeddings, agendador)
+            indexados.update(ids)
+            chunks.clear()
+            ids.clear()
+
+    for bloco in blocos:
+        paginas_lidas += bloco.fim - bloco.inicio
+        if bloco.erro is not None:
+            desfeitos = set(manifesto.pop(bloco.nome, {}).get("chunk_ids", []))
+            if desfeitos:
+                pendentes = [(c, i) for c, i in zip(chunks, ids) if i not in desfeitos]
+                chunks[:] = [c for c, _ in pendentes]
+                ids[:] = [i for _, i in pendentes]
+                if desfeitos & indexados:
+                    vectorstore.delete(list(desfeitos & indexados))
+            continue
+
+        entrada = manifesto.setdefault(
+            bloco.nome, {"sha256": hashes[bloco.nome], "paginas": bloco.paginas, "chunk_ids": []}
+        )
+        novos_ids = ids_dos_chunks(bloco.nome, hashes[bloco.nome], len(bloco.chunks), len(entrada["chunk_ids"]))
+        entrada["chunk_ids"].extend(novos_ids)
+        chunks.extend(bloco.chunks)
+        ids.extend(novos_ids)
+        if len(chunks) >= tamanho_lote:
+            descarregar()
+        if progresso and total_paginas:
+            progresso(
+                min(1.0, paginas_lidas / total_paginas),
+                f"Indexando: {paginas_lidas} de {total_paginas} páginas, {len(indexados) + len(chunks)} chunks...",
+            )
+    descarregar()
+
+    # Arquivos sem nenhum chunk (ex.: PDF só com imagens) não entram no manifesto
+    for nome in [nome for nome, info in manifesto.items() if not info["chunk_ids"]]:
+        del manifesto[nome]
+    return vectorstore
+
+
+def sincronizar_indice(
+    pdfs: Sequence[Path],
+    embeddings,
+    configuracao: str,
+    processar_pdfs: ProcessadorPDFs,
+    avisar: Callable[[str], None] = print,
+    progresso: Optional[Callable[[float, str], None]] = None,
+    agendador: Optional[AgendadorEmbeddings] = None,
+    somente_leitura: bool = INDICE_SOMENTE_LEITURA,
+) -> Tuple[FAISS, Dict]:
+    """Carrega o índice salvo e o atualiza só com o que mudou nos PDFs
+
+    Arquivos novos ou alterados são processados e embutidos; os chunks de
+    arquivos removidos ou alterados saem do índice. Sem mudanças, o índice
+    é apenas carregado (com memory-map).
+
+    Com `somente_leitura`, o índice salvo é carregado mesmo desatualizado
+    (com um aviso) e nada é construído; sem índice salvo, levanta
+    `IndiceIndisponivel`.
+
+    Returns:
+        Tupla (vectorstore, metadados), onde metadados contém o manifesto
+        por arquivo, `fingerprint`, `num_docs` e `num_chunks`
+    """
+    pasta = diretorio_indice(configuracao)
+    # Chave pelo caminho absoluto, a mesma do `source` dos chunks
+    hashes = {chave_arquivo(p): hash_arquivo(p) for p in pdfs}
+    caminhos = {chave_arquivo(p): p for p in pdfs}
+    fingerprint = fingerprint_corpus(configuracao, hashes)
+
+    metadados = ler_metadados(pasta)
+    manifesto: Dict[str, Dict] = (metadados or {}).get("arquivos", {})
+
+    if metadados and (metadados.get("fingerprint") == fingerprint or somente_leitura):
+        vectorstore = carregar_indice(pasta, embeddings)
+        if vectorstore is not None:
+            if metadados.get("fingerprint") != fingerprint:
+                avisar("⚠️ Índice salvo desatualizado em relação aos PDFs; rode `python construir_indice.py`")
+            return vectorstore, metadados
+    if somente_leitura:
+        raise IndiceIndisponivel(
+            f"Nenhum índice salvo em {pasta}. Construa com `python construir_indice.py` "
+            "(ou desligue INDICE_SOMENTE_LEITURA)."
+        )
+
+    # Algo mudou (ou não há índice): carregar em modo gravável e aplicar o diff
+    vectorstore = carregar_indice(pasta, embeddings, mmap=False) if metadados else None
+    if vectorstore is None:
+        manifesto = {}
+
+    removidos = [nome for nome, info in manifesto.items() if hashes.get(nome) != info["sha256"]]
+    novos = [nome for nome in caminhos if nome not in manifesto or nome in removidos]
+
+    ids_remover = [doc_id for nome in removidos for doc_id in manifesto[nome]["chunk_ids"]]
+    if ids_remover:
+        vectorstore.delete(ids_remover)
+    for nome in removidos:
+        avisar(f"− Removido do índice: {nome}")
+        del manifesto[nome]
+
+    if novos:
+        if agendador is None:
+            agendador = AgendadorEmbeddings(embeddings, configuracao)
+        vectorstore = indexar_blocos(
+            vectorstore,
+            processar_pdfs([caminhos[nome] for nome in novos]),
+            hashes,
+            manifesto,
+            embeddings,
+            agendador,
+            progresso=progresso,
+            total_paginas=sum(_contar_paginas(caminhos[nome]) for nome in novos) if progresso else 0,
+        )
+        if agendador.cache is not None:
+            avisar(agendador.cache.resumo())
+        for nome in novos:
+            if nome in manifesto:
+                avisar(f"+ Indexado: {nome} ({len(manifesto[nome]['chunk_ids'])} chunks)")
+
+    if vectorstore is None or vectorstore.index.ntotal == 0:
+        raise ValueError("Nenhum PDF foi encontrado no workspace.")
+
+    metadados = {
+        "fingerprint": fingerprint_corpus(
+            configuracao, {nome: info["sha256"] for nome, info in manifesto.items()}
+        ),
+        "configuracao": configuracao,
+        "arquivos": manifesto,
+        "num_docs": sum(info["paginas"] for info in manifesto.values()),
+        "num_chunks": vectorstore.index.ntotal,
+    }
+    try:
+        salvar_indice(vectorstore, pasta, metadados)
+        if agendador is not None:
+            agendador.limpar_checkpoint()
+    except OSError as e:
+        avisar(f"Não foi possível salvar o índice em disco: {e}")
+    return vectorstore, metadados
@@ -0,0 +1,508 @@
+"""Leitura dos PDFs e divisão em chunks
+
+A extração de texto e o split são trabalho de CPU puro, então podem ser
+distribuídos entre processos: cada PDF é dividido em intervalos de páginas
+e cada intervalo vira uma tarefa independente. Os resultados são sempre
+remontados na ordem (arquivo, página), de modo que os ids dos chunks não
+dependem do número de workers.
+
+`iterar_pdfs` entrega os chunks bloco a bloco (um intervalo de páginas
+por vez), com no máximo `2 * workers` intervalos em processamento ou
+esperando a vez; quem consome (a indexação) embute e descarta cada bloco,
+então a memória não cresce com o tamanho do corpus.
+
+Há duas estratégias de divisão:
+
+- `recursivo`: RecursiveCharacterTextSplitter por página, com overlap;
+- `legal`: segue a estrutura da lei (Título/Capítulo/Seção/Art.), um chunk
+  por artigo (ou por parágrafo, em artigos longos), sem overlap e com a
+  hierarquia nos metadados. Como artigos atravessam páginas, cada arquivo
+  é uma tarefa só (e um bloco só).
+
+Antes de embutir, a ingestão limpa o que só ocuparia espaço no índice:
+
+- moldura das páginas: linhas que se repetem no topo ou no pé de boa
+  parte das páginas de um arquivo (cabeçalho, rodapé, número da página)
+  são detectadas por amostragem e retiradas antes do split;
+- chunks triviais, com até `CHUNK_MIN_CARACTERES` caracteres;
+- chunks quase iguais a outro do mesmo arquivo (SimHash de shingles de
+  palavras, distância de Hamming até `DEDUP_DISTANCIA`). A comparação é
+  por arquivo porque a reindexação é por arquivo: remover um PDF não pode
+  levar junto o conteúdo que só ficou nele por ter sido deduplicado no
+  outro.
+"""
+import bisect
+import hashlib
+import multiprocessing
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF < 1.24.3
+    import fitz as pymupdf
+
+# Número de processos para ler e dividir os PDFs (0 ou 1 = serial)
+INGESTAO_WORKERS = int(os.getenv("INGESTAO_WORKERS", "0"))
+# Páginas por tarefa no modo paralelo
+PAGINAS_POR_TAREFA = int(os.getenv("INGESTAO_PAGINAS_POR_TAREFA", "16"))
+
+# Estratégia de divisão: "recursivo" ou "legal"
+CHUNKER = os.getenv("CHUNKER", "recursivo")
+# Tamanho máximo (caracteres) de um artigo antes de dividi-lo por parágrafos
+CHUNKER_LEGAL_MAX = int(os.getenv("CHUNKER_LEGAL_MAX", "1500"))
+
+# Retira cabeçalhos, rodapés e números de página repetidos antes do split
+INGESTAO_MOLDURA = os.getenv("INGESTAO_MOLDURA", "1") != "0"
+# Chunks com até este número de caracteres são descartados (0 = manter todos)
+CHUNK_MIN_CARACTERES = int(os.getenv("CHUNK_MIN_CARACTERES", "50"))
+# Distância de Hamming máxima entre os SimHash de dois chunks quase iguais (-1 = sem deduplicação)
+DEDUP_DISTANCIA = int(os.getenv("DEDUP_DISTANCIA", "6"))
+
+# Linhas não vazias do topo e do pé de cada página candidatas a moldura
+LINHAS_BORDA = 4
+# Fração das páginas em que uma linha precisa aparecer para ser moldura
+FRACAO_MOLDURA = 0.5
+# Páginas lidas por arquivo para detectar a moldura
+AMOSTRA_MOLDURA = 16
+TAMANHO_SHINGLE = 3
+BITS_SIMHASH = 64
+
+RE_DIGITOS = re.compile(r"\d+")
+RE_ESTRUTURA = re.compile(
+    r"^[ \t]*(T[ÍI]TULO|CAP[ÍI]TULO|SUBSE[ÇC][ÃA]O|SE[ÇC][ÃA]O)\s+([IVXLC]+|[ÚU]NIC[OA]|DO ATO)\b[^\n]*",
+    re.MULTILINE | re.IGNORECASE,
+)
+RE_ARTIGO = re.compile(r"^[ \t]*Art\.?\s*(\d+)", re.MULTILINE)
+RE_PARAGRAFO = re.compile(r"^[ \t]*(?:§\s*(\d+)|Par[áa]grafo\s+[úu]nico)", re.MULTILINE | re.IGNORECASE)
+NIVEIS_ESTRUTURA = {"titulo": 0, "capitulo": 1, "secao": 2, "subsecao": 3}
+
+# (page_content, metadata) de cada chunk; tuplas são mais leves para
+# trafegar entre processos do que Documents
+ChunkSerializado = Tuple[str, Dict]
+
+
+class BlocoChunks(NamedTuple):
+    """Chunks de um intervalo de páginas [inicio, fim) de um arquivo"""
+    nome: str  # `chave_arquivo` do PDF
+    paginas: int  # páginas do arquivo inteiro
+    inicio: int
+    fim: int
+    chunks: List[Document]
+    erro: Optional[str] = None
+
+
+def chave_arquivo(caminho: Path) -> str:
+    """Caminho absoluto do PDF: identifica o arquivo no manifesto do índice e no `source` dos chunks
+
+    Só o nome não basta: PDFs de mesmo nome em pastas diferentes (a do
+    projeto e /mount/src, por exemplo) virariam um só.
+    """
+    return str(Path(caminho).resolve())
+
+
+def contar_paginas(caminho: Path) -> int:
+    """Número de páginas de um PDF"""
+    with pymupdf.open(str(caminho)) as pdf:
+        return pdf.page_count
+
+
+def assinatura_estrategia(
+    estrategia: str = CHUNKER,
+    moldura: bool = INGESTAO_MOLDURA,
+    min_caracteres: int = CHUNK_MIN_CARACTERES,
+    distancia: int = DEDUP_DISTANCIA,
+) -> str:
+    """Estratégia + parâmetros que mudam os chunks (entra no fingerprint do índice)"""
+    assinatura = f"legal:{CHUNKER_LEGAL_MAX}" if estrategia == "legal" else estrategia
+    if moldura:
+        assinatura += "|moldura"
+    if min_caracteres > 0:
+        assinatura += f"|min:{min_caracteres}"
+    if distancia >= 0:
+        assinatura += f"|simhash:{distancia}"
+    return assinatura
+
+
+# ------------------------------------------------------------------ moldura
+
+def _normalizar_linha(linha: str) -> str:
+    """Espaços colapsados e números trocados por "#" ("Página 12" == "Página 13")"""
+    return RE_DIGITOS.sub("#", " ".join(linha.split())).lower()
+
+
+def _bordas(linhas: List[str], quantidade: int = LINHAS_BORDA) -> List[int]:
+    """Índices das `quantidade` primeiras e últimas linhas não vazias"""
+    cheias = [i for i, linha in enumerate(linhas) if linha.strip()]
+    return sorted(set(cheias[:quantidade] + cheias[-quantidade:]))
+
+
+def detectar_moldura(textos: Sequence[str], fracao: float = FRACAO_MOLDURA) -> FrozenSet[str]:
+    """Linhas (normalizadas) que se repetem no topo ou no pé das páginas
+
+    Uma linha é moldura se aparece nas bordas de pelo menos `fracao` das
+    páginas (e de no mínimo 3). Com menos de 3 páginas não há como saber.
+    """
+    if len(textos) < 3:
+        return frozenset()
+    contagem: Counter = Counter()
+    for texto in textos:
+        linhas = texto.split("\n")
+        contagem.update({_normalizar_linha(linhas[i]) for i in _bordas(linhas)})
+    minimo = max(3, fracao * len(textos))
+    return frozenset(linha for linha, vezes in contagem.items() if vezes >= minimo)
+
+
+def ler_moldura(caminho: Path, amostra: int = AMOSTRA_MOLDURA) -> FrozenSet[str]:
+    """Moldura de um PDF, a partir de até `amostra` páginas espalhadas pelo arquivo"""
+    with pymupdf.open(str(caminho)) as pdf:
+        passo = max(1, pdf.page_count // max(1, amostra))
+        textos = [pdf[numero].get_text() for numero in range(0, pdf.page_count, passo)]
+    return detectar_moldura(textos)
+
+
+def remover_moldura(texto: str, moldura: FrozenSet[str]) -> str:
+    """Retira da página as linhas de moldura do topo e do pé
+
+    Só saem linhas em sequência a partir de cada borda (ignorando as
+    vazias), então uma linha igual à moldura no meio do texto fica.
+    """
+    if not moldura:
+        return texto
+    linhas = texto.split("\n")
+    cheias = [i for i, linha in enumerate(linhas) if linha.strip()]
+    retirar = set()
+    for sequencia in (cheias, cheias[::-1]):
+        for i in sequencia[:LINHAS_BORDA]:
+            if _normalizar_linha(linhas[i]) not in moldura:
+                break
+            retirar.add(i)
+    return "\n".join(linha for i, linha in enumerate(linhas) if i not in retirar)
+
+
+# ------------------------------------------------------------------ deduplicação
+
+def simhash(texto: str, tamanho_shingle: int = TAMANHO_SHINGLE) -> int:
+    """SimHash de 64 bits dos shingles de palavras do texto"""
+    palavras = re.findall(r"\w+", texto.lower())
+    shingles = {
+        " ".join(palavras[i:i + tamanho_shingle]) for i in range(max(1, len(palavras) - tamanho_shingle + 1))
+    }
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votos = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    return int.from_bytes(np.packbits(votos, bitorder="little").tobytes(), "little")
+
+
+class DeduplicadorSimHash:
+    """Reconhece textos quase iguais a algum já visto
+
+    Dois textos são quase iguais se os SimHash diferem em até `distancia`
+    bits. Os 64 bits são cortados em `distancia + 1` faixas: pelo princípio
+    da casa dos pombos, dois hashes nessa distância coincidem em pelo menos
+    uma faixa, então só os hashes que dividem alguma faixa são comparados.
+    """
+
+    def __init__(self, distancia: int = DEDUP_DISTANCIA):
+        self.distancia = distancia
+        largura = -(-BITS_SIMHASH // (distancia + 1))
+        self.faixas = [(inicio, (1 << min(largura, BITS_SIMHASH - inicio)) - 1) for inicio in range(0, BITS_SIMHASH, largura)]
+        self._baldes: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def repetido(self, texto: str) -> bool:
+        """True se o texto é quase igual a um já visto; senão, passa a ser visto"""
+        assinatura = simhash(texto)
+        chaves = [(faixa, (assinatura >> inicio) & mascara) for faixa, (inicio, mascara) in enumerate(self.faixas)]
+        for chave in chaves:
+            if any(bin(assinatura ^ outra).count("1") <= self.distancia for outra in self._baldes[chave]):
+                return True
+        for chave in chaves:
+            self._baldes[chave].append(assinatura)
+        return False
+
+
+def _nivel_estrutura(palavra: str) -> str:
+    """"CAPÍTULO" -> "capitulo" (chave de NIVEIS_ESTRUTURA)"""
+    return unicodedata.normalize("NFKD", palavra).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def _nome_estrutura(texto: str, cabecalho: "re.Match") -> str:
+    """Cabeçalho + a linha seguinte com o nome (ex.: "Capítulo II - DA COMPETÊNCIA...")"""
+    nome = cabecalho.group(0).strip()
+    for linha in texto[cabecalho.end():cabecalho.end() + 300].split("\n"):
+        linha = linha.strip()
+        if not linha:
+            continue
+        if not RE_ARTIGO.match(linha) and not RE_ESTRUTURA.match(linha):
+            # "CAPÍTULO II" seguido de "II - DO PODER LEGISLATIVO": não repetir o número
+            linha = re.sub(rf"^{re.escape(cabecalho.group(2))}\s*[-–]\s*", "", linha)
+            nome = f"{nome} - {linha}"
+        break
+    return re.sub(r"\s+", " ", nome)
+
+
+def _dividir_artigo(texto: str, numero: str, tamanho_max: int) -> List[Tuple[str, Dict]]:
+    """Um artigo longo vira caput + um chunk por parágrafo
+
+    Os pedaços após o caput recebem o prefixo "Art. N." para não perderem
+    a referência. Pedaços que ainda passem do limite são divididos sem
+    overlap.
+    """
+    if len(texto) <= tamanho_max:
+        return [(texto, {})]
+
+    cortes = [m.start() for m in RE_PARAGRAFO.finditer(texto) if m.start() > 0]
+    inicios = [0] + cortes
+    pedacos = []
+    for inicio, fim in zip(inicios, inicios[1:] + [len(texto)]):
+        trecho = texto[inicio:fim].strip()
+        meta = {}
+        if inicio > 0:
+            paragrafo = RE_PARAGRAFO.match(trecho)
+            meta["paragrafo"] = (paragrafo.group(1) or "unico") if paragrafo else None
+            trecho = f"Art. {numero}. {trecho}"
+        pedacos.append((trecho, meta))
+
+    resultado = []
+    splitter = RecursiveCharacterTextSplitter(chunk_size=tamanho_max, chunk_overlap=0)
+    for trecho, meta in pedacos:
+        if len(trecho) <= tamanho_max:
+            resultado.append((trecho, meta))
+        else:
+            resultado.extend((parte, meta) for parte in splitter.split_text(trecho))
+    return resultado
+
+
+def dividir_estrutura_legal(
+    paginas: List[str],
+    metadados: Dict,
+    chunk_size: int,
+    tamanho_max: int = CHUNKER_LEGAL_MAX,
+    primeira_pagina: int = 0,
+) -> List[ChunkSerializado]:
+    """Divide o texto de uma lei em um chunk por artigo
+
+    O texto anterior ao primeiro artigo (capa, sumário, preâmbulo) é
+    dividido por tamanho. Cada chunk leva nos metadados `artigo`,
+    `titulo`, `capitulo` e `secao` vigentes e a página onde começa.
+    """
+    inicios_paginas = []
+    partes = []
+    posicao = 0
+    for texto_pagina in paginas:
+        inicios_paginas.append(posicao)
+        partes.append(texto_pagina)
+        posicao += len(texto_pagina) + 1
+    texto = "\n".join(partes)
+
+    def pagina_de(pos: int) -> int:
+        return primeira_pagina + bisect.bisect_right(inicios_paginas, pos) - 1
+
+    eventos = sorted(
+        [(m.start(), "estrutura", m) for m in RE_ESTRUTURA.finditer(texto)]
+        + [(m.start(), "artigo", m) for m in RE_ARTIGO.finditer(texto)],
+        key=lambda e: e[0],
+    )
+    chunks: List[ChunkSerializado] = []
+
+    primeiro_artigo = next((pos for pos, tipo, _ in eventos if tipo == "artigo"), len(texto))
+    preambulo = texto[:primeiro_artigo].strip()
+    if preambulo:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+        for doc in splitter.create_documents([preambulo]):
+            chunks.append((doc.page_content, {**metadados, "page": pagina_de(0)}))
+
+    hierarquia: Dict[str, str] = {}
+    for i, (inicio, tipo, match) in enumerate(eventos):
+        if tipo == "estrutura":
+            nivel = _nivel_estrutura(match.group(1))
+            # Um novo nível zera os níveis abaixo dele
+            for outro, ordem in NIVEIS_ESTRUTURA.items():
+                if ordem > NIVEIS_ESTRUTURA[nivel]:
+                    hierarquia.pop(outro, None)
+            hierarquia[nivel] = _nome_estrutura(texto, match)
+            continue
+
+        fim = eventos[i + 1][0] if i + 1 < len(eventos) else len(texto)
+        artigo = texto[inicio:fim].strip()
+        if not artigo:
+            continue
+        numero = match.group(1)
+        for trecho, meta in _dividir_artigo(artigo, numero, tamanho_max):
+            chunks.append((trecho, {
+                **metadados,
+                **hierarquia,
+                "page": pagina_de(inicio),
+                "artigo": numero,
+                **{k: v for k, v in meta.items() if v is not None},
+            }))
+    return chunks
+
+
+def processar_intervalo(
+    caminho: str,
+    inicio: int,
+    fim: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    estrategia: str = "recursivo",
+    moldura: FrozenSet[str] = frozenset(),
+) -> List[ChunkSerializado]:
+    """Extrai as páginas [inicio, fim) de um PDF e as divide em chunks
+
+    Os metadados seguem os do PyMuPDFLoader (`source`, `file_path`, `page`,
+    `total_pages`), usados nas citações. As linhas de `moldura` saem das
+    páginas antes do split.
+    """
+    with pymupdf.open(caminho) as pdf:
+        textos = [remover_moldura(pdf[numero].get_text(), moldura) for numero in range(inicio, fim)]
+        total_paginas = pdf.page_count
+    metadados = {"source": caminho, "file_path": caminho, "total_pages": total_paginas}
+
+    if estrategia == "legal":
+        return dividir_estrutura_legal(textos, metadados, chunk_size, primeira_pagina=inicio)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    paginas = [
+        Document(page_content=texto, metadata={**metadados, "page": inicio + i})
+        for i, texto in enumerate(textos)
+    ]
+    return [(c.page_content, c.metadata) for c in splitter.split_documents(paginas)]
+
+
+def _executar_tarefa(tarefa: Tuple) -> Tuple[bool, object]:
+    """Executa uma tarefa capturando o erro, para não derrubar o pool"""
+    try:
+        return True, processar_intervalo(*tarefa)
+    except Exception as e:
+        return False, str(e)
+
+
+def _executar_tarefas(tarefas: Sequence[Tuple], workers: int) -> Iterator[Tuple[bool, object]]:
+    """Resultados das tarefas na ordem, com no máximo `2 * workers` pendentes"""
+    if workers <= 1 or len(tarefas) <= 1:
+        for tarefa in tarefas:
+            yield _executar_tarefa(tarefa)
+        return
+    # spawn: não herdar threads/estado do processo do Streamlit
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+        pendentes: Deque[Future] = deque()
+        for tarefa in tarefas:
+            pendentes.append(executor.submit(_executar_tarefa, tarefa))
+            if len(pendentes) >= 2 * workers:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+def iterar_pdfs(
+    pdfs: Sequence[Path],
+    chunk_size: int,
+    chunk_overlap: int,
+    workers: int = INGESTAO_WORKERS,
+    paginas_por_tarefa: int = PAGINAS_POR_TAREFA,
+    avisar: Callable[[str], None] = print,
+    estrategia: str = CHUNKER,
+    moldura: bool = INGESTAO_MOLDURA,
+    min_caracteres: int = CHUNK_MIN_CARACTERES,
+    distancia: int = DEDUP_DISTANCIA,
+) -> Iterator[BlocoChunks]:
+    """Lê e divide vários PDFs, entregando um bloco de chunks por vez
+
+    Os blocos saem na ordem (arquivo, página). Um arquivo com erro de
+    leitura gera um único bloco com `erro` preenchido, e os blocos
+    seguintes dele são descartados; quem consome deve desfazer o que já
+    tiver recebido desse arquivo.
+
+    Chunks com até `min_caracteres` caracteres e quase duplicados de outro
+    do mesmo arquivo (`distancia` < 0 desliga) não são entregues.
+    """
+    tarefas = []
+    intervalos = []
+    paginas: Dict[str, int] = {}
+    for pdf in pdfs:
+        chave = chave_arquivo(pdf)
+        try:
+            paginas[chave] = contar_paginas(pdf)
+            linhas_moldura = ler_moldura(pdf) if moldura else frozenset()
+        except Exception as e:
+            avisar(f"✗ Erro ao carregar {chave}: {e}")
+            yield BlocoChunks(chave, 0, 0, 0, [], str(e))
+            continue
+        passo = paginas[chave] if estrategia == "legal" else paginas_por_tarefa
+        for inicio in range(0, paginas[chave], max(1, passo)):
+            fim = min(inicio + passo, paginas[chave])
+            # O `source` dos chunks é a própria chave
+            tarefas.append((chave, inicio, fim, chunk_size, chunk_overlap, estrategia, linhas_moldura))
+            intervalos.append((chave, inicio, fim))
+
+    com_erro = set()
+    deduplicadores: Dict[str, DeduplicadorSimHash] = {}
+    descartados: Counter = Counter()
+    for (nome, inicio, fim), (ok, saida) in zip(intervalos, _executar_tarefas(tarefas, workers)):
+        if nome in com_erro:
+            continue
+        if not ok:
+            avisar(f"✗ Erro ao carregar {nome}: {saida}")
+            com_erro.add(nome)
+            yield BlocoChunks(nome, paginas[nome], inicio, fim, [], saida)
+            continue
+        chunks = []
+        for texto, meta in saida:
+            if len(texto.strip()) <= min_caracteres:
+                descartados["curtos"] += 1
+            elif distancia >= 0 and deduplicadores.setdefault(nome, DeduplicadorSimHash(distancia)).repetido(texto):
+                descartados["duplicados"] += 1
+            else:
+                chunks.append(Document(page_content=texto, metadata=meta))
+        yield BlocoChunks(nome, paginas[nome], inicio, fim, chunks)
+
+    if descartados:
+        avisar(
+            f"Chunks descartados: {descartados['curtos']} curtos, {descartados['duplicados']} quase duplicados"
+        )
+
+
+def processar_pdfs(
+    pdfs: Sequence[Path],
+    chunk_size: int,
+    chunk_overlap: int,
+    workers: int = INGESTAO_WORKERS,
+    paginas_por_tarefa: int = PAGINAS_POR_TAREFA,
+    avisar: Callable[[str], None] = print,
+    estrategia: str = CHUNKER,
+    moldura: bool = INGESTAO_MOLDURA,
+    min_caracteres: int = CHUNK_MIN_CARACTERES,
+    distancia: int = DEDUP_DISTANCIA,
+) -> Dict[str, Tuple[int, List[Document]]]:
+    """`iterar_pdfs` com todos os chunks em memória
+
+    Returns:
+        Dicionário `chave_arquivo` -> (número de páginas, chunks), na mesma
+        ordem de `pdfs`. Arquivos com erro de leitura ficam com (0, [])
+    """
+    resultado: Dict[str, Tuple[int, List[Document]]] = {chave_arquivo(pdf): (0, []) for pdf in pdfs}
+    blocos = iterar_pdfs(
+        pdfs, chunk_size, chunk_overlap, workers, paginas_por_tarefa, avisar, estrategia, moldura, min_caracteres, distancia
+    )
+    for bloco in blocos:
+        if bloco.erro is not None:
+            resultado[bloco.nome] = (0, [])
+            continue
+        chunks = resultado[bloco.nome][1]
+        chunks.extend(bloco.chunks)
+        resultado[bloco.nome] = (bloco.paginas, chunks)
+    return resultado
@@ -0,0 +1,103 @@
+"""Limite de taxa e retentativas para chamadas às APIs de modelos
+
+O plano gratuito do Gemini limita requisições por minuto; estourar o
+limite devolve 429 (RESOURCE_EXHAUSTED). Aqui ficam um token bucket
+thread-safe e um executor com backoff exponencial para esses erros.
+"""
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LimitadorTaxa:
+    """Token bucket: no máximo `por_minuto` aquisições por minuto
+
+    `rajada` define quantas aquisições podem acontecer de uma vez depois de
+    um período ocioso. Com `por_minuto <= 0` o limitador não bloqueia.
+    """
+
+    def __init__(self, por_minuto: float, rajada: Optional[int] = None):
+        self.por_minuto = por_minuto
+        self.capacidade = float(rajada if rajada is not None else max(1, int(por_minuto // 4) or 1))
+        self._tokens = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self, agora: float) -> None:
+        taxa = self.por_minuto / 60.0
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * taxa)
+        self._ultimo = agora
+
+    def tentar_adquirir(self) -> float:
+        """Tenta consumir um token sem bloquear
+
+        Returns:
+            0 se conseguiu, senão quantos segundos esperar antes de tentar de novo
+        """
+        if self.por_minuto <= 0:
+            return 0.0
+        with self._lock:
+            self._repor(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) * 60.0 / self.por_minuto
+
+    def adquirir(self) -> None:
+        """Bloqueia até haver um token disponível"""
+        while True:
+            espera = self.tentar_adquirir()
+            if espera <= 0:
+                return
+            time.sleep(espera)
+
+
+def eh_erro_limite(erro: BaseException) -> bool:
+    """Indica se a exceção é um 429 / cota esgotada do backend"""
+    for atributo in ("code", "status_code"):
+        valor = getattr(erro, atributo, None)
+        if valor == 429 or getattr(valor, "value", None) == 429:
+            return True
+    resposta = getattr(erro, "response", None)
+    if getattr(resposta, "status_code", None) == 429:
+        return True
+    texto = str(erro).upper()
+    return "429" in texto or "RESOURCE_EXHAUSTED" in texto or "RATE LIMIT" in texto
+
+
+def eh_erro_transitorio(erro: BaseException) -> bool:
+    """Erros que valem nova tentativa: limite de taxa, timeout e indisponibilidade"""
+    if eh_erro_limite(erro):
+        return True
+    if isinstance(erro, (TimeoutError, ConnectionError)):
+        return True
+    texto = str(erro).upper()
+    return "503" in texto or "UNAVAILABLE" in texto or "TIMEOUT" in texto or "TIMED OUT" in texto
+
+
+def executar_com_retentativa(
+    funcao: Callable[[], T],
+    max_tentativas: int = 6,
+    espera_base: float = 2.0,
+    espera_maxima: float = 60.0,
+    limitador: Optional[LimitadorTaxa] = None,
+) -> T:
+    """Executa `funcao` repetindo em erros transitórios com backoff exponencial
+
+    Cada tentativa consome um token do `limitador`, se informado. O jitter
+    evita que várias threads voltem a bater no backend ao mesmo tempo.
+    """
+    for tentativa in range(max_tentativas):
+        if limitador is not None:
+            limitador.adquirir()
+        try:
+            return funcao()
+        except Exception as e:
+            if tentativa == max_tentativas - 1 or not eh_erro_transitorio(e):
+                raise
+            espera = min(espera_maxima, espera_base * (2 ** tentativa))
+            time.sleep(espera * (0.5 + random.random() / 2))
+    raise RuntimeError("max_tentativas deve ser maior que zero")
@@ -0,0 +1,206 @@
+"""Execução em lote do grafo de consulta, sem interface
+
+Lê perguntas de um arquivo (uma por linha em .txt, ou JSONL com
+`pergunta` e opcionalmente `id`), passa cada uma pelo mesmo grafo do app
+(triagem → RAG / pedir informação / chamado) em um pool limitado de
+threads e grava um JSONL com o resultado, o tempo de cada nó e suas etapas
+(embedding, busca, LLM), tokens e acertos de cache.
+
+As perguntas são lidas sob demanda e os resultados saem na ordem de
+entrada, então arquivos grandes não precisam caber na memória. As
+chamadas ao LLM e aos embeddings passam pelo escalonador do motor, que
+aplica os limites de taxa e de concorrência a todas as perguntas.
+
+Com `--assincrono`, as perguntas rodam como corrotinas (`ainvoke` do
+grafo) em um único event loop, em vez de uma thread por pergunta.
+
+Uso:
+    python lote.py perguntas.txt --saida resultados.jsonl --workers 4
+    python lote.py perguntas.jsonl --req-por-minuto 60 > resultados.jsonl
+    python lote.py perguntas.txt --assincrono --workers 16
+
+Como biblioteca:
+    from consulta import montar_motor
+    from lote import executar_lote, ler_perguntas
+    for resultado in executar_lote(montar_motor(), ler_perguntas("perguntas.txt")):
+        ...
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, Optional, TextIO
+
+from consulta import MotorConsulta, montar_motor, referencia_chunk
+
+
+def ler_perguntas(caminho: str) -> Iterator[Dict]:
+    """Perguntas de um arquivo .txt (uma por linha) ou .jsonl (`-` = stdin)
+
+    Linhas vazias e começando com `#` são ignoradas. Sem `id`, o número da
+    linha é usado.
+    """
+    arquivo = sys.stdin if caminho == "-" else open(caminho, encoding="utf-8")
+    try:
+        for numero, linha in enumerate(arquivo, 1):
+            linha = linha.strip()
+            if not linha or linha.startswith("#"):
+                continue
+            if linha.startswith("{"):
+                registro = json.loads(linha)
+                yield {"id": registro.get("id", numero), "pergunta": registro["pergunta"]}
+            else:
+                yield {"id": numero, "pergunta": linha}
+    finally:
+        if arquivo is not sys.stdin:
+            arquivo.close()
+
+
+def _consultar(motor: MotorConsulta, item: Dict) -> Dict:
+    inicio = time.perf_counter()
+    try:
+        estado = motor.consultar(item["pergunta"])
+    except Exception as e:
+        return _resultado_erro(item, e, inicio)
+    return _resultado(item, estado, inicio)
+
+
+async def _aconsultar(motor: MotorConsulta, item: Dict, limite: asyncio.Semaphore) -> Dict:
+    async with limite:
+        inicio = time.perf_counter()
+        try:
+            estado = await motor.aconsultar(item["pergunta"])
+        except Exception as e:
+            return _resultado_erro(item, e, inicio)
+        return _resultado(item, estado, inicio)
+
+
+def _resultado_erro(item: Dict, erro: Exception, inicio: float) -> Dict:
+    return {
+        "id": item["id"],
+        "pergunta": item["pergunta"],
+        "erro": f"{type(erro).__name__}: {erro}",
+        "tempo_total": time.perf_counter() - inicio,
+    }
+
+
+def _resultado(item: Dict, estado: Dict, inicio: float) -> Dict:
+    return {
+        "id": item["id"],
+        "pergunta": item["pergunta"],
+        "triagem": estado.get("triagem"),
+        "acao_final": estado.get("acao_final"),
+        "resposta": estado.get("resposta"),
+        "rag_sucesso": estado.get("rag_sucesso"),
+        "resposta_do_cache": estado.get("resposta_do_cache", False),
+        "citacoes": [
+            {
+                "referencia": referencia_chunk(doc),
+                "source": doc.metadata.get("source"),
+                "page": doc.metadata.get("page"),
+            }
+            for doc in estado.get("citacoes", [])
+        ],
+        "contexto": estado.get("contexto"),
+        "tempos": estado.get("tempos", {}),
+        "metricas": estado.get("metricas", {}),
+        "tempo_total": time.perf_counter() - inicio,
+    }
+
+
+def executar_lote(motor: MotorConsulta, perguntas: Iterable[Dict], workers: int = 4) -> Iterator[Dict]:
+    """Executa as perguntas em paralelo e devolve os resultados na ordem de entrada
+
+    No máximo `2 * workers` perguntas ficam em andamento ou aguardando a
+    vez de sair, o que limita a memória independentemente do tamanho da
+    entrada.
+    """
+    max_pendentes = max(1, 2 * workers)
+    pendentes: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lote") as executor:
+        for item in perguntas:
+            pendentes.append(executor.submit(_consultar, motor, item))
+            while len(pendentes) >= max_pendentes:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+def executar_lote_assincrono(
+    motor: MotorConsulta, perguntas: Iterable[Dict], concorrencia: int = 4
+) -> Iterator[Dict]:
+    """Como `executar_lote`, mas com corrotinas em um event loop próprio
+
+    No máximo `concorrencia` perguntas rodam ao mesmo tempo; a janela de
+    pendentes é a mesma de `executar_lote`.
+    """
+    max_pendentes = max(1, 2 * concorrencia)
+    loop = asyncio.new_event_loop()
+    try:
+        limite = asyncio.Semaphore(concorrencia)
+        pendentes: Deque[asyncio.Task] = deque()
+        for item in perguntas:
+            pendentes.append(loop.create_task(_aconsultar(motor, item, limite)))
+            while len(pendentes) >= max_pendentes:
+                # Enquanto espera a mais antiga, o loop também avança as outras
+                yield loop.run_until_complete(pendentes.popleft())
+        while pendentes:
+            yield loop.run_until_complete(pendentes.popleft())
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def gravar_jsonl(resultados: Iterable[Dict], saida: TextIO) -> Dict:
+    """Grava os resultados (um JSON por linha) e devolve um resumo"""
+    total = erros = 0
+    inicio = time.perf_counter()
+    for resultado in resultados:
+        saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        saida.flush()
+        total += 1
+        erros += "erro" in resultado
+    duracao = time.perf_counter() - inicio
+    return {"perguntas": total, "erros": erros, "segundos": duracao, "por_segundo": total / duracao if duracao else 0.0}
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", help="Arquivo .txt/.jsonl com as perguntas (- para stdin)")
+    parser.add_argument("--saida", type=Path, help="JSONL de saída (padrão: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="Perguntas em paralelo")
+    parser.add_argument(
+        "--assincrono", action="store_true",
+        help="Roda as perguntas como corrotinas (ainvoke) em vez de threads",
+    )
+    parser.add_argument(
+        "--req-por-minuto", type=float, default=None,
+        help="Limite de chamadas ao LLM (padrão: LLM_REQ_POR_MINUTO ou 15/min no Gemini)",
+    )
+    args = parser.parse_args(argv)
+
+    def avisar(mensagem: str) -> None:
+        print(mensagem, file=sys.stderr)
+
+    motor = montar_motor(avisar=avisar, llm_req_por_minuto=args.req_por_minuto, workers_especulativos=args.workers)
+    if args.assincrono:
+        resultados = executar_lote_assincrono(motor, ler_perguntas(args.entrada), concorrencia=args.workers)
+    else:
+        resultados = executar_lote(motor, ler_perguntas(args.entrada), workers=args.workers)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as saida:
+            resumo = gravar_jsonl(resultados, saida)
+    else:
+        resumo = gravar_jsonl(resultados, sys.stdout)
+    avisar(
+        f"{resumo['perguntas']} perguntas em {resumo['segundos']:.1f}s "
+        f"({resumo['por_segundo']:.2f}/s), {resumo['erros']} com erro"
+    )
+
+
+if __name__ == "__main__":
+    main()
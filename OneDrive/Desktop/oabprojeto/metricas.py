@@ -0,0 +1,302 @@
+"""Métricas do grafo: detalhamento por consulta e histogramas do processo
+
+Cada nó do grafo roda dentro de um `rastrear()`, que abre um rastro
+próprio (via contextvar, então funciona em threads do LangGraph e do
+pool especulativo). Dentro dele, `etapa("busca")` cronometra um passo e
+`contar("tokens_prompt", n)` soma um contador; os dois valores vão para o
+rastro do nó, que o app mostra por pergunta, e para o registro global,
+que acumula histogramas e contadores para todo o processo.
+
+O registro global é exposto em texto Prometheus (`/metrics`) e JSON
+(`/metrics.json`) por um servidor HTTP local opcional:
+
+    METRICAS_PORTA=9464 streamlit run app.py
+    curl http://127.0.0.1:9464/metrics
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import empacotamento
+
+# Porta do servidor de métricas (0 desliga); só escuta em METRICAS_HOST
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", "9464"))
+METRICAS_HOST = os.getenv("METRICAS_HOST", "127.0.0.1")
+
+PREFIXO = "oab_consulta"
+
+# Limites dos buckets dos histogramas
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKETS_TAMANHO = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+class Histograma:
+    """Contagens cumulativas por bucket, soma e total (formato Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.contagens = [0] * (len(self.buckets) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        self.contagens[bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def cumulativas(self) -> Iterator[Tuple[str, int]]:
+        acumulado = 0
+        for limite, contagem in zip(self.buckets, self.contagens):
+            acumulado += contagem
+            yield f"{limite:g}", acumulado
+        yield "+Inf", self.total
+
+
+class RegistroMetricas:
+    """Contadores, medidores e histogramas do processo, com rótulos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores: Dict[str, Counter] = {}
+        self._medidores: Dict[str, Dict[Rotulos, float]] = {}
+        self._histogramas: Dict[str, Dict[Rotulos, Histograma]] = {}
+        self._ajuda: Dict[str, str] = {}
+
+    def incrementar(self, nome: str, valor: float = 1, ajuda: str = "", **rotulos: str) -> None:
+        with self._lock:
+            self._contadores.setdefault(nome, Counter())[tuple(sorted(rotulos.items()))] += valor
+            if ajuda:
+                self._ajuda.setdefault(nome, ajuda)
+
+    def definir(self, nome: str, valor: float, ajuda: str = "", **rotulos: str) -> None:
+        """Valor instantâneo (ex.: profundidade de fila)"""
+        with self._lock:
+            self._medidores.setdefault(nome, {})[tuple(sorted(rotulos.items()))] = valor
+            if ajuda:
+                self._ajuda.setdefault(nome, ajuda)
+
+    def observar(
+        self,
+        nome: str,
+        valor: float,
+        buckets: Sequence[float] = BUCKETS_SEGUNDOS,
+        ajuda: str = "",
+        **rotulos: str,
+    ) -> None:
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            por_rotulo = self._histogramas.setdefault(nome, {})
+            if chave not in por_rotulo:
+                por_rotulo[chave] = Histograma(buckets)
+            por_rotulo[chave].observar(valor)
+            if ajuda:
+                self._ajuda.setdefault(nome, ajuda)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._contadores.clear()
+            self._medidores.clear()
+            self._histogramas.clear()
+
+    @staticmethod
+    def _rotulos(rotulos: Rotulos, extra: Optional[Tuple[str, str]] = None) -> str:
+        pares = list(rotulos) + ([extra] if extra else [])
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+    def prometheus(self) -> str:
+        """Formato de exposição em texto do Prometheus"""
+        linhas = []
+        with self._lock:
+            for nome, valores in sorted(self._contadores.items()):
+                completo = f"{PREFIXO}_{nome}_total"
+                if nome in self._ajuda:
+                    linhas.append(f"# HELP {completo} {self._ajuda[nome]}")
+                linhas.append(f"# TYPE {completo} counter")
+                for rotulos, valor in sorted(valores.items()):
+                    linhas.append(f"{completo}{self._rotulos(rotulos)} {valor:g}")
+            for nome, valores in sorted(self._medidores.items()):
+                completo = f"{PREFIXO}_{nome}"
+                if nome in self._ajuda:
+                    linhas.append(f"# HELP {completo} {self._ajuda[nome]}")
+                linhas.append(f"# TYPE {completo} gauge")
+                for rotulos, valor in sorted(valores.items()):
+                    linhas.append(f"{completo}{self._rotulos(rotulos)} {valor:g}")
+            for nome, por_rotulo in sorted(self._histogramas.items()):
+                completo = f"{PREFIXO}_{nome}"
+                if nome in self._ajuda:
+                    linhas.append(f"# HELP {completo} {self._ajuda[nome]}")
+                linhas.append(f"# TYPE {completo} histogram")
+                for rotulos, histograma in sorted(por_rotulo.items()):
+                    for limite, acumulado in histograma.cumulativas():
+                        linhas.append(f"{completo}_bucket{self._rotulos(rotulos, ('le', limite))} {acumulado}")
+                    linhas.append(f"{completo}_sum{self._rotulos(rotulos)} {histograma.soma:g}")
+                    linhas.append(f"{completo}_count{self._rotulos(rotulos)} {histograma.total}")
+        return "\n".join(linhas) + "\n"
+
+    def json(self) -> Dict:
+        """Mesmos dados em JSON (rótulos como `chave=valor,...`)"""
+        def chave(rotulos: Rotulos) -> str:
+            return ",".join(f"{k}={v}" for k, v in rotulos)
+
+        with self._lock:
+            return {
+                "contadores": {
+                    nome: {chave(r): v for r, v in valores.items()}
+                    for nome, valores in self._contadores.items()
+                },
+                "medidores": {
+                    nome: {chave(r): v for r, v in valores.items()}
+                    for nome, valores in self._medidores.items()
+                },
+                "histogramas": {
+                    nome: {
+                        chave(r): {
+                            "buckets": dict(h.cumulativas()),
+                            "soma": h.soma,
+                            "total": h.total,
+                        }
+                        for r, h in por_rotulo.items()
+                    }
+                    for nome, por_rotulo in self._histogramas.items()
+                },
+            }
+
+
+REGISTRO = RegistroMetricas()
+
+
+class RastroConsulta:
+    """Tempos por etapa e contadores de um nó (ou de uma consulta inteira)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas: Dict[str, float] = {}
+        self.contadores: Counter = Counter()
+
+    def registrar_etapa(self, nome: str, segundos: float) -> None:
+        with self._lock:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def contar(self, nome: str, valor: float = 1) -> None:
+        with self._lock:
+            self.contadores[nome] += valor
+
+    def incorporar(self, outro: "RastroConsulta") -> None:
+        """Soma as etapas e contadores de outro rastro (ex.: da busca especulativa)"""
+        for nome, segundos in outro.etapas.items():
+            self.registrar_etapa(nome, segundos)
+        for nome, valor in outro.contadores.items():
+            self.contar(nome, valor)
+
+    def resumo(self) -> Dict:
+        with self._lock:
+            return {"etapas": dict(self.etapas), **self.contadores}
+
+
+_rastro_atual: ContextVar[Optional[RastroConsulta]] = ContextVar("rastro_consulta", default=None)
+
+
+def rastro_atual() -> Optional[RastroConsulta]:
+    return _rastro_atual.get()
+
+
+@contextmanager
+def rastrear() -> Iterator[RastroConsulta]:
+    """Abre um rastro novo para o código dentro do bloco"""
+    rastro = RastroConsulta()
+    token = _rastro_atual.set(rastro)
+    try:
+        yield rastro
+    finally:
+        _rastro_atual.reset(token)
+
+
+@contextmanager
+def etapa(nome: str) -> Iterator[None]:
+    """Cronometra um passo (no rastro atual e no histograma `etapa_segundos`)"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        rastro = _rastro_atual.get()
+        if rastro is not None:
+            rastro.registrar_etapa(nome, segundos)
+        REGISTRO.observar("etapa_segundos", segundos, ajuda="Duração de cada etapa das consultas", etapa=nome)
+
+
+def contar(nome: str, valor: float = 1) -> None:
+    """Soma um contador no rastro atual e no registro global"""
+    rastro = _rastro_atual.get()
+    if rastro is not None:
+        rastro.contar(nome, valor)
+    REGISTRO.incrementar(nome, valor)
+
+
+def observar_no(no: str, segundos: float) -> None:
+    REGISTRO.observar("no_segundos", segundos, ajuda="Duração de cada nó do grafo", no=no)
+
+
+def registrar_chamada_llm(tipo: str, prompt: str, resposta, texto_resposta: str) -> None:
+    """Tamanhos e tokens de uma chamada ao LLM
+
+    Os tokens vêm de `usage_metadata` quando o provedor informa; senão são
+    estimados pelo tamanho do texto.
+    """
+    uso = getattr(resposta, "usage_metadata", None) or {}
+    tokens_prompt = uso.get("input_tokens") or empacotamento.estimar_tokens(prompt)
+    tokens_resposta = uso.get("output_tokens") or empacotamento.estimar_tokens(texto_resposta)
+    contar("chamadas_llm")
+    contar(f"tokens_prompt_{tipo}", tokens_prompt)
+    contar(f"tokens_resposta_{tipo}", tokens_resposta)
+    contar(f"caracteres_prompt_{tipo}", len(prompt))
+    contar(f"caracteres_resposta_{tipo}", len(texto_resposta))
+    REGISTRO.observar("tokens_prompt", tokens_prompt, BUCKETS_TAMANHO, "Tokens enviados ao LLM", chamada=tipo)
+    REGISTRO.observar("tokens_resposta", tokens_resposta, BUCKETS_TAMANHO, "Tokens gerados pelo LLM", chamada=tipo)
+
+
+# ------------------------------------------------------------------ servidor
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        caminho = self.path.split("?")[0]
+        if caminho == "/metrics":
+            corpo = REGISTRO.prometheus().encode()
+            tipo = "text/plain; version=0.0.4; charset=utf-8"
+        elif caminho == "/metrics.json":
+            corpo = json.dumps(REGISTRO.json()).encode()
+            tipo = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor(porta: int = METRICAS_PORTA, host: str = METRICAS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Sobe o servidor de métricas em uma thread daemon (None se desligado ou porta ocupada)"""
+    if porta <= 0:
+        return None
+    try:
+        servidor = ThreadingHTTPServer((host, porta), _Handler)
+    except OSError:
+        return None
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
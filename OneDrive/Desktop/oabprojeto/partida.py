@@ -0,0 +1,151 @@
+"""Perfil da partida a frio e montagem do sistema em segundo plano
+
+Na primeira execução do app quase todo o tempo vai em imports (LangChain,
+LangGraph, FAISS, o SDK do backend) e na montagem das peças (clientes do
+LLM, embeddings, índice, reranqueador, grafo). Este módulo:
+
+- mede cada import e cada inicialização por componente (`importar`,
+  `medir`) e os marcos da partida (`marcar`, ex.: primeira renderização),
+  em segundos desde que o módulo foi importado. Um módulo já carregado
+  por outro não custa nada de novo: o tempo fica com quem importou
+  primeiro;
+- roda a montagem em uma thread (`InicializacaoSegundoPlano`), para a
+  interface aparecer e aceitar a pergunta enquanto o sistema carrega.
+
+Só usa a biblioteca padrão, para poder ser o primeiro import do app.
+"""
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class PerfilPartida:
+    """Tempos de import e de inicialização por componente, e marcos da partida"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.medicoes: List[Dict] = []
+        self.marcos: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _agora(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    @contextmanager
+    def medir(self, componente: str, fase: str = "init") -> Iterator[None]:
+        """Cronometra o bloco como `fase` ("import" ou "init") do componente"""
+        inicio = self._agora()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.medicoes.append({
+                    "componente": componente,
+                    "fase": fase,
+                    "inicio_s": inicio,
+                    "segundos": self._agora() - inicio,
+                })
+
+    def importar(self, modulo: str, componente: Optional[str] = None) -> Any:
+        """`importlib.import_module` medido como import do componente"""
+        with self.medir(componente or modulo, "import"):
+            return importlib.import_module(modulo)
+
+    def marcar(self, marco: str) -> float:
+        """Registra o marco na primeira vez (reruns não o movem) e devolve seus segundos"""
+        with self._lock:
+            return self.marcos.setdefault(marco, self._agora())
+
+    def resumo(self) -> Dict:
+        """Marcos, medições em ordem e totais por fase"""
+        with self._lock:
+            medicoes = sorted(self.medicoes, key=lambda m: m["inicio_s"])
+            marcos = dict(self.marcos)
+        totais: Dict[str, float] = {}
+        for medicao in medicoes:
+            totais[medicao["fase"]] = totais.get(medicao["fase"], 0.0) + medicao["segundos"]
+        return {"marcos": marcos, "componentes": medicoes, "totais_s": totais}
+
+    def linha(self) -> str:
+        """Resumo em uma linha, para o log"""
+        resumo = self.resumo()
+        partes = [", ".join(f"{marco} {s:.2f}s" for marco, s in resumo["marcos"].items())]
+        for fase in ("import", "init"):
+            itens = [m for m in resumo["componentes"] if m["fase"] == fase]
+            if itens:
+                partes.append(f"{fase}: " + ", ".join(f"{m['componente']} {m['segundos']:.2f}s" for m in itens))
+        return "partida: " + " | ".join(p for p in partes if p)
+
+    def publicar(self) -> None:
+        """Copia o perfil para o registro de métricas (`/metrics`)"""
+        import metricas
+
+        resumo = self.resumo()
+        for medicao in resumo["componentes"]:
+            metricas.REGISTRO.definir(
+                "partida_segundos", medicao["segundos"],
+                ajuda="Import e inicialização de cada componente na partida",
+                componente=medicao["componente"], fase=medicao["fase"],
+            )
+        for marco, segundos in resumo["marcos"].items():
+            metricas.REGISTRO.definir(
+                "partida_marco_segundos", segundos, ajuda="Segundos até cada marco da partida", marco=marco
+            )
+
+
+PERFIL = PerfilPartida()
+medir = PERFIL.medir
+importar = PERFIL.importar
+marcar = PERFIL.marcar
+
+
+class InicializacaoSegundoPlano:
+    """Roda `montar(inicializacao)` em uma thread própria
+
+    A função informa o andamento com `etapa` e `progresso` e pode deixar
+    mensagens em `avisos`; quem espera consulta `etapa_atual`, `fracao` e
+    `texto_progresso` e chama `aguardar` até ficar pronta. Um erro na
+    montagem fica em `erro`.
+    """
+
+    def __init__(self, montar: Callable[["InicializacaoSegundoPlano"], Any], perfil: PerfilPartida = PERFIL):
+        self.perfil = perfil
+        self.etapa_atual = "Iniciando..."
+        self.fracao: Optional[float] = None
+        self.texto_progresso = ""
+        self.avisos: List[str] = []
+        self.resultado: Any = None
+        self.erro: Optional[Exception] = None
+        self._pronta = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, args=(montar,), name="inicializacao", daemon=True)
+        self._thread.start()
+
+    def _rodar(self, montar: Callable[["InicializacaoSegundoPlano"], Any]) -> None:
+        try:
+            self.resultado = montar(self)
+            self.perfil.marcar("pronto")
+        except Exception as e:
+            self.erro = e
+        finally:
+            self._pronta.set()
+
+    def etapa(self, texto: str) -> None:
+        self.etapa_atual = texto
+        self.fracao = None
+
+    def progresso(self, fracao: float, texto: str) -> None:
+        self.fracao = fracao
+        self.texto_progresso = texto
+
+    def avisar(self, mensagem: str) -> None:
+        self.avisos.append(mensagem)
+
+    def pronta(self) -> bool:
+        return self._pronta.is_set()
+
+    def aguardar(self, timeout: Optional[float] = None) -> bool:
+        """True quando a montagem terminou (com sucesso ou erro)"""
+        return self._pronta.wait(timeout)
+
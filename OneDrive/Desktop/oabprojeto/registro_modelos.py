@@ -0,0 +1,162 @@
+"""Registro dos clientes de LLM, reaproveitados entre reruns do Streamlit
+
+Os clientes são criados uma vez por configuração (provedor, modelo,
+endpoint, temperaturas, chave) e ficam vivos no processo. As conexões HTTP
+também: o ChatOllama do `langchain-ollama` e o cliente do Gemini mantêm um
+cliente httpx por instância, aqui com keep-alive longo (o padrão fecha
+conexões ociosas após 5 s, o que custava um handshake TLS a cada
+pergunta). Só uma mudança na configuração troca os clientes.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+# Os SDKs só são importados quando o provedor é usado: o do Gemini sozinho
+# leva quase um segundo para importar, e quem usa o Ollama não precisa dele
+GEMINI_DISPONIVEL = importlib.util.find_spec("langchain_google_genai") is not None
+OLLAMA_DISPONIVEL = importlib.util.find_spec("langchain_ollama") is not None
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Tempo que o Ollama mantém o modelo carregado após uma chamada
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Segundos que uma conexão ociosa fica aberta no pool
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "300"))
+HTTP_MAX_CONEXOES = int(os.getenv("HTTP_MAX_CONEXOES", "10"))
+
+MODELOS_OLLAMA_PREFERIDOS = ("llama3.2", "mistral", "phi3")
+
+
+@dataclass(frozen=True)
+class ConfiguracaoLLM:
+    """Tudo que define os clientes; a chave do registro deriva daqui"""
+    provedor: str  # "gemini" ou "ollama"
+    modelo: str
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    temperatura: float = 1.0
+    temperatura_triagem: float = 0.0
+    # Tentativas do próprio cliente em 429/5xx (None = padrão do cliente);
+    # com roteamento, 1: o erro volta logo e a chamada vai para outro backend
+    max_tentativas: Optional[int] = None
+
+    def chave(self) -> str:
+        dados = asdict(self)
+        # A chave da API não vai em claro para a chave do registro
+        dados["api_key"] = hashlib.sha256((self.api_key or "").encode()).hexdigest()[:16]
+        return hashlib.sha256(json.dumps(dados, sort_keys=True).encode()).hexdigest()
+
+
+def escolher_modelo_ollama(modelos_instalados: Optional[Dict]) -> str:
+    """Primeiro modelo preferido instalado no Ollama (resposta de /api/tags)"""
+    nomes = [m.get("name", "").split(":")[0] for m in (modelos_instalados or {}).get("models", [])]
+    for preferido in MODELOS_OLLAMA_PREFERIDOS:
+        if preferido in nomes:
+            return preferido
+    return nomes[0] if nomes else MODELOS_OLLAMA_PREFERIDOS[0]
+
+
+def limites_http(max_conexoes: int = HTTP_MAX_CONEXOES) -> Any:
+    """Pool de conexões keep-alive dos clientes httpx"""
+    import httpx
+
+    return httpx.Limits(
+        max_connections=max_conexoes,
+        max_keepalive_connections=max_conexoes,
+        keepalive_expiry=HTTP_KEEPALIVE,
+    )
+
+
+class RegistroModelos:
+    """Clientes de LLM por configuração, criados uma vez por processo
+
+    `obter` devolve sempre os mesmos objetos para a mesma configuração;
+    uma configuração diferente fecha as conexões da anterior e cria novos
+    clientes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chave: Optional[str] = None
+        self._modelos: Optional[Tuple[Any, Any]] = None
+        self.criacoes = 0
+
+    def obter(self, configuracao: ConfiguracaoLLM) -> Tuple[Any, Any]:
+        """(llm, llm_triagem) da configuração dada"""
+        chave = configuracao.chave()
+        with self._lock:
+            if self._chave == chave and self._modelos is not None:
+                return self._modelos
+            self._fechar()
+            self._modelos = self._criar(configuracao)
+            self._chave = chave
+            self.criacoes += 1
+            threading.Thread(target=self._aquecer, args=(configuracao,), daemon=True).start()
+            return self._modelos
+
+    def invalidar(self) -> None:
+        """Descarta os clientes atuais (o próximo `obter` recria)"""
+        with self._lock:
+            self._fechar()
+
+    def _fechar(self) -> None:
+        self._modelos = None
+        self._chave = None
+
+    def _criar(self, configuracao: ConfiguracaoLLM) -> Tuple[Any, Any]:
+        if configuracao.provedor == "gemini":
+            if not GEMINI_DISPONIVEL:
+                raise ImportError("langchain-google-genai não está instalado. Adicione ao requirements.txt")
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            limites = limites_http()
+            extras = {"base_url": configuracao.base_url} if configuracao.base_url else {}
+            if configuracao.max_tentativas is not None:
+                extras["max_retries"] = configuracao.max_tentativas
+            return tuple(
+                ChatGoogleGenerativeAI(
+                    model=configuracao.modelo,
+                    temperature=temperatura,
+                    google_api_key=configuracao.api_key,
+                    client_args={"limits": limites},
+                    **extras,
+                )
+                for temperatura in (configuracao.temperatura, configuracao.temperatura_triagem)
+            )
+
+        if not OLLAMA_DISPONIVEL:
+            raise ImportError("langchain-ollama não está instalado. Adicione ao requirements.txt")
+        from langchain_ollama import ChatOllama
+
+        limites = limites_http()
+        return tuple(
+            ChatOllama(
+                model=configuracao.modelo,
+                temperature=temperatura,
+                base_url=configuracao.base_url or OLLAMA_URL,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                client_kwargs={"limits": limites},
+            )
+            for temperatura in (configuracao.temperatura, configuracao.temperatura_triagem)
+        )
+
+    def _aquecer(self, configuracao: ConfiguracaoLLM) -> None:
+        """Abre as conexões (e, no Ollama, carrega o modelo) antes da primeira pergunta"""
+        try:
+            if configuracao.provedor == "ollama":
+                base_url = configuracao.base_url or OLLAMA_URL
+                # Requisição sem prompt: só carrega o modelo na memória
+                requests.post(
+                    f"{base_url}/api/generate",
+                    json={"model": configuracao.modelo, "keep_alive": OLLAMA_KEEP_ALIVE},
+                    timeout=30,
+                )
+            elif configuracao.provedor == "gemini" and self._modelos is not None:
+                self._modelos[0].client.models.get(model=configuracao.modelo)
+        except Exception:
+            pass  # Aquecimento é só otimização
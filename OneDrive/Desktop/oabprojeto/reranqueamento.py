@@ -0,0 +1,163 @@
+"""Reranqueamento dos chunks recuperados com um cross-encoder
+
+A busca devolve os k chunks mais parecidos com a pergunta, e todos vão
+para o prompt. Um cross-encoder lê pergunta e chunk juntos e ordena bem
+melhor, então dá para buscar mais candidatos e mandar só os N melhores
+ao LLM (prompt menor, resposta igual ou melhor).
+
+O modelo roda em CPU, em lotes, com um número fixo de threads e um lote
+por vez no processo. As pontuações ficam em cache por (pergunta, id do
+chunk), então perguntas repetidas e candidatos que se repetem entre
+perguntas parecidas não são pontuados de novo.
+
+Opcional (`RERANK=1`); usa o `CrossEncoder` do sentence-transformers.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+import empacotamento
+import metricas
+from busca_lexical import normalizar
+
+RERANK = os.getenv("RERANK", "0") == "1"
+# Modelo multilíngue (o corpus e as perguntas são em português)
+RERANK_MODELO = os.getenv("RERANK_MODELO", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# Candidatos buscados no índice e chunks que seguem para o prompt
+RERANK_CANDIDATOS = int(os.getenv("RERANK_CANDIDATOS", "20"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_LOTE = int(os.getenv("RERANK_LOTE", "16"))
+# Threads de CPU do modelo
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "2"))
+RERANK_CACHE_MAX = int(os.getenv("RERANK_CACHE_MAX", "10000"))
+
+# Recebe pares (pergunta, texto) e devolve uma pontuação por par
+Pontuador = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+
+def id_chunk(doc: Document) -> str:
+    """Id do chunk no docstore, ou hash do texto para documentos sem id"""
+    if getattr(doc, "id", None):
+        return doc.id
+    return hashlib.blake2b(doc.page_content.encode(), digest_size=16).hexdigest()
+
+
+def _chave_pergunta(pergunta: str) -> str:
+    return re.sub(r"\s+", " ", normalizar(pergunta)).strip()
+
+
+class Reranqueador:
+    """Reordena candidatos com um pontuador e devolve os `top_n` melhores
+
+    Args:
+        pontuador: Função que pontua pares (pergunta, texto), ex.: o
+            `predict` de um cross-encoder
+        top_n: Chunks mantidos
+        candidatos: Chunks que a busca deve trazer para o reranqueamento
+        tamanho_lote: Pares por chamada ao pontuador
+        cache_max: Pontuações guardadas (LRU)
+    """
+
+    def __init__(
+        self,
+        pontuador: Pontuador,
+        top_n: int = RERANK_TOP_N,
+        candidatos: int = RERANK_CANDIDATOS,
+        tamanho_lote: int = RERANK_LOTE,
+        cache_max: int = RERANK_CACHE_MAX,
+    ):
+        self.pontuador = pontuador
+        self.top_n = top_n
+        self.candidatos = max(candidatos, top_n)
+        self.tamanho_lote = tamanho_lote
+        self.cache_max = cache_max
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock_cache = threading.Lock()
+        # Um lote por vez: as threads do modelo já ocupam a CPU reservada
+        self._lock_modelo = threading.Lock()
+
+    def _do_cache(self, chaves: List[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+        encontradas = {}
+        with self._lock_cache:
+            for chave in chaves:
+                if chave in self._cache:
+                    self._cache.move_to_end(chave)
+                    encontradas[chave] = self._cache[chave]
+        return encontradas
+
+    def _guardar(self, pontuacoes: Dict[Tuple[str, str], float]) -> None:
+        with self._lock_cache:
+            self._cache.update(pontuacoes)
+            while len(self._cache) > self.cache_max:
+                self._cache.popitem(last=False)
+
+    def pontuar(self, pergunta: str, docs: Sequence[Document]) -> List[float]:
+        """Pontuação de cada documento para a pergunta (cache primeiro)"""
+        base = _chave_pergunta(pergunta)
+        chaves = [(base, id_chunk(doc)) for doc in docs]
+        pontuacoes = self._do_cache(chaves)
+        metricas.contar("rerank_cache_acerto", len(pontuacoes))
+
+        faltantes = [(chave, doc) for chave, doc in zip(chaves, docs) if chave not in pontuacoes]
+        novas = {}
+        for inicio in range(0, len(faltantes), self.tamanho_lote):
+            lote = faltantes[inicio:inicio + self.tamanho_lote]
+            with self._lock_modelo:
+                valores = self.pontuador([(pergunta, doc.page_content) for _, doc in lote])
+            novas.update({chave: float(valor) for (chave, _), valor in zip(lote, valores)})
+        metricas.contar("rerank_pontuados", len(novas))
+        self._guardar(novas)
+        pontuacoes.update(novas)
+        return [pontuacoes[chave] for chave in chaves]
+
+    def reranquear(self, pergunta: str, docs: Sequence[Document], k_original: int) -> Tuple[List[Document], Dict]:
+        """Os `top_n` documentos mais relevantes e as estatísticas do passo
+
+        Args:
+            k_original: Quantos chunks iriam ao prompt sem o reranqueamento
+                (base da economia de tokens)
+        """
+        inicio = time.perf_counter()
+        with metricas.etapa("rerank"):
+            pontuacoes = self.pontuar(pergunta, docs) if docs else []
+        ordem = sorted(range(len(docs)), key=lambda i: -pontuacoes[i])
+        mantidos = [docs[i] for i in ordem[:self.top_n]]
+
+        tokens_antes = sum(empacotamento.estimar_tokens(doc.page_content) for doc in docs[:k_original])
+        tokens_depois = sum(empacotamento.estimar_tokens(doc.page_content) for doc in mantidos)
+        metricas.contar("tokens_rerank_economizados", max(0, tokens_antes - tokens_depois))
+        estatisticas = {
+            "candidatos": len(docs),
+            "mantidos": len(mantidos),
+            "tokens_antes": tokens_antes,
+            "tokens_depois": tokens_depois,
+            "ms": (time.perf_counter() - inicio) * 1000,
+        }
+        return mantidos, estatisticas
+
+
+def carregar_cross_encoder(modelo: str = RERANK_MODELO, threads: int = RERANK_THREADS) -> Pontuador:
+    """`predict` de um CrossEncoder em CPU com `threads` threads"""
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    torch.set_num_threads(max(1, threads))
+    cross_encoder = CrossEncoder(modelo, device="cpu")
+
+    def pontuador(pares: List[Tuple[str, str]]) -> Sequence[float]:
+        return cross_encoder.predict(pares, batch_size=len(pares), show_progress_bar=False)
+
+    return pontuador
+
+
+def criar_reranqueador(ativo: bool = RERANK) -> Optional[Reranqueador]:
+    """Reranqueador configurado pelo ambiente, ou None se desligado"""
+    if not ativo:
+        return None
+    return Reranqueador(carregar_cross_encoder())
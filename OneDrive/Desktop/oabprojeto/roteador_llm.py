@@ -0,0 +1,347 @@
+"""Roteamento do LLM entre backends (Gemini e Ollama), com failover e hedge
+
+Sem roteamento, o processo usa um backend só, escolhido na partida: com a
+cota do Gemini esgotada, cada pergunta termina em "Erro ao processar a
+resposta" mesmo com um Ollama livre na máquina.
+
+O `RoteadorLLM` é um chat model que envolve os clientes de cada backend,
+na ordem de preferência de `LLM_ROTEAMENTO` (ex.: "gemini,ollama"):
+
+- failover: 429, timeout ou falha de conexão no backend da vez passam a
+  chamada para o próximo. Um backend que devolveu 429 ou não respondeu
+  fica em resfriamento (`ROTEADOR_RESFRIAMENTO`) e vai para o fim da fila;
+  um backend sem cota no limitador local é pulado em vez de esperar;
+- hedge (`ROTEADOR_HEDGE=1`): se o primeiro backend não respondeu até o
+  p95 das suas latências recentes, a mesma chamada vai também para o
+  próximo, e vale a resposta que chegar primeiro (no streaming, o primeiro
+  token). A outra é descartada.
+
+Cada tentativa roda em uma thread própria; no streaming, os tokens do
+vencedor seguem direto para quem chamou. Saúde, latências e limites ficam
+no `EstadoRoteamento`, compartilhado pelos roteadores do processo.
+"""
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import metricas
+from limites import LimitadorTaxa, eh_erro_limite, eh_erro_transitorio
+
+# Backends na ordem de preferência, separados por vírgula (vazio = sem roteamento)
+LLM_ROTEAMENTO = os.getenv("LLM_ROTEAMENTO", "")
+ROTEADOR_HEDGE = os.getenv("ROTEADOR_HEDGE", "0") == "1"
+ROTEADOR_HEDGE_PERCENTIL = float(os.getenv("ROTEADOR_HEDGE_PERCENTIL", "95"))
+# Até juntar amostras suficientes, o hedge espera um tempo fixo
+ROTEADOR_HEDGE_MIN_AMOSTRAS = int(os.getenv("ROTEADOR_HEDGE_MIN_AMOSTRAS", "20"))
+ROTEADOR_HEDGE_ATRASO_INICIAL = float(os.getenv("ROTEADOR_HEDGE_ATRASO_INICIAL", "5"))
+# Segundos até a primeira resposta (no streaming, o primeiro token) antes do failover
+ROTEADOR_TIMEOUT = float(os.getenv("ROTEADOR_TIMEOUT", "60"))
+# Segundos que um backend com 429 ou timeout fica no fim da fila
+ROTEADOR_RESFRIAMENTO = float(os.getenv("ROTEADOR_RESFRIAMENTO", "30"))
+
+_FIM = object()
+
+
+def vale_failover(erro: BaseException) -> bool:
+    """Erros em que outro backend pode responder: limite, timeout, conexão"""
+    return (
+        eh_erro_transitorio(erro)
+        or isinstance(erro, OSError)
+        or "CONNECT" in type(erro).__name__.upper()
+    )
+
+
+class EstadoRoteamento:
+    """Saúde, cota e latências de cada backend
+
+    Args:
+        backends: Nomes na ordem de preferência
+        req_por_minuto: Limite local por backend (ausente ou 0 = sem limite)
+        resfriamento: Segundos no fim da fila após 429 ou timeout
+        percentil_hedge: Percentil das latências recentes que dispara o hedge
+        atraso_inicial_hedge: Espera do hedge enquanto há menos de
+            `min_amostras_hedge` latências
+        janela: Latências guardadas por backend e tipo de chamada
+    """
+
+    def __init__(
+        self,
+        backends: List[str],
+        req_por_minuto: Optional[Dict[str, float]] = None,
+        resfriamento: float = ROTEADOR_RESFRIAMENTO,
+        percentil_hedge: float = ROTEADOR_HEDGE_PERCENTIL,
+        min_amostras_hedge: int = ROTEADOR_HEDGE_MIN_AMOSTRAS,
+        atraso_inicial_hedge: float = ROTEADOR_HEDGE_ATRASO_INICIAL,
+        janela: int = 200,
+    ):
+        self.backends = list(backends)
+        self.limitadores = {
+            nome: LimitadorTaxa(taxa) for nome, taxa in (req_por_minuto or {}).items() if taxa > 0
+        }
+        self.resfriamento = resfriamento
+        self.percentil_hedge = percentil_hedge
+        self.min_amostras_hedge = min_amostras_hedge
+        self.atraso_inicial_hedge = atraso_inicial_hedge
+        self.janela = janela
+        self.vitorias: Counter = Counter()
+        self.falhas: Counter = Counter()
+        self.failovers = 0
+        self.hedges = 0
+        self._resfriado_ate: Dict[str, float] = {}
+        self._latencias: Dict[Tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def ordem(self) -> List[str]:
+        """Backends na ordem de preferência, os em resfriamento por último"""
+        agora = time.monotonic()
+        with self._lock:
+            return sorted(self.backends, key=lambda nome: self._resfriado_ate.get(nome, 0.0) > agora)
+
+    def reservar(self, nome: str) -> bool:
+        """Consome uma chamada da cota local do backend, se houver"""
+        limitador = self.limitadores.get(nome)
+        return limitador is None or limitador.tentar_adquirir() <= 0
+
+    def aguardar_cota(self, nome: str) -> None:
+        limitador = self.limitadores.get(nome)
+        if limitador is not None:
+            limitador.adquirir()
+
+    def registrar_sucesso(self, nome: str, tipo: str, segundos: float) -> None:
+        with self._lock:
+            self.vitorias[nome] += 1
+            self._latencias.setdefault((nome, tipo), deque(maxlen=self.janela)).append(segundos)
+        metricas.REGISTRO.incrementar("roteador_respostas", ajuda="Respostas por backend do roteamento", backend=nome)
+        metricas.REGISTRO.observar(
+            "roteador_latencia_segundos", segundos,
+            ajuda="Tempo até a primeira resposta de cada backend", backend=nome, tipo=tipo,
+        )
+
+    def registrar_falha(self, nome: str, erro: BaseException) -> None:
+        """Conta a falha; 429 e timeout põem o backend em resfriamento"""
+        with self._lock:
+            self.falhas[nome] += 1
+            if eh_erro_limite(erro) or isinstance(erro, TimeoutError):
+                self._resfriado_ate[nome] = time.monotonic() + self.resfriamento
+        metricas.REGISTRO.incrementar("roteador_falhas", ajuda="Falhas por backend do roteamento", backend=nome)
+
+    def atraso_hedge(self, nome: str, tipo: str) -> float:
+        """Segundos de espera pelo backend antes do hedge (percentil das latências recentes)"""
+        with self._lock:
+            amostras = sorted(self._latencias.get((nome, tipo), ()))
+        if len(amostras) < self.min_amostras_hedge:
+            return self.atraso_inicial_hedge
+        return amostras[min(len(amostras) - 1, int(len(amostras) * self.percentil_hedge / 100))]
+
+    def contar(self, evento: str) -> None:
+        with self._lock:
+            setattr(self, evento, getattr(self, evento) + 1)
+        metricas.contar(f"roteador_{evento}")
+
+    def resumo(self) -> Dict:
+        """Vitórias, falhas e resfriamentos por backend (para a interface)"""
+        agora = time.monotonic()
+        with self._lock:
+            return {
+                "vitorias": dict(self.vitorias),
+                "falhas": dict(self.falhas),
+                "failovers": self.failovers,
+                "hedges": self.hedges,
+                "resfriados": [n for n in self.backends if self._resfriado_ate.get(n, 0.0) > agora],
+            }
+
+
+class RoteadorLLM(BaseChatModel):
+    """Chat model que distribui cada chamada entre os backends
+
+    Args:
+        modelos: Cliente de cada backend, na ordem de preferência
+        estado: Estado compartilhado (saúde, cota, latências)
+        hedge: Liga o hedge de chamadas lentas
+        timeout: Segundos até a primeira resposta antes do failover
+    """
+
+    modelos: Dict[str, Any]
+    estado: Any
+    hedge: bool = ROTEADOR_HEDGE
+    timeout: float = ROTEADOR_TIMEOUT
+
+    @property
+    def _llm_type(self) -> str:
+        return "roteador"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"backends": list(self.modelos), "hedge": self.hedge}
+
+    def _correr(self, tipo: str, gerar: Callable[[Any], Iterator[Any]]) -> Iterator[Tuple[str, Any]]:
+        """Itens (backend, item) do backend que responder primeiro
+
+        `gerar` recebe o cliente de um backend e produz os itens da chamada
+        (a mensagem inteira, ou os chunks do streaming).
+        """
+        estado = self.estado
+        pendentes = [nome for nome in estado.ordem() if nome in self.modelos]
+        fila: "queue.Queue[Tuple[str, Any, Optional[BaseException]]]" = queue.Queue()
+        paradas: Dict[str, threading.Event] = {}
+        inicios: Dict[str, float] = {}
+        ativos: List[str] = []
+        vencedor: Optional[str] = None
+        hedge_feito = not self.hedge
+        ultimo_erro: Optional[BaseException] = None
+
+        def iniciar(nome: str) -> None:
+            parar = paradas[nome] = threading.Event()
+            inicios[nome] = time.monotonic()
+            ativos.append(nome)
+
+            def produzir() -> None:
+                try:
+                    for item in gerar(self.modelos[nome]):
+                        if parar.is_set():
+                            return
+                        fila.put((nome, item, None))
+                    fila.put((nome, _FIM, None))
+                except Exception as e:
+                    fila.put((nome, _FIM, e))
+
+            threading.Thread(target=produzir, name=f"roteador-{nome}", daemon=True).start()
+
+        def proximo(obrigatorio: bool) -> bool:
+            """Inicia o próximo backend com cota; `obrigatorio` espera a cota do primeiro"""
+            sem_cota = []
+            while pendentes:
+                nome = pendentes.pop(0)
+                if estado.reservar(nome):
+                    pendentes[:0] = sem_cota
+                    iniciar(nome)
+                    return True
+                sem_cota.append(nome)
+            if not obrigatorio or not sem_cota:
+                pendentes[:0] = sem_cota
+                return False
+            estado.aguardar_cota(sem_cota[0])
+            pendentes[:0] = sem_cota[1:]
+            iniciar(sem_cota[0])
+            return True
+
+        proximo(obrigatorio=True)
+        try:
+            while True:
+                espera = None
+                if vencedor is None:
+                    agora = time.monotonic()
+                    prazos = [inicios[nome] + self.timeout for nome in ativos]
+                    if not hedge_feito and pendentes:
+                        prazo_hedge = inicios[ativos[0]] + estado.atraso_hedge(ativos[0], tipo)
+                        prazos.append(prazo_hedge)
+                    espera = max(0.0, min(prazos) - agora)
+                try:
+                    nome, item, erro = fila.get(timeout=espera)
+                except queue.Empty:
+                    agora = time.monotonic()
+                    for nome in [n for n in ativos if agora - inicios[n] >= self.timeout]:
+                        paradas[nome].set()
+                        ativos.remove(nome)
+                        ultimo_erro = TimeoutError(f"{nome}: sem resposta em {self.timeout:.0f}s")
+                        estado.registrar_falha(nome, ultimo_erro)
+                    if not ativos:
+                        if not proximo(obrigatorio=True):
+                            raise ultimo_erro
+                        estado.contar("failovers")
+                    elif not hedge_feito and pendentes and agora >= prazo_hedge:
+                        hedge_feito = True
+                        if proximo(obrigatorio=False):
+                            estado.contar("hedges")
+                    continue
+
+                if nome not in ativos:
+                    continue  # perdedor ou abandonado por timeout
+                if erro is not None:
+                    ativos.remove(nome)
+                    if nome == vencedor:
+                        raise erro  # falha no meio do streaming: não dá para trocar de backend
+                    estado.registrar_falha(nome, erro)
+                    ultimo_erro = erro
+                    if ativos:
+                        continue  # o hedge ainda pode responder
+                    if vale_failover(erro) and proximo(obrigatorio=True):
+                        estado.contar("failovers")
+                        continue
+                    raise erro
+
+                if vencedor is None:
+                    vencedor = nome
+                    estado.registrar_sucesso(nome, tipo, time.monotonic() - inicios[nome])
+                    for outro in ativos:
+                        if outro != nome:
+                            paradas[outro].set()
+                    ativos[:] = [nome]
+                if item is _FIM:
+                    return
+                yield nome, item
+        finally:
+            for parar in paradas.values():
+                parar.set()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        def gerar(modelo: Any) -> Iterator[Any]:
+            yield modelo.invoke(messages, stop=stop, **kwargs)
+
+        (nome, mensagem), = self._correr("invoke", gerar)
+        mensagem = mensagem.model_copy(
+            update={"response_metadata": {**mensagem.response_metadata, "backend": nome}}
+        )
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        def gerar(modelo: Any) -> Iterator[Any]:
+            yield from modelo.stream(messages, stop=stop, **kwargs)
+
+        for _, mensagem in self._correr("stream", gerar):
+            chunk = ChatGenerationChunk(message=mensagem)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def backends_roteamento(roteamento: str = LLM_ROTEAMENTO) -> List[str]:
+    """Nomes dos backends configurados em `LLM_ROTEAMENTO`, sem repetição"""
+    nomes = [nome.strip().lower() for nome in roteamento.split(",")]
+    return list(dict.fromkeys(nome for nome in nomes if nome))
+
+
+def rotear(
+    modelos: Dict[str, Tuple[Any, Any]],
+    estado: Optional[EstadoRoteamento] = None,
+    req_por_minuto: Optional[Dict[str, float]] = None,
+) -> Tuple[RoteadorLLM, RoteadorLLM]:
+    """(llm, llm_triagem) roteados, a partir do par de clientes de cada backend
+
+    Os dois roteadores dividem o mesmo estado: um 429 na triagem também
+    tira o backend da frente para a geração.
+    """
+    estado = estado or EstadoRoteamento(list(modelos), req_por_minuto)
+    return tuple(
+        RoteadorLLM(modelos={nome: par[i] for nome, par in modelos.items()}, estado=estado)
+        for i in range(2)
+    )
@@ -0,0 +1,240 @@
+"""Classificador local para a triagem, antes de chamar o LLM
+
+A maior parte das mensagens é obviamente de uma classe: frases curtas e
+vagas (PEDIR_INFO), pedidos explícitos de chamado (ABRIR_CHAMADO) ou
+perguntas que citam artigo/lei (AUTO_RESOLVER). Regras decidem esses
+casos; um Naive Bayes treinado com as decisões do LLM já registradas cobre
+o resto. Só o que fica abaixo do limiar de confiança vai para o LLM.
+
+O modelo só entra quando o log tem pelo menos dois rótulos com exemplos
+suficientes (com um rótulo só ele diria 1.0 para qualquer mensagem), e a
+confiança dele é calibrada pela fração de palavras conhecidas e limitada a
+`TRIAGEM_CONFIANCA_MAX_MODELO`, abaixo do limiar: sozinho ele não dispensa
+o LLM, só confirma ou contesta a regra. O pedido explícito de chamado
+("abrir chamado") nunca é contestado; as palavras de exceção sozinhas não
+abrem chamado, e um dispositivo citado vale mais que uma frase vaga.
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TRIAGEM_LIMIAR_CONFIANCA = float(os.getenv("TRIAGEM_LIMIAR_CONFIANCA", "0.85"))
+# Exemplos mínimos antes de confiar no modelo treinado
+TRIAGEM_MIN_EXEMPLOS = int(os.getenv("TRIAGEM_MIN_EXEMPLOS", "30"))
+# Exemplos mínimos de um rótulo para ele entrar no modelo (são necessários dois rótulos)
+TRIAGEM_MIN_EXEMPLOS_ROTULO = int(os.getenv("TRIAGEM_MIN_EXEMPLOS_ROTULO", "10"))
+# Teto da confiança do modelo sozinho; abaixo do limiar, ele não decide sem a regra
+TRIAGEM_CONFIANCA_MAX_MODELO = float(os.getenv("TRIAGEM_CONFIANCA_MAX_MODELO", "0.8"))
+# Confiança a partir da qual o modelo, discordando da regra, manda a mensagem ao LLM
+CONFIANCA_CONTESTACAO = 0.5
+
+ARQUIVO_LOG_TRIAGEM = Path(
+    os.getenv("TRIAGEM_LOG", str(Path(__file__).parent / ".cache" / "triagem_log.jsonl"))
+)
+
+TERMOS_JURIDICOS = {
+    "art", "artigo", "artigos", "lei", "leis", "organica", "paragrafo", "inciso",
+    "alinea", "capitulo", "titulo", "secao", "norma", "normas", "emenda", "constituicao",
+}
+PEDIDOS_CHAMADO = ("abrir chamado", "abra um chamado", "abrir um chamado", "abrir ticket", "abra um ticket")
+FRASES_VAGAS = (
+    "preciso de ajuda", "tenho uma duvida", "me ajuda", "me ajude", "quero saber sobre leis",
+    "me mostre algo", "me retorne uma lei", "me retorne apenas uma lei", "uma pergunta",
+)
+PALAVRAS_URGENCIA = ("urgente", "urgencia", "imediato", "imediatamente", "hoje", "prazo")
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos"""
+    sem_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return sem_acentos.lower()
+
+
+def tokenizar(texto: str) -> List[str]:
+    return re.findall(r"[a-z0-9§]+", normalizar(texto))
+
+
+class ClassificadorTriagem:
+    """Regras + Naive Bayes multinomial sobre (decisão, urgência)
+
+    Args:
+        palavras_chamado: Palavras que indicam pedido de exceção/chamado
+        limiar: Confiança mínima para decidir sem o LLM
+        arquivo_log: JSONL com as decisões do LLM usadas no treino
+    """
+
+    def __init__(
+        self,
+        palavras_chamado: Iterable[str] = (),
+        limiar: float = TRIAGEM_LIMIAR_CONFIANCA,
+        arquivo_log: Path = ARQUIVO_LOG_TRIAGEM,
+    ):
+        self.palavras_chamado = tuple(normalizar(p) for p in palavras_chamado)
+        self.limiar = limiar
+        self.arquivo_log = arquivo_log
+        self.decisoes_rapidas = 0
+        self.decisoes_llm = 0
+        self._contagens: Dict[str, Counter] = defaultdict(Counter)
+        self._total_tokens: Counter = Counter()
+        self._exemplos: Counter = Counter()
+        self._vocabulario = set()
+        self._lock = threading.Lock()
+        self._carregar_log()
+
+    # ------------------------------------------------------------------ treino
+
+    def _carregar_log(self) -> None:
+        try:
+            with open(self.arquivo_log, encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        registro = json.loads(linha)
+                        self._aprender(registro["mensagem"], registro["decisao"], registro["urgencia"])
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+        except OSError:
+            pass
+
+    def _aprender(self, mensagem: str, decisao: str, urgencia: str) -> None:
+        rotulo = f"{decisao}|{urgencia}"
+        tokens = tokenizar(mensagem)
+        self._exemplos[rotulo] += 1
+        self._contagens[rotulo].update(tokens)
+        self._total_tokens[rotulo] += len(tokens)
+        self._vocabulario.update(tokens)
+
+    def registrar(self, mensagem: str, resultado: Dict) -> None:
+        """Guarda uma decisão do LLM no log e atualiza o modelo"""
+        with self._lock:
+            self._aprender(mensagem, resultado["decisao"], resultado["urgencia"])
+        try:
+            self.arquivo_log.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.arquivo_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "mensagem": mensagem,
+                    "decisao": resultado["decisao"],
+                    "urgencia": resultado["urgencia"],
+                    "campos_faltantes": resultado.get("campos_faltantes", []),
+                }, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    # --------------------------------------------------------------- predição
+
+    def _regras(self, mensagem: str) -> Optional[Tuple[Dict, float]]:
+        texto = normalizar(mensagem)
+        tokens = tokenizar(mensagem)
+        urgente = any(p in texto for p in PALAVRAS_URGENCIA)
+
+        # Só o pedido explícito abre chamado sem o LLM; as palavras de exceção
+        # ("aprovação", "liberação"...) também aparecem em perguntas válidas
+        if any(p in texto for p in PEDIDOS_CHAMADO):
+            return {
+                "decisao": "ABRIR_CHAMADO",
+                "urgencia": "ALTA" if urgente else "MEDIA",
+                "campos_faltantes": [],
+            }, 0.95
+
+        juridico = any(t in TERMOS_JURIDICOS for t in tokens) or "§" in mensagem
+        auto_resolver = {"decisao": "AUTO_RESOLVER", "urgencia": "BAIXA", "campos_faltantes": []}, 0.9
+        # "Art. 45" é curto, mas aponta um dispositivo específico; vale mesmo
+        # depois de "tenho uma dúvida" ou "preciso de ajuda"
+        if "§" in mensagem or (juridico and any(t.isdigit() for t in tokens)):
+            return auto_resolver
+
+        if any(f in texto for f in FRASES_VAGAS):
+            # "quero saber sobre leis" cita lei mas não diz qual: fica com o LLM
+            if juridico:
+                return None
+            return {
+                "decisao": "PEDIR_INFO",
+                "urgencia": "BAIXA",
+                "campos_faltantes": ["tema e contexto específico"],
+            }, 0.9
+
+        if juridico and len(tokens) >= 4:
+            return auto_resolver
+        # Pedido de exceção sem dispositivo citado: o LLM decide se é chamado
+        if any(p in texto for p in self.palavras_chamado):
+            return None
+        if not juridico and len(tokens) <= 3:
+            return {
+                "decisao": "PEDIR_INFO",
+                "urgencia": "BAIXA",
+                "campos_faltantes": ["tema e contexto específico"],
+            }, 0.9
+        return None
+
+    def _modelo(self, mensagem: str) -> Optional[Tuple[Dict, float]]:
+        with self._lock:
+            rotulos = {r: n for r, n in self._exemplos.items() if n >= TRIAGEM_MIN_EXEMPLOS_ROTULO}
+            total_exemplos = sum(rotulos.values())
+            if len(rotulos) < 2 or total_exemplos < TRIAGEM_MIN_EXEMPLOS:
+                return None
+            tokens = tokenizar(mensagem)
+            if not tokens:
+                return None
+            vocabulario = set().union(*(self._contagens[r] for r in rotulos))
+            v = len(vocabulario) + 1
+            log_probs = {}
+            for rotulo, n in rotulos.items():
+                lp = math.log(n / total_exemplos)
+                denominador = self._total_tokens[rotulo] + v
+                for t in tokens:
+                    lp += math.log((self._contagens[rotulo][t] + 1) / denominador)
+                log_probs[rotulo] = lp
+
+        maximo = max(log_probs.values())
+        soma = sum(math.exp(lp - maximo) for lp in log_probs.values())
+        rotulo, lp = max(log_probs.items(), key=lambda item: item[1])
+        # Palavras nunca vistas não são evidência: "blá blá blá" não vale 1.0
+        cobertura = sum(t in vocabulario for t in tokens) / len(tokens)
+        confianca = min(math.exp(lp - maximo) / soma * cobertura, TRIAGEM_CONFIANCA_MAX_MODELO)
+        decisao, urgencia = rotulo.split("|")
+        campos = ["tema e contexto específico"] if decisao == "PEDIR_INFO" else []
+        return {"decisao": decisao, "urgencia": urgencia, "campos_faltantes": campos}, confianca
+
+    def classificar(self, mensagem: str) -> Tuple[Optional[Dict], float]:
+        """Decide localmente quando a confiança passa do limiar
+
+        O pedido explícito de chamado decide sozinho. As outras regras
+        valem se o modelo não as contestar com confiança; o modelo sozinho
+        só decide se o teto dele for configurado acima do limiar.
+
+        Returns:
+            Tupla (resultado ou None, confiança). None significa que a
+            mensagem deve ir para o LLM.
+        """
+        regra = self._regras(mensagem)
+        if regra is not None and regra[0]["decisao"] == "ABRIR_CHAMADO":
+            candidato = regra
+        else:
+            modelo = self._modelo(mensagem)
+            if regra is None:
+                candidato = modelo
+            elif (
+                modelo is not None
+                and modelo[0]["decisao"] != regra[0]["decisao"]
+                and modelo[1] >= CONFIANCA_CONTESTACAO
+            ):
+                return None, 0.0
+            else:
+                candidato = regra
+        if candidato is None:
+            return None, 0.0
+        resultado, confianca = candidato
+        if confianca >= self.limiar:
+            return resultado, confianca
+        return None, confianca
+
+    def resumo(self) -> str:
+        """Contadores de decisões locais e via LLM"""
+        total = self.decisoes_rapidas + self.decisoes_llm
+        taxa = (100 * self.decisoes_rapidas / total) if total else 0.0
+        return f"Triagem: {self.decisoes_rapidas} locais, {self.decisoes_llm} via LLM ({taxa:.0f}% sem LLM)"